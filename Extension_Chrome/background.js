@@ -217,16 +217,21 @@ async function executeCommand(command) {
         "get_workflow": "workflow"
       }[command.action];
 
-      if (responseType) {
+      // Les commandes avec un id attendent toujours une réponse (renvoyée à l'outil MCP appelant)
+      if (responseType || command.id) {
         // On envoie directement les données, sans le wrapper {ok: true}
-        ws.send(JSON.stringify({ type: responseType, data: data }));
-        pushLog({ level: "info", msg: `Réponse '${responseType}' envoyée au serveur` });
+        const reply = { type: responseType || "result", data: data };
+        if (command.id) reply.id = command.id;
+        ws.send(JSON.stringify(reply));
+        pushLog({ level: "info", msg: `Réponse '${reply.type}' envoyée au serveur` });
       }
     }
   } catch (err) {
     pushLog({ level: "error", msg: `Erreur exécution commande: ${String(err)}` });
     if (ws && ws.readyState === WebSocket.OPEN) {
-      ws.send(JSON.stringify({ type: "error", message: `Erreur côté extension: ${String(err)}` }));
+      const reply = { type: "error", message: `Erreur côté extension: ${String(err)}` };
+      if (command.id) reply.id = command.id;
+      ws.send(JSON.stringify(reply));
     }
   }
 }
@@ -275,7 +280,7 @@ function injectedLogic(command) {
     case "click": {
       const el = document.querySelector(command.selector);
       if (el) el.click();
-      return { ok: true };
+      return { ok: true, found: !!el };
     }
     case "fill": {
       const el = document.querySelector(command.selector);
@@ -284,7 +289,7 @@ function injectedLogic(command) {
         el.dispatchEvent(new Event("input", { bubbles: true }));
         el.dispatchEvent(new Event("change", { bubbles: true }));
       }
-      return { ok: true };
+      return { ok: true, found: !!el };
     }
     case "dump_dom": {
       // ... la fonction runInPageDump est déplacée ici ...
@@ -322,6 +327,9 @@ function injectedLogic(command) {
         }
       });
     }
+    case "execute_js":
+      // Pas d'exécution de code arbitraire dans la page : refus explicite plutôt qu'"Action inconnue"
+      return { error: "unsupported", message: "execute_js n'est pas pris en charge par l'extension" };
     default:
       return { error: `Action inconnue: ${command.action}` };
   }
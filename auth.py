@@ -0,0 +1,107 @@
+"""
+Authentification par clé API, en middleware ASGI pur.
+Les réponses (y compris SSE / streaming MCP) traversent la couche sans être
+bufferisées ; le nom de la clé reconnue est placé dans scope["state"] pour les
+quotas et métriques par clé. La limite de débit s'applique par clé, jamais par
+adresse IP : derrière un tunnel ou un reverse proxy (cloudflared), tous les clients
+arrivent avec l'adresse du proxy (127.0.0.1) et partageraient un seul quota.
+"""
+
+import hmac
+import json
+from typing import Dict, Iterable, Optional
+
+API_KEY_HEADER = b"x-api-key"
+EXEMPT_PATHS = ("/health", "/ws")
+
+
+def parse_api_keys(spec: str = "", legacy_key: Optional[str] = None) -> Dict[str, str]:
+    """
+    Clés nommées depuis MCP_API_KEYS ("nom:clé,nom2:clé2") ; MCP_API_KEY est ajoutée
+    sous le nom "default".
+
+    Raises:
+        ValueError: entrée sans nom ou sans clé, ou nom en double
+    """
+    keys: Dict[str, str] = {}
+    for position, item in enumerate((spec or "").split(","), start=1):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, key = item.partition(":")
+        name, key = name.strip(), key.strip()
+        if not sep or not name or not key:
+            raise ValueError(f"MCP_API_KEYS: entrée n°{position} invalide (attendu nom:clé)")
+        if name in keys:
+            raise ValueError(f"MCP_API_KEYS: nom de clé en double '{name}'")
+        keys[name] = key
+    if legacy_key:
+        keys.setdefault("default", legacy_key)
+    return keys
+
+
+async def _send_json(send, status: int, payload: dict, headers: Iterable = ()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class APIKeyMiddleware:
+    """
+    Args:
+        app: application ASGI protégée
+        keys: nom -> clé (vide = authentification désactivée)
+        rate_limiter: limiteur optionnel (is_allowed / retry_after), appliqué par nom de clé
+                      (sans effet quand aucune clé n'est configurée)
+        exempt_paths: chemins servis sans clé
+    """
+
+    def __init__(self, app, keys: Optional[Dict[str, str]] = None, rate_limiter=None,
+                 exempt_paths: Iterable[str] = EXEMPT_PATHS):
+        self.app = app
+        self._keys = [(name, key.encode("utf-8")) for name, key in (keys or {}).items()]
+        self.rate_limiter = rate_limiter
+        self.exempt_paths = frozenset(exempt_paths)
+
+    def _identify(self, presented: bytes) -> Optional[str]:
+        # Comparaison à temps constant contre toutes les clés, sans sortie anticipée
+        match = None
+        for name, key in self._keys:
+            if hmac.compare_digest(presented, key):
+                match = name
+        return match
+
+    async def __call__(self, scope, receive, send):
+        # WebSocket (jeton propre), lifespan, routes publiques et préflight CORS : pas de clé
+        if (scope["type"] != "http" or scope["path"] in self.exempt_paths
+                or scope["method"] == "OPTIONS"):
+            return await self.app(scope, receive, send)
+
+        key_name = None
+        if self._keys:
+            presented = b""
+            for header, value in scope["headers"]:
+                if header == API_KEY_HEADER:
+                    presented = value
+                    break
+            key_name = self._identify(presented) if presented else None
+            if key_name is None:
+                return await _send_json(send, 401, {"status": "error", "message": "Invalid or missing API Key"})
+            scope.setdefault("state", {})["api_key_name"] = key_name
+
+        if self.rate_limiter is not None and key_name is not None:
+            rate_key = f"key:{key_name}"
+            if not self.rate_limiter.is_allowed(rate_key):
+                retry = self.rate_limiter.retry_after(rate_key)
+                return await _send_json(
+                    send, 429, {"status": "error", "message": "Rate limit exceeded"},
+                    headers=[(b"retry-after", str(max(1, int(retry + 0.999))).encode("ascii"))],
+                )
+
+        await self.app(scope, receive, send)
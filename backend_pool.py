@@ -0,0 +1,384 @@
+"""
+Répartition des prompts sur plusieurs instances ComfyUI.
+BackendPool expose la même surface que AsyncComfyUIClient : chaque soumission part
+vers le backend sain le moins chargé (profondeur de /queue mise en cache + jobs
+acceptés depuis + choix en cours de soumission, latence récente en départage), et
+chaque prompt_id reste attaché à son backend pour get_history / interrupt.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from comfyui_client import (AsyncComfyUIClient, GENERATION_PARAMETERS, DEFAULT_POOL_SIZE,
+                            DEFAULT_TIMEOUT)
+from result_cache import ResultCache, workflow_key
+
+logger = logging.getLogger(__name__)
+
+LOAD_TTL = 1.0            # durée de validité de la profondeur de queue mesurée (s)
+PROBE_TIMEOUT = 3.0       # délai max de la sonde /queue
+LATENCY_ALPHA = 0.3       # poids de la dernière mesure dans la latence moyenne (EWMA)
+MAX_PINNED = 10000        # prompt_id -> backend mémorisés
+
+# Réservation de l'appel en cours (consommée par on_submit quand le backend accepte le prompt)
+_RESERVATION: ContextVar[Optional["_Reservation"]] = ContextVar("backend_reservation", default=None)
+
+
+class _Backend:
+    __slots__ = ("url", "client", "healthy", "depth", "assigned", "reserved", "latency", "failures", "probed_at")
+
+    def __init__(self, client: AsyncComfyUIClient):
+        self.url = client.base_url
+        self.client = client
+        self.healthy = True
+        self.depth = 0          # running + pending lus sur /queue
+        self.assigned = 0       # prompts acceptés depuis la dernière lecture de /queue
+        self.reserved = 0       # backend choisi, soumission pas encore acceptée
+        self.latency = None     # EWMA de la latence de /queue (s)
+        self.failures = 0
+        self.probed_at = 0.0
+
+    def load(self) -> int:
+        return self.depth + self.assigned + self.reserved
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "queue_depth": self.depth,
+            "assigned": self.assigned,
+            "reserved": self.reserved,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "failures": self.failures,
+        }
+
+
+class _Reservation:
+    __slots__ = ("backend", "open")
+
+    def __init__(self, backend: _Backend):
+        self.backend = backend
+        self.open = True
+
+
+class BackendPool:
+    """
+    Args:
+        base_urls: URLs des instances ComfyUI
+        workflows_dir, pool_size, timeout: voir AsyncComfyUIClient (appliqués à chaque backend)
+    """
+
+    def __init__(self, base_urls: List[str], workflows_dir="workflows",
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        if not base_urls:
+            raise ValueError("BackendPool: aucune URL ComfyUI")
+        self.backends = [_Backend(AsyncComfyUIClient(url, workflows_dir, pool_size, timeout)) for url in base_urls]
+        self.base_url = self.backends[0].url
+        self.workflows_dir = self.backends[0].client.workflows_dir
+        # Caches communs : workflows compilés et résultats
+        self.workflow_cache = self.backends[0].client.workflow_cache
+        self._result_cache = self.backends[0].client.result_cache
+        for backend in self.backends:
+            backend.client.workflow_cache = self.workflow_cache
+            backend.client.result_cache = self._result_cache
+            backend.client.on_submit = lambda prompt_id, b=backend: self._on_submit(prompt_id, b)
+        self._pinned: "OrderedDict[str, _Backend]" = OrderedDict()
+        self._probe_lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # Réglages propagés à tous les backends
+    # ------------------------------------------------------------------
+    def _set_all(self, name: str, value):
+        for backend in self.backends:
+            setattr(backend.client, name, value)
+
+    @property
+    def result_cache(self) -> ResultCache:
+        return self._result_cache
+
+    @result_cache.setter
+    def result_cache(self, cache: ResultCache):
+        self._result_cache = cache
+        self._set_all("result_cache", cache)
+
+    node_catalog_ttl = property(lambda self: self.backends[0].client.node_catalog_ttl,
+                                lambda self, v: self._set_all("node_catalog_ttl", v))
+    models_refresh_interval = property(lambda self: self.backends[0].client.models_refresh_interval,
+                                       lambda self, v: self._set_all("models_refresh_interval", v))
+    result_record_timeout = property(lambda self: self.backends[0].client.result_record_timeout,
+                                     lambda self, v: self._set_all("result_record_timeout", v))
+    generation_timeout = property(lambda self: self.backends[0].client.generation_timeout,
+                                  lambda self, v: self._set_all("generation_timeout", v))
+    read_ttl = property(lambda self: self.backends[0].client.read_ttl,
+                        lambda self, v: self._set_all("read_ttl", v))
+    read_retries = property(lambda self: self.backends[0].client.read_retries,
+                            lambda self, v: self._set_all("read_retries", v))
+    on_request = property(lambda self: self.backends[0].client.on_request,
+                          lambda self, v: self._set_all("on_request", v))
+    on_timing = property(lambda self: self.backends[0].client.on_timing,
+                         lambda self, v: self._set_all("on_timing", v))
+
+    def configure_circuit(self, failure_threshold: int, reset_timeout: float):
+        for backend in self.backends:
+            backend.client.configure_circuit(failure_threshold, reset_timeout)
+
+    def circuit_stats(self) -> dict:
+        return {url: stats for b in self.backends for url, stats in b.client.circuit_stats().items()}
+
+    # ------------------------------------------------------------------
+    # Choix du backend
+    # ------------------------------------------------------------------
+    def _pin(self, prompt_id: str, backend: _Backend):
+        self._pinned[prompt_id] = backend
+        self._pinned.move_to_end(prompt_id)
+        while len(self._pinned) > MAX_PINNED:
+            self._pinned.popitem(last=False)
+
+    def _on_submit(self, prompt_id: str, backend: _Backend):
+        """Prompt accepté par backend : épinglé, compté dans sa charge, réservation consommée"""
+        self._pin(prompt_id, backend)
+        backend.assigned += 1
+        reservation = _RESERVATION.get()
+        if reservation is not None and reservation.open and reservation.backend is backend:
+            reservation.open = False
+            backend.reserved -= 1
+
+    async def _probe(self, backend: _Backend):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            response = await backend.client._request("GET", "/queue", timeout=PROBE_TIMEOUT, retries=0)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            if backend.healthy:
+                logger.warning(f"Backend ComfyUI {backend.url} indisponible: {e}")
+            backend.healthy = False
+            backend.failures += 1
+        else:
+            elapsed = loop.time() - started
+            backend.latency = elapsed if backend.latency is None else (
+                LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * backend.latency)
+            backend.depth = len(data.get("queue_running") or []) + len(data.get("queue_pending") or [])
+            backend.assigned = 0
+            if not backend.healthy:
+                logger.info(f"Backend ComfyUI {backend.url} de nouveau disponible")
+            backend.healthy = True
+        backend.probed_at = loop.time()
+
+    async def _refresh_loads(self, force: bool = False):
+        async with self._probe_lock:
+            now = asyncio.get_running_loop().time()
+            stale = [b for b in self.backends if force or now - b.probed_at > LOAD_TTL]
+            if stale:
+                await asyncio.gather(*(self._probe(b) for b in stale))
+
+    async def _select(self, key: Optional[str] = None) -> _Backend:
+        """Backend de la prochaine soumission"""
+        # Graphe identique en cours ou déjà rendu : le backend qui l'exécute / détient les images
+        if key:
+            for prompt_id in (self._result_cache.in_flight(key), self._result_cache.peek(key)):
+                if prompt_id is not None and prompt_id in self._pinned:
+                    return self._pinned[prompt_id]
+        await self._refresh_loads()
+        candidates = [b for b in self.backends if b.healthy] or self.backends
+        return min(candidates, key=lambda b: (b.load(), b.latency if b.latency is not None else float("inf")))
+
+    @asynccontextmanager
+    async def _reserve(self, key: Optional[str] = None):
+        """
+        Choisit le backend et le réserve le temps de la soumission (étale les rafales).
+        La réservation devient une charge (assigned) quand le backend accepte le prompt ;
+        résultat en cache ou échec : elle est simplement libérée.
+        """
+        backend = await self._select(key)
+        reservation = _Reservation(backend)
+        backend.reserved += 1
+        token = _RESERVATION.set(reservation)
+        try:
+            yield backend
+        finally:
+            _RESERVATION.reset(token)
+            if reservation.open:
+                reservation.open = False
+                backend.reserved -= 1
+
+    def _primary(self) -> AsyncComfyUIClient:
+        """Backend de référence pour les lectures communes (nodes, modèles, workflows)"""
+        for backend in self.backends:
+            if backend.healthy:
+                return backend.client
+        return self.backends[0].client
+
+    @staticmethod
+    def _in_queue(queue: dict, prompt_id: str) -> bool:
+        items = (queue.get("queue_running") or []) + (queue.get("queue_pending") or [])
+        return any(len(item) > 1 and item[1] == prompt_id for item in items)
+
+    async def _locate(self, prompt_id: str):
+        """
+        (backend, historique) du prompt ; historique None si le backend était déjà connu,
+        {} si le prompt est trouvé en file (pas encore d'historique), (None, {}) s'il est inconnu.
+        """
+        backend = self._pinned.get(prompt_id)
+        if backend is not None:
+            return backend, None
+        # prompt_id inconnu (soumis avant un redémarrage, ou hors MCP) : historique et file de chaque backend
+        histories, queues = await asyncio.gather(
+            asyncio.gather(*(b.client.get_history(prompt_id) for b in self.backends)),
+            asyncio.gather(*(b.client.get_queue_info() for b in self.backends)),
+        )
+        for backend, history in zip(self.backends, histories):
+            if isinstance(history, dict) and prompt_id in history:
+                self._pin(prompt_id, backend)
+                return backend, history
+        for backend, queue in zip(self.backends, queues):
+            if self._in_queue(queue, prompt_id):
+                self._pin(prompt_id, backend)
+                return backend, {}
+        return None, {}
+
+    async def _backend_of(self, prompt_id: str) -> Optional[_Backend]:
+        backend, _history = await self._locate(prompt_id)
+        return backend
+
+    # ------------------------------------------------------------------
+    # Exécution
+    # ------------------------------------------------------------------
+    async def queue_prompt(self, workflow: dict, use_cache: bool = True) -> dict:
+        async with self._reserve(workflow_key(workflow) if use_cache else None) as backend:
+            result = await backend.client.queue_prompt(workflow, use_cache=use_cache)
+        if isinstance(result, dict) and result.get("prompt_id") and not result.get("cached"):
+            result["backend"] = backend.url
+        return result
+
+    async def submit_generation(self, prompt, width=512, height=512, workflow_id="basic_api_test",
+                                model=None, **params) -> str:
+        async with self._reserve() as backend:
+            return await backend.client.submit_generation(prompt, width, height, workflow_id, model, **params)
+
+    async def generate_image(self, prompt, width=512, height=512, workflow_id="basic_api_test", model=None,
+                             use_cache=True, timeout=None, **params):
+        workflow = await self._primary()._build_generation(prompt, width, height, workflow_id, model, params)
+        async with self._reserve(workflow_key(workflow) if use_cache else None) as backend:
+            prompt_id, entry, _cached = await backend.client._run_cached(
+                workflow, timeout or self.generation_timeout, use_cache)
+        url = backend.client._image_url_from_history({prompt_id: entry}, prompt_id)
+        if not url:
+            raise ValueError(f"Prompt {prompt_id} terminé sans image en sortie")
+        return url
+
+    async def generate_batch(self, workflow_id: str, jobs: list, timeout: Optional[float] = None,
+                             use_cache: bool = True):
+        """Comme AsyncComfyUIClient.generate_batch, les jobs étant répartis entre les backends"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + (timeout or self.generation_timeout)
+        builder = self._primary()
+
+        async def _run(index, params):
+            prompt_id = None
+            try:
+                extra = {k: v for k, v in dict(params or {}).items() if k in GENERATION_PARAMETERS}
+                workflow = await builder._build_generation(
+                    extra.pop("prompt", ""), extra.pop("width", 512), extra.pop("height", 512),
+                    workflow_id, extra.pop("model", None), extra,
+                )
+                async with self._reserve(workflow_key(workflow) if use_cache else None) as backend:
+                    prompt_id, entry, cached = await backend.client._run_cached(
+                        workflow, max(deadline - loop.time(), 0.001), use_cache)
+                urls = backend.client._image_urls(entry)
+                return {"index": index, "prompt_id": prompt_id, "status": "success",
+                        "url": urls[0] if urls else None, "images": urls, "cached": cached,
+                        "backend": backend.url}
+            except Exception as e:
+                return {"index": index, "prompt_id": prompt_id, "status": "error", "error": str(e)}
+
+        for done in asyncio.as_completed([_run(i, p) for i, p in enumerate(jobs)]):
+            result = await done
+            result["elapsed"] = round(loop.time() - started, 3)
+            yield result
+
+    async def wait_for_completion(self, prompt_id: str, timeout: Optional[float] = None) -> dict:
+        backend = await self._backend_of(prompt_id)
+        if backend is None:
+            raise ValueError(f"Prompt {prompt_id} inconnu des backends ComfyUI")
+        return await backend.client.wait_for_completion(prompt_id, timeout)
+
+    async def get_history(self, prompt_id: str) -> dict:
+        backend, history = await self._locate(prompt_id)
+        if history is not None:
+            return history
+        return await backend.client.get_history(prompt_id)
+
+    async def interrupt(self, prompt_id: str = "") -> dict:
+        """Interrompt le backend qui exécute prompt_id, ou tous les backends sans prompt_id"""
+        if prompt_id:
+            backend = await self._backend_of(prompt_id)
+            if backend is None:
+                return {"status": "error", "message": f"Prompt {prompt_id} inconnu des backends ComfyUI"}
+            result = await backend.client.interrupt(prompt_id)
+            return {**result, "backend": backend.url}
+        results = await asyncio.gather(*(b.client.interrupt() for b in self.backends))
+        ok = all(r.get("status") == "success" for r in results)
+        return {"status": "success" if ok else "error", "message": "Interrupt request sent",
+                "backends": {b.url: r for b, r in zip(self.backends, results)}}
+
+    async def get_queue_info(self) -> dict:
+        """Queues de tous les backends réunies (détail par backend dans 'backends')"""
+        infos = await asyncio.gather(*(b.client.get_queue_info() for b in self.backends))
+        merged = {"queue_running": [], "queue_pending": [], "backends": {}}
+        for backend, info in zip(self.backends, infos):
+            running = info.get("queue_running") or []
+            pending = info.get("queue_pending") or []
+            merged["queue_running"].extend(running)
+            merged["queue_pending"].extend(pending)
+            merged["backends"][backend.url] = {"running": len(running), "pending": len(pending)}
+        return merged
+
+    # ------------------------------------------------------------------
+    # Lectures communes (backend de référence)
+    # ------------------------------------------------------------------
+    def list_workflows(self):
+        return self._primary().list_workflows()
+
+    def load_workflow(self, workflow_id: str):
+        return self._primary().load_workflow(workflow_id)
+
+    def get_workflow_bindings(self, workflow_id: str):
+        return self._primary().get_workflow_bindings(workflow_id)
+
+    async def get_object_info(self, node_class: str = None) -> dict:
+        return await self._primary().get_object_info(node_class)
+
+    async def get_node_catalog(self, force_refresh: bool = False):
+        return await self._primary().get_node_catalog(force_refresh)
+
+    def invalidate_node_catalog(self):
+        for backend in self.backends:
+            backend.client.invalidate_node_catalog()
+
+    async def get_available_models(self) -> list:
+        return await self._primary().get_available_models()
+
+    async def list_models(self, model_type: str = "checkpoints") -> dict:
+        return await self._primary().list_models(model_type)
+
+    async def get_system_stats(self) -> dict:
+        """Stats du backend de référence, plus celles de chaque backend"""
+        stats = await asyncio.gather(*(b.client.get_system_stats() for b in self.backends))
+        return {**stats[0], "backends": {b.url: s for b, s in zip(self.backends, stats)}}
+
+    def transport_stats(self) -> dict:
+        return {
+            "backends": [{**b.stats(), **b.client.transport_stats()} for b in self.backends],
+            "pinned_prompts": len(self._pinned),
+        }
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
@@ -0,0 +1,147 @@
+"""
+Benchmark : authentification par clé API, ancien middleware (BaseHTTPMiddleware)
+contre le middleware ASGI pur de auth.py.
+
+Mesure, sans serveur ni réseau (appel direct de l'application ASGI) :
+  - requêtes/s sur une réponse JSON courte ;
+  - délai du premier octet d'une réponse en streaming (SSE) dont les morceaux
+    sont espacés de --chunk-delay secondes.
+
+Usage :
+    python benchmarks/bench_auth_middleware.py [--requests 5000] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi import HTTPException, Request
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from auth import APIKeyMiddleware
+
+API_KEY = "bench-key"
+
+
+class LegacyAPIKeyMiddleware(BaseHTTPMiddleware):
+    """Copie du middleware d'origine de server.py (référence)"""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path in ["/health", "/ws"] or request.headers.get("upgrade") == "websocket":
+            return await call_next(request)
+        api_key = request.headers.get("X-API-Key") or request.headers.get("x-api-key")
+        if api_key != API_KEY:
+            raise HTTPException(status_code=401, detail="Invalid or missing API Key")
+        return await call_next(request)
+
+
+def build_app(kind: str, chunk_delay: float) -> Starlette:
+    async def small(request):
+        return JSONResponse({"status": "success"})
+
+    async def stream(request):
+        async def events():
+            for i in range(5):
+                yield f"data: {i}\n\n".encode()
+                await asyncio.sleep(chunk_delay)
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    routes = [Route("/small", small), Route("/stream", stream)]
+    if kind == "legacy":
+        middleware = [Middleware(LegacyAPIKeyMiddleware)]
+    elif kind == "asgi":
+        keys = {"default": API_KEY, "other": "x" * 43, "third": "y" * 43}
+        middleware = [Middleware(APIKeyMiddleware, keys=keys)]
+    else:
+        middleware = []
+    return Starlette(routes=routes, middleware=middleware)
+
+
+async def call(app, path: str):
+    """Un appel ASGI ; renvoie (statut, délai du premier morceau de corps, durée totale)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 5000),
+        "server": ("127.0.0.1", 8000), "headers": [(b"host", b"bench"), (b"x-api-key", API_KEY.encode())],
+    }
+    start = time.perf_counter()
+    first = None
+    status = None
+    received = False
+
+    async def receive():
+        # Corps vide, puis attente comme un vrai serveur (pas de déconnexion)
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal first, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and first is None and message.get("body"):
+            first = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    return status, first, time.perf_counter() - start
+
+
+async def bench(kind: str, requests: int, streams: int, chunk_delay: float) -> dict:
+    app = build_app(kind, chunk_delay)
+    for _ in range(50):
+        await call(app, "/small")
+
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        status, _, _ = await call(app, "/small")
+        assert status == 200, status
+    elapsed = time.perf_counter() - t0
+
+    ttfb = []
+    for _ in range(streams):
+        status, first, _ = await call(app, "/stream")
+        assert status == 200, status
+        ttfb.append(first)
+
+    return {
+        "middleware": kind,
+        "requests": requests,
+        "req_per_s": round(requests / elapsed, 1),
+        "us_per_req": round(elapsed / requests * 1e6, 1),
+        "stream_ttfb_ms_median": round(statistics.median(ttfb) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--json", action="store_true", help="sortie JSON")
+    args = parser.parse_args()
+
+    results = [asyncio.run(bench(kind, args.requests, args.streams, args.chunk_delay))
+               for kind in ("none", "legacy", "asgi")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'middleware':<10} {'req/s':>10} {'µs/req':>10} {'TTFB stream (ms)':>18}")
+    for r in results:
+        print(f"{r['middleware']:<10} {r['req_per_s']:>10} {r['us_per_req']:>10} {r['stream_ttfb_ms_median']:>18}")
+
+
+if __name__ == "__main__":
+    main()
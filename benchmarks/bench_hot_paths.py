@@ -0,0 +1,358 @@
+"""
+Microbenchmarks des chemins chauds purs (sans ComfyUI ni réseau) :
+  - _convert_ui_to_api sur des graphes UI synthétiques (10 à 5000 nodes) ;
+  - load_workflow à froid (cache vidé) et à chaud ;
+  - list_workflows / list_output_images / list_exchange sur des arborescences générées ;
+  - RateLimiter.is_allowed avec rotation et renouvellement de clients ;
+  - _safe_join (chemin accepté et chemin refusé) ;
+  - autodoc_nodes sur un dossier custom_nodes synthétique (à froid et à chaud).
+
+Les résultats sont écrits en JSON (--json) dans un format stable, comparable d'une
+version à l'autre avec benchmarks/compare.py. La journalisation INFO est coupée
+pendant les mesures.
+
+Usage :
+    python benchmarks/bench_hot_paths.py [--full] [--only convert,rate] [--json out.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+FORMAT_VERSION = 1
+CONVERT_SIZES = (10, 100, 1000, 5000)
+TREE_SIZES = (1_000, 10_000)
+TREE_SIZES_FULL = (1_000, 10_000, 50_000, 200_000)
+RATE_CLIENTS = (1, 1_000, 100_000)
+AUTODOC_FILES = (20, 200)
+AUTODOC_FILES_FULL = (20, 200, 1_000)
+
+
+# ---------------------------------------------------------------------
+# Mesure
+# ---------------------------------------------------------------------
+def measure(fn, repeat: int, number: int = 0, setup=None, target: float = 0.05) -> dict:
+    """
+    Durée par appel de fn() sur `repeat` séries de `number` appels (number calibré pour
+    qu'une série dure environ `target` secondes quand il vaut 0). setup() est appelé
+    avant chaque série, hors mesure.
+    """
+    if not number:
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        once = time.perf_counter() - started
+        number = max(1, min(100_000, int(target / once))) if once > 0 else 100_000
+    per_call = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number)
+    return {
+        "unit": "s/call",
+        "min": min(per_call),
+        "median": statistics.median(per_call),
+        "mean": statistics.fmean(per_call),
+        "stdev": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _result(name: str, params: dict, stats: dict) -> dict:
+    return {"name": name, "params": params, **stats}
+
+
+# ---------------------------------------------------------------------
+# Données synthétiques
+# ---------------------------------------------------------------------
+def make_ui_graph(nodes: int) -> dict:
+    """Chaîne de nodes : chacun reçoit deux liens des précédents et trois widgets"""
+    ui_nodes = [{"id": 1, "type": "CheckpointLoaderSimple",
+                 "inputs": [{"name": "ckpt_name", "widget": {"name": "ckpt_name"}, "link": None}],
+                 "widgets_values": ["model.safetensors"]}]
+    links = []
+    for node_id in range(2, nodes + 1):
+        a, b = len(links) + 1, len(links) + 2
+        links.append([a, node_id - 1, 0, node_id, 0, "MODEL"])
+        links.append([b, max(1, node_id - 2), 0, node_id, 1, "LATENT"])
+        ui_nodes.append({
+            "id": node_id, "type": "KSampler",
+            "inputs": [
+                {"name": "model", "link": a},
+                {"name": "latent_image", "link": b},
+                {"name": "seed", "widget": {"name": "seed"}, "link": None},
+                {"name": "steps", "widget": {"name": "steps"}, "link": None},
+                {"name": "cfg", "widget": {"name": "cfg"}, "link": None},
+            ],
+            "widgets_values": [node_id, 20, 7.0],
+        })
+    return {"nodes": ui_nodes, "links": links}
+
+
+def make_files(root: Path, count: int, per_dir: int, pattern: str, content: bytes = b""):
+    for i in range(count):
+        folder = root / pattern.split("/")[0].format(group=i // per_dir) if "/" in pattern else root
+        if i % per_dir == 0:
+            folder.mkdir(parents=True, exist_ok=True)
+        (folder / pattern.rsplit("/", 1)[-1].format(i=i)).write_bytes(content)
+
+
+NODE_TEMPLATE = '''
+class {name}:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {{"required": {{"image": ("IMAGE",), "strength": ("FLOAT", {{"default": 1.0, "min": 0.0}})}},
+                "optional": {{"mask": ("MASK",)}}}}
+
+    RETURN_TYPES = ("IMAGE", "MASK")
+    RETURN_NAMES = ("image", "mask")
+    FUNCTION = "run"
+    CATEGORY = "bench/{pack}"
+
+    def run(self, image, strength, mask=None):
+        return (image, mask)
+'''
+
+
+def make_custom_nodes(root: Path, files: int, classes_per_file: int = 5):
+    for i in range(files):
+        pack = root / f"pack_{i // 20}"
+        pack.mkdir(parents=True, exist_ok=True)
+        names = [f"Node{i}_{j}" for j in range(classes_per_file)]
+        body = "".join(NODE_TEMPLATE.format(name=n, pack=pack.name) for n in names)
+        mapping = ", ".join(f'"{n}": {n}' for n in names)
+        (pack / f"nodes_{i}.py").write_text(body + f"\nNODE_CLASS_MAPPINGS = {{{mapping}}}\n", encoding="utf-8")
+
+
+# ---------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------
+def bench_convert(server, args, work: Path) -> list:
+    from comfyui_client import AsyncComfyUIClient
+    client = AsyncComfyUIClient(workflows_dir=work)
+    results = []
+    for nodes in CONVERT_SIZES:
+        graph = make_ui_graph(nodes)
+        stats = measure(lambda: client._convert_ui_to_api(graph), args.repeat)
+        results.append(_result("convert_ui_to_api", {"nodes": nodes}, stats))
+    asyncio.run(client.aclose())
+    return results
+
+
+def bench_load_workflow(server, args, work: Path) -> list:
+    from comfyui_client import AsyncComfyUIClient, WorkflowCache
+    wf_dir = work / "load_workflow"
+    wf_dir.mkdir(parents=True, exist_ok=True)
+    client = AsyncComfyUIClient(workflows_dir=wf_dir)
+    results = []
+    for nodes in (100, 1000):
+        (wf_dir / f"ui_{nodes}.json").write_text(json.dumps(make_ui_graph(nodes)), encoding="utf-8")
+        workflow_id = f"ui_{nodes}"
+
+        def reset_cache():
+            client.workflow_cache = WorkflowCache()
+        cold = measure(lambda: client.load_workflow(workflow_id), args.repeat, number=1, setup=reset_cache)
+        client.load_workflow(workflow_id)
+        warm = measure(lambda: client.load_workflow(workflow_id), args.repeat)
+        results.append(_result("load_workflow", {"nodes": nodes, "cache": "cold"}, cold))
+        results.append(_result("load_workflow", {"nodes": nodes, "cache": "warm"}, warm))
+    asyncio.run(client.aclose())
+    return results
+
+
+def bench_listings(server, args, work: Path) -> list:
+    results = []
+    for files in (TREE_SIZES_FULL if args.full else TREE_SIZES):
+        root = work / f"comfy_{files}"
+        output = root / "output"
+        make_files(output, files, 1000, "batch_{group}/img_{i}.png")
+        make_files(output / "MCP_exchange", files, files, "file_{i}.png")
+        make_files(root / "workflows", files, 500, "group_{group}/wf_{i}.json", b"{}")
+        server.COMFYUI_ROOT = root.resolve()
+        server.WORKFLOWS_DIR = root / "workflows"
+        repeat = max(3, args.repeat // 2) if files >= 50_000 else args.repeat
+
+        stats = measure(server.list_workflows, repeat, number=1)
+        results.append(_result("list_workflows", {"files": files}, stats))
+
+        def reset_index():
+            server._output_index = None
+        stats = measure(lambda: server.list_output_images(limit=100), repeat, number=1, setup=reset_index)
+        results.append(_result("list_output_images", {"files": files, "index": "cold"}, stats))
+        server.list_output_images(limit=100)
+        stats = measure(lambda: server.list_output_images(limit=100), repeat)
+        results.append(_result("list_output_images", {"files": files, "index": "warm"}, stats))
+
+        stats = measure(lambda: server.list_exchange(limit=200), repeat, number=1)
+        results.append(_result("list_exchange", {"files": files}, stats))
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def bench_rate_limiter(server, args, work: Path) -> list:
+    results = []
+    for clients in RATE_CLIENTS:
+        limiter = server.RateLimiter(max_requests=1_000_000, window_seconds=60)
+        ids = [f"client-{i}" for i in range(clients)]
+        position = [0]
+
+        def call():
+            i = position[0]
+            position[0] = i + 1 if i + 1 < clients else 0
+            limiter.is_allowed(ids[i])
+        stats = measure(call, args.repeat, target=0.1)
+        results.append(_result("rate_limiter_is_allowed", {"clients": clients}, stats))
+
+    # Renouvellement : chaque appel vient d'un nouveau client, fenêtre courte (éviction des inactifs)
+    limiter = server.RateLimiter(max_requests=30, window_seconds=0.01)
+    counter = [0]
+
+    def churn():
+        counter[0] += 1
+        limiter.is_allowed(f"client-{counter[0]}")
+    stats = measure(churn, args.repeat, target=0.1)
+    results.append(_result("rate_limiter_is_allowed", {"clients": "churn"}, stats))
+
+    # Client saturé : toutes les requêtes sont refusées
+    limiter = server.RateLimiter(max_requests=30, window_seconds=3600)
+    stats = measure(lambda: limiter.is_allowed("client-0"), args.repeat, target=0.1)
+    results.append(_result("rate_limiter_is_allowed", {"clients": "limited"}, stats))
+    return results
+
+
+def bench_safe_join(server, args, work: Path) -> list:
+    root = work / "safe_join"
+    (root / "output" / "a" / "b").mkdir(parents=True, exist_ok=True)
+
+    def accepted():
+        server._safe_join(root, "output", "a", "b", "image.png")
+
+    def refused():
+        try:
+            server._safe_join(root, "..", "..", "etc", "passwd")
+        except PermissionError:
+            pass
+    return [
+        _result("safe_join", {"case": "accepted"}, measure(accepted, args.repeat)),
+        _result("safe_join", {"case": "refused"}, measure(refused, args.repeat)),
+    ]
+
+
+def bench_autodoc(server, args, work: Path) -> list:
+    results = []
+    for files in (AUTODOC_FILES_FULL if args.full else AUTODOC_FILES):
+        root = work / f"autodoc_{files}"
+        make_custom_nodes(root / "custom_nodes", files)
+        server.CUSTOM_NODES_DIR = root / "custom_nodes"
+
+        def reset():
+            if server._node_autodoc is not None:
+                server._node_autodoc.shutdown()
+            server._node_autodoc = None
+        stats = measure(lambda: server.autodoc_nodes(details=True), args.repeat, number=1, setup=reset)
+        results.append(_result("autodoc_nodes", {"files": files, "cache": "cold"}, stats))
+        server.autodoc_nodes(details=True)
+        stats = measure(lambda: server.autodoc_nodes(details=True), args.repeat)
+        results.append(_result("autodoc_nodes", {"files": files, "cache": "warm"}, stats))
+        reset()
+    return results
+
+
+SUITES = {
+    "convert": bench_convert,
+    "load_workflow": bench_load_workflow,
+    "listings": bench_listings,
+    "rate": bench_rate_limiter,
+    "safe_join": bench_safe_join,
+    "autodoc": bench_autodoc,
+}
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, timeout=10)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default="", help=f"suites à lancer parmi {', '.join(SUITES)} (défaut: toutes)")
+    parser.add_argument("--full", action="store_true", help="grandes tailles (arborescences jusqu'à 200k fichiers)")
+    parser.add_argument("--repeat", type=int, default=7, help="séries de mesure par cas")
+    parser.add_argument("--json", default="", help="fichier de résultats JSON")
+    parser.add_argument("--workdir", default="", help="dossier des données générées (défaut: temporaire)")
+    parser.add_argument("--keep", action="store_true", help="conserve les données générées")
+    args = parser.parse_args()
+
+    selected = [s.strip() for s in args.only.split(",") if s.strip()] or list(SUITES)
+    unknown = [s for s in selected if s not in SUITES]
+    if unknown:
+        parser.error(f"suite inconnue: {', '.join(unknown)}")
+
+    work = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="comfyui_mcp_bench_"))
+    work.mkdir(parents=True, exist_ok=True)
+    # server.py lit sa configuration à l'import : racine ComfyUI factice, pas de navigateur
+    os.environ["COMFYUI_ROOT"] = str(work)
+    os.environ.setdefault("ENABLE_BROWSER_CONTROL", "false")
+    import server
+    logging.disable(logging.INFO)
+
+    results = []
+    try:
+        for suite in selected:
+            started = time.perf_counter()
+            suite_results = SUITES[suite](server, args, work)
+            for r in suite_results:
+                params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+                print(f"{r['name']:<26} {params:<28} median {r['median'] * 1e6:>12.2f} µs  "
+                      f"(min {r['min'] * 1e6:.2f}, n={r['number']}x{r['repeat']})", flush=True)
+            print(f"-- {suite}: {time.perf_counter() - started:.1f}s", flush=True)
+            results.extend(suite_results)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.json:
+        report = {
+            "format": FORMAT_VERSION,
+            "suite": "hot_paths",
+            "meta": {
+                "revision": _git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "full": args.full,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Résultats écrits dans {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare deux résultats JSON de bench_hot_paths.py (référence puis nouvelle version).
+Les cas sont appariés par nom et paramètres ; un ratio nouveau/référence au-dessus de
+1 + seuil est signalé comme régression, en dessous de 1 - seuil comme amélioration.
+
+Usage :
+    python benchmarks/compare.py base.json new.json [--threshold 0.10] [--metric median] [--fail]
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+METRICS = ("min", "median", "mean")
+
+
+def _load(path: str) -> dict:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if data.get("suite") != "hot_paths":
+        raise ValueError(f"{path}: pas un résultat de bench_hot_paths.py")
+    return data
+
+
+def _key(result: dict) -> tuple:
+    return result["name"], json.dumps(result.get("params", {}), sort_keys=True)
+
+
+def _label(result: dict) -> str:
+    params = " ".join(f"{k}={v}" for k, v in result.get("params", {}).items())
+    return f"{result['name']} {params}".strip()
+
+
+def compare(base: dict, new: dict, metric: str = "median", threshold: float = 0.10) -> list:
+    """Lignes (libellé, référence, nouveau, ratio, verdict) ; ratio None si le cas manque d'un côté"""
+    base_by_key = {_key(r): r for r in base["results"]}
+    new_by_key = {_key(r): r for r in new["results"]}
+    rows = []
+    for key in list(base_by_key) + [k for k in new_by_key if k not in base_by_key]:
+        old, cur = base_by_key.get(key), new_by_key.get(key)
+        label = _label(old or cur)
+        if old is None or cur is None:
+            rows.append((label, old and old[metric], cur and cur[metric], None,
+                         "nouveau" if old is None else "absent"))
+            continue
+        ratio = cur[metric] / old[metric] if old[metric] else float("inf")
+        verdict = "régression" if ratio > 1 + threshold else "amélioration" if ratio < 1 - threshold else ""
+        rows.append((label, old[metric], cur[metric], ratio, verdict))
+    return rows
+
+
+def _fmt(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1e6:.2f} µs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--metric", choices=METRICS, default="median")
+    parser.add_argument("--threshold", type=float, default=0.10, help="écart relatif toléré (défaut: 0.10)")
+    parser.add_argument("--fail", action="store_true", help="code de sortie 1 en cas de régression")
+    args = parser.parse_args()
+
+    base, new = _load(args.base), _load(args.new)
+    print(f"référence {base['meta'].get('revision')} ({base['meta'].get('python')}) -> "
+          f"nouveau {new['meta'].get('revision')} ({new['meta'].get('python')}), métrique {args.metric}")
+    if base["meta"].get("platform") != new["meta"].get("platform"):
+        print("attention : plateformes différentes, comparaison indicative")
+
+    rows = compare(base, new, args.metric, args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    for label, old, cur, ratio, verdict in rows:
+        shown = "-" if ratio is None else f"x{ratio:.2f}"
+        print(f"{label:<{width}}  {_fmt(old):>16}  {_fmt(cur):>16}  {shown:>7}  {verdict}")
+
+    regressions = sum(1 for r in rows if r[4] == "régression")
+    print(f"{regressions} régression(s) au-delà de {args.threshold:.0%}")
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
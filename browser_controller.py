@@ -1,10 +1,12 @@
 """
 Contrôleur pour envoyer des commandes à l'extension Chrome via WebSocket.
 Compatible avec le ConnectionManager du serveur MCP.
+Chaque commande porte un identifiant ; la réponse de l'extension est renvoyée
+à l'appelant (ou une erreur après reply_timeout secondes).
 """
 
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -13,111 +15,74 @@ class BrowserController:
     Contrôleur pour envoyer des commandes à l'extension Chrome.
     Utilise le WebSocket ConnectionManager au lieu de Playwright.
     """
-    
-    def __init__(self, manager):
+
+    def __init__(self, manager, reply_timeout: float = 15.0):
         """
         Initialise le contrôleur avec le WebSocket manager.
-        
+
         Args:
             manager: Instance de ConnectionManager pour WebSocket
+            reply_timeout: Délai max d'attente de la réponse de l'extension (s)
         """
         self.manager = manager
+        self.reply_timeout = reply_timeout
         logger.info("BrowserController initialisé avec WebSocket manager")
-    
+
+    async def _request(self, command: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        result = await self.manager.request(command, timeout or self.reply_timeout)
+        if result.get("status") == "success":
+            logger.info(f"Réponse reçue pour {command['action']}")
+        else:
+            logger.warning(f"Commande {command['action']} sans succès: {result.get('message')}")
+        return {"action": command["action"], **result}
+
     async def click_element(self, selector: str) -> Dict[str, Any]:
         """
-        Envoie une commande de clic à l'extension Chrome.
-        
+        Clique sur un élément de la page ComfyUI.
+
         Args:
             selector: Sélecteur CSS de l'élément
-            
+
         Returns:
-            dict: Confirmation de l'envoi
+            dict: Réponse de l'extension (data.found indique si l'élément existe)
         """
-        command = {
-            "action": "click",
-            "selector": selector
-        }
-        
-        await self.manager.send_command(command)
-        logger.info(f"Commande click envoyée: {selector}")
-        
-        return {
-            "status": "sent",
-            "action": "click",
-            "selector": selector,
-            "message": f"Commande envoyée à {len(self.manager.active_connections)} extension(s)"
-        }
-    
+        result = await self._request({"action": "click", "selector": selector})
+        result["selector"] = selector
+        return result
+
     async def fill_input(self, selector: str, text: str) -> Dict[str, Any]:
         """
-        Envoie une commande pour remplir un champ texte.
-        
+        Remplit un champ texte.
+
         Args:
             selector: Sélecteur CSS du champ
             text: Texte à insérer
-            
+
         Returns:
-            dict: Confirmation de l'envoi
+            dict: Réponse de l'extension (data.found indique si le champ existe)
         """
-        command = {
-            "action": "fill",
-            "selector": selector,
-            "text": text
-        }
-        
-        await self.manager.send_command(command)
-        logger.info(f"Commande fill envoyée: {selector} = '{text[:50]}'")
-        
-        return {
-            "status": "sent",
-            "action": "fill",
-            "selector": selector,
-            "text": text,
-            "message": f"Commande envoyée à {len(self.manager.active_connections)} extension(s)"
-        }
-    
+        result = await self._request({"action": "fill", "selector": selector, "text": text})
+        result["selector"] = selector
+        return result
+
     async def get_workflow(self) -> Dict[str, Any]:
         """
-        Demande à l'extension de récupérer le workflow actuel.
-        
+        Récupère le workflow affiché dans l'onglet ComfyUI.
+
         Returns:
-            dict: Confirmation (workflow sera affiché dans la console de l'extension)
+            dict: data = {"url", "node_count", "workflow"} (format UI de ComfyUI)
         """
-        command = {
-            "action": "get_workflow"
-        }
-        
-        await self.manager.send_command(command)
-        logger.info("Commande get_workflow envoyée")
-        
-        return {
-            "status": "sent",
-            "action": "get_workflow",
-            "message": "Le workflow sera affiché dans la console de l'extension Chrome (F12)",
-            "connections": len(self.manager.active_connections)
-        }
-    
+        return await self._request({"action": "get_workflow"})
+
     async def execute_script(self, script: str) -> Dict[str, Any]:
         """
         Envoie du JavaScript arbitraire à exécuter.
-        
+
         Args:
             script: Code JavaScript à exécuter
-            
+
         Returns:
-            dict: Confirmation de l'envoi
+            dict: Erreur "unsupported" : l'extension n'exécute pas de code arbitraire
         """
-        command = {
-            "action": "execute_js",
-            "script": script
-        }
-        
-        await self.manager.send_command(command)
         logger.info(f"Script JS envoyé: {script[:100]}")
-        
-        return {
-            "status": "sent",
-            "action": "execute_js",
-            "message": f"Script envoyé à {len(self.manager.active_connections)} extension(s)"
-        }
+        return await self._request({"action": "execute_js", "script": script})
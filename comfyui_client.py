@@ -1,40 +1,277 @@
-import requests
+import httpx
 import json
 import time
+import copy
+import asyncio
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Optional
+
+from completion_tracker import CompletionTracker, ws_url_from_base
+from history_tracker import HistoryTracker
+from result_cache import ResultCache, workflow_key
+from resilience import (CircuitBreaker, READ_RETRIES, UNAVAILABLE_STATUSES,
+                        endpoint_route, endpoint_timeout, retry_delay)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ComfyUIClient")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Paramètres de génération applicables à un workflow (voir resolve_bindings)
+GENERATION_PARAMETERS = (
+    "prompt", "negative_prompt", "width", "height", "batch_size", "model",
+    "seed", "steps", "cfg", "sampler_name", "scheduler", "denoise",
+)
 
-DEFAULT_MAPPING = {
-    "prompt": ("6", "text"),
-    "width": ("5", "width"),
-    "height": ("5", "height"),
-    "model": ("4", "ckpt_name")
+# Nodes reconnus par class_type
+SAMPLER_NODES = {"KSampler", "KSamplerAdvanced", "SamplerCustom"}
+# Entrées de conditioning (positive / negative) des samplers et guiders
+CONDITIONING_INPUTS = {
+    "KSampler": {"positive": "positive", "negative": "negative"},
+    "KSamplerAdvanced": {"positive": "positive", "negative": "negative"},
+    "SamplerCustom": {"positive": "positive", "negative": "negative"},
+    "CFGGuider": {"positive": "positive", "negative": "negative"},
+    "BasicGuider": {"positive": "conditioning"},
+}
+TEXT_ENCODE_FIELDS = {
+    "CLIPTextEncode": ("text",),
+    "CLIPTextEncodeSDXL": ("text_g", "text_l"),
+    "CLIPTextEncodeSDXLRefiner": ("text",),
+    "CLIPTextEncodeFlux": ("clip_l", "t5xxl"),
+    "CLIPTextEncodeSD3": ("clip_l", "clip_g", "t5xxl"),
 }
+LATENT_NODES = {"EmptyLatentImage", "EmptySD3LatentImage", "EmptyHunyuanLatentVideo", "EmptyMochiLatentVideo"}
+CHECKPOINT_NODES = {"CheckpointLoaderSimple", "CheckpointLoader", "ImageOnlyCheckpointLoader"}
+SEED_FIELDS = {"KSampler": "seed", "KSamplerAdvanced": "noise_seed", "SamplerCustom": "noise_seed", "RandomNoise": "noise_seed"}
+SAMPLER_FIELDS = ("steps", "cfg", "sampler_name", "scheduler", "denoise")
+# Nodes traversés pour remonter d'un sampler jusqu'à l'encodeur de texte
+CONDITIONING_PASSTHROUGH = {"FluxGuidance": "conditioning", "ConditioningSetTimestepRange": "conditioning",
+                            "ControlNetApply": "conditioning"}
+
+def _is_link(value) -> bool:
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+def _node_sort_key(node_id: str):
+    return (0, int(node_id), "") if str(node_id).isdigit() else (1, 0, str(node_id))
+
+def _trace_text_encoder(graph: dict, link, depth: int = 0):
+    """Remonte un lien de conditioning jusqu'à un encodeur de texte connu (ou None)"""
+    if not _is_link(link) or depth > 4:
+        return None
+    node_id = link[0]
+    node = graph.get(node_id)
+    if not isinstance(node, dict):
+        return None
+    class_type = node.get("class_type")
+    if class_type in TEXT_ENCODE_FIELDS:
+        return node_id
+    field = CONDITIONING_PASSTHROUGH.get(class_type)
+    if field:
+        return _trace_text_encoder(graph, (node.get("inputs") or {}).get(field), depth + 1)
+    return None
+
+def resolve_bindings(graph: dict) -> dict:
+    """
+    Analyse un workflow (format API) et localise, par class_type, où écrire chaque
+    paramètre de génération.
+
+    Returns:
+        dict: paramètre -> liste de (node_id, champ) ; seuls les champs non reliés
+              (valeurs de widget) sont retenus
+    """
+    bindings = {}
+
+    def bind(param, node_id, field):
+        inputs = graph[node_id].get("inputs") or {}
+        if field in inputs and not _is_link(inputs[field]):
+            targets = bindings.setdefault(param, [])
+            if (node_id, field) not in targets:
+                targets.append((node_id, field))
+
+    node_ids = sorted((nid for nid, n in graph.items() if isinstance(n, dict)), key=_node_sort_key)
+    positive, negative = [], []
+    for node_id in node_ids:
+        node = graph[node_id]
+        class_type = node.get("class_type")
+        inputs = node.get("inputs") or {}
+        conditioning = CONDITIONING_INPUTS.get(class_type, {})
+        for name, targets in (("positive", positive), ("negative", negative)):
+            encoder = _trace_text_encoder(graph, inputs.get(conditioning.get(name)))
+            if encoder and encoder not in targets:
+                targets.append(encoder)
+        if class_type == "CFGGuider":
+            bind("cfg", node_id, "cfg")
+        if class_type in SAMPLER_NODES:
+            for field in SAMPLER_FIELDS:
+                bind(field, node_id, field)
+        if class_type in SEED_FIELDS:
+            bind("seed", node_id, SEED_FIELDS[class_type])
+        if class_type in LATENT_NODES:
+            for field in ("width", "height", "batch_size"):
+                bind(field, node_id, field)
+        if class_type in CHECKPOINT_NODES:
+            bind("model", node_id, "ckpt_name")
+
+    # Sans sampler relié aux encodeurs : le premier encodeur porte le prompt
+    if not positive:
+        encoders = [nid for nid in node_ids if graph[nid].get("class_type") in TEXT_ENCODE_FIELDS]
+        positive = encoders[:1]
+    for param, encoders in (("prompt", positive), ("negative_prompt", negative)):
+        for node_id in encoders:
+            if node_id in positive and param == "negative_prompt":
+                continue  # même encodeur branché des deux côtés
+            for field in TEXT_ENCODE_FIELDS[graph[node_id]["class_type"]]:
+                bind(param, node_id, field)
+    return bindings
+
+# Durée de vie du catalogue /object_info en cache (s)
+NODE_CATALOG_TTL = 300.0
+
+class NodeCatalog:
+    """Snapshot de /object_info avec noms triés, interrogeable sans nouvel appel HTTP"""
+
+    FIELDS = ("names", "summary", "full")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.names = sorted(data)
+        self.fetched_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def query(self, category: str = "", name: str = "", fields: str = "names",
+              offset: int = 0, limit: int = 100) -> dict:
+        """
+        Filtre et pagine le catalogue.
+
+        Args:
+            category: préfixe de catégorie (insensible à la casse, ex: 'sampling')
+            name: sous-chaîne du nom ou du display_name (insensible à la casse)
+            fields: 'names' (noms seuls), 'summary' (nom, catégorie, sorties) ou 'full' (specs complètes)
+            offset, limit: pagination
+        """
+        if fields not in self.FIELDS:
+            raise ValueError(f"fields invalide ({fields}). Valeurs: {', '.join(self.FIELDS)}")
+        category = category.strip().lower()
+        name = name.strip().lower()
+        matches = []
+        for node_name in self.names:
+            spec = self.data[node_name] or {}
+            if category and not str(spec.get("category", "")).lower().startswith(category):
+                continue
+            if name and name not in node_name.lower() and name not in str(spec.get("display_name", "")).lower():
+                continue
+            matches.append(node_name)
+
+        offset = max(offset, 0)
+        limit = max(limit, 1)
+        page = matches[offset:offset + limit]
+        if fields == "names":
+            nodes = page
+        elif fields == "summary":
+            nodes = [{
+                "name": n,
+                "display_name": self.data[n].get("display_name"),
+                "category": self.data[n].get("category"),
+                "output": self.data[n].get("output"),
+            } for n in page]
+        else:
+            nodes = {n: self.data[n] for n in page}
+        next_offset = offset + len(page)
+        return {
+            "total": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "count": len(page),
+            "next_offset": next_offset if next_offset < len(matches) else None,
+            "nodes": nodes,
+        }
+
+# Rafraîchissement en arrière-plan de la liste des checkpoints (s)
+MODELS_REFRESH_INTERVAL = 300.0
+
+# Transport HTTP : taille du pool keep-alive et timeouts (connect, read) en secondes
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5.0, 120.0)
+
+# Nombre de workflows compilés (format API) gardés en cache
+WORKFLOW_CACHE_SIZE = 64
+
+# Lectures partagées : durée (s) pendant laquelle /queue et /system_stats sont resservis
+READ_CACHE_TTL = 0.25
+
+# Attente maximale de la fin d'une génération (s), quand l'appel n'en donne pas
+GENERATION_TIMEOUT = 600.0
+
+class WorkflowCache:
+    """
+    Cache LRU des workflows compilés (format API) et de leur index de paramètres,
+    indexé par chemin. Une entrée n'est valide que si mtime et taille du fichier
+    n'ont pas changé.
+    """
+
+    def __init__(self, max_entries: int = WORKFLOW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str, mtime_ns: int, size: int):
+        """Retourne (graphe, bindings) si le fichier n'a pas changé, sinon None"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != (mtime_ns, size):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, path: str, mtime_ns: int, size: int, graph: dict, bindings: dict):
+        with self._lock:
+            self._entries[path] = ((mtime_ns, size), graph, bindings)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+def _copy_graph(graph: dict) -> dict:
+    """
+    Copie privée d'un graphe API : chaque node et son dict 'inputs' sont copiés,
+    les valeurs (liens [node, slot], etc.) sont partagées. Suffisant pour réassigner
+    des paramètres sans toucher au graphe en cache.
+    """
+    copied = {}
+    for node_id, node in graph.items():
+        if isinstance(node, dict) and isinstance(node.get("inputs"), dict):
+            copied[node_id] = {**node, "inputs": dict(node["inputs"])}
+        else:
+            copied[node_id] = copy.deepcopy(node)
+    return copied
+
+class WorkflowMixin:
+    """Chargement et préparation des workflows (indépendants du transport HTTP)"""
 
-class ComfyUIClient:
-    def __init__(self, base_url="http://127.0.0.1:8188", workflows_dir="workflows"):
-        self.base_url = base_url
-        self.workflows_dir = Path(workflows_dir)
-        self.available_models = self._get_available_models()
-    
-    def _get_available_models(self):
-        """Fetch list of available checkpoint models from ComfyUI"""
-        try:
-            response = requests.get(f"{self.base_url}/object_info/CheckpointLoaderSimple")
-            if response.status_code != 200:
-                logger.warning("Failed to fetch model list; using default handling")
-                return []
-            data = response.json()
-            models = data["CheckpointLoaderSimple"]["input"]["required"]["ckpt_name"][0]
-            logger.info(f"Available models: {len(models)} models found")
-            return models
-        except Exception as e:
-            logger.warning(f"Error fetching models: {e}")
-            return []
-    
     def list_workflows(self):
         """Liste tous les workflows disponibles (récursif avec sous-dossiers)"""
         if not self.workflows_dir.exists():
@@ -124,178 +361,599 @@ class ComfyUIClient:
         Charge un workflow et le convertit automatiquement si nécessaire.
         Supporte les sous-dossiers (ex: "flux/upscale")
         """
+        return self._load_compiled(workflow_id)[0]
+    
+    def get_workflow_bindings(self, workflow_id: str) -> dict:
+        """Paramètres applicables au workflow : paramètre -> [(node_id, champ)]"""
+        return self._load_compiled(workflow_id)[1]
+    
+    def _load_compiled(self, workflow_id: str):
+        """Retourne (copie privée du graphe API, index des paramètres)"""
         workflow_path = self.workflows_dir / f"{workflow_id}.json"
-        if not workflow_path.exists():
+        try:
+            st = workflow_path.stat()
+        except FileNotFoundError:
             raise FileNotFoundError(f"Workflow '{workflow_id}' not found at {workflow_path}")
         
-        with open(workflow_path, 'r', encoding='utf-8') as f:
-            workflow = json.load(f)
+        # Graphe déjà compilé et fichier inchangé : pas de relecture ni de conversion
+        cache_key = str(workflow_path)
+        cached = self.workflow_cache.get(cache_key, st.st_mtime_ns, st.st_size)
+        if cached is None:
+            with open(workflow_path, 'r', encoding='utf-8') as f:
+                workflow = json.load(f)
+            
+            # Détection et conversion automatique
+            if self._is_ui_format(workflow):
+                logger.info(f"Workflow '{workflow_id}' is in UI format, converting to API format")
+                compiled = self._convert_ui_to_api(workflow)
+            else:
+                logger.info(f"Workflow '{workflow_id}' is already in API format")
+                compiled = workflow
+            bindings = resolve_bindings(compiled)
+            self.workflow_cache.put(cache_key, st.st_mtime_ns, st.st_size, compiled, bindings)
+            cached = (compiled, bindings)
         
-        # Détection et conversion automatique
-        if self._is_ui_format(workflow):
-            logger.info(f"Workflow '{workflow_id}' is in UI format, converting to API format")
-            return self._convert_ui_to_api(workflow)
-        else:
-            logger.info(f"Workflow '{workflow_id}' is already in API format")
-            return workflow
+        return _copy_graph(cached[0]), cached[1]
+    
+    def _apply_parameters(self, workflow: dict, bindings: dict, params: dict):
+        """Écrit les paramètres (GENERATION_PARAMETERS) dans le workflow via son index de bindings"""
+        for param, value in params.items():
+            if value is None:
+                continue
+            targets = bindings.get(param)
+            if not targets:
+                if param != "model":
+                    logger.debug(f"Parameter '{param}' has no binding in this workflow, ignored")
+                continue
+            if param == "model" and self.available_models and value not in self.available_models:
+                logger.warning(f"Model '{value}' not found. Using workflow default.")
+                continue
+            for node_id, field in targets:
+                workflow[node_id]["inputs"][field] = value
+        return workflow
     
-    def generate_image(self, prompt, width=512, height=512, workflow_id="basic_api_test", model=None):
+    def _image_url_from_history(self, history: dict, prompt_id: str):
+        """Retourne l'URL /view de la première image produite par prompt_id (ou None)"""
+        if prompt_id not in history:
+            return None
+        urls = self._image_urls(history[prompt_id])
+        return urls[0] if urls else None
+
+    def _image_urls(self, entry: dict) -> list:
+        """URLs /view de toutes les images d'une entrée d'historique"""
+        urls = []
+        for node_output in (entry.get("outputs") or {}).values():
+            for img in node_output.get("images") or []:
+                filename = img["filename"]
+                subfolder = img.get("subfolder", "")
+                img_type = img.get("type", "output")
+                
+                url = f"{self.base_url}/view?filename={filename}"
+                if subfolder:
+                    url += f"&subfolder={subfolder}"
+                url += f"&type={img_type}"
+                urls.append(url)
+        return urls
+
+class AsyncComfyUIClient(WorkflowMixin):
+    """
+    Client ComfyUI asyncio (httpx.AsyncClient) : méthodes à attendre avec await,
+    à fermer avec aclose() (WebSocket, suivi de /history, tâches de fond, pool HTTP).
+    """
+
+    def __init__(self, base_url="http://127.0.0.1:8188", workflows_dir="workflows",
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.workflows_dir = Path(workflows_dir)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.request_count = 0
+        # Réutilisation du pool keep-alive (événements de trace httpcore)
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.workflow_cache = WorkflowCache()
+        self.node_catalog_ttl = NODE_CATALOG_TTL
+        self._node_catalog = None
+        self._node_catalog_lock = asyncio.Lock()
+        # Liste des modèles chargée au premier usage, puis rafraîchie en arrière-plan
+        self.models_refresh_interval = MODELS_REFRESH_INTERVAL
+        self.available_models = None
+        self._models_at = 0.0
+        self._models_lock = asyncio.Lock()
+        self._models_task = None
+        self._models_refresher = None
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        # Lectures relancées en cas d'erreur réseau, appels refusés quand ComfyUI est tombé
+        self.read_retries = READ_RETRIES
+        self.breaker = CircuitBreaker(name=f"ComfyUI {self.base_url}")
+        # Prompts en cours suivis en groupe : un /queue (+ un /history) par cycle pour tous
+        self.history_tracker = HistoryTracker(self._shared_get)
+        # Fin des jobs suivie par événements sur /ws (polling groupé de /history en secours)
+        self.tracker = CompletionTracker(ws_url_from_base(self.base_url), self._fetch_history,
+                                         poll_history=self.history_tracker.check)
+        # Sorties des workflows déjà exécutés, par hash du graphe
+        self.result_cache = ResultCache()
+        self.result_record_timeout = 600.0
+        self.generation_timeout = GENERATION_TIMEOUT
+        self._record_tasks = set()
+        # Appelé avec chaque prompt_id soumis (utilisé par BackendPool pour épingler le backend)
+        self.on_submit = None
+        # Mesures : on_request(base_url, method, endpoint, status, secondes) par requête HTTP,
+        # on_timing(base_url, prompt_id, attente en file, exécution, status) par prompt suivi sur /ws
+        self.on_request = None
+        self.on_timing = None
+        self.tracker.on_timing = self._report_timing
+        # GET identiques simultanés : une seule requête amont, résultat partagé
+        self.read_ttl = READ_CACHE_TTL
+        self._reads_in_flight = {}
+        self._read_cache = {}
+        self.read_stats = {"upstream": 0, "coalesced": 0, "cached": 0}
+
+    async def _request(self, method: str, path: str, timeout=None, retries=None, **kwargs) -> httpx.Response:
         """
-        Generate an image using ComfyUI with a predefined workflow.
-        Automatically converts UI format workflows to API format.
+        Envoie une requête via le pool de connexions async, avec le timeout propre à
+        l'endpoint (ou celui donné). Les GET sont relancés (gigue) sur erreur réseau
+        ou 502/503/504.
+
+        Raises:
+            CircuitOpenError: ComfyUI est considéré indisponible, rien n'est envoyé
+            httpx.TransportError: erreur réseau après la dernière tentative
         """
-        # Load workflow (with automatic conversion)
-        workflow = self.load_workflow(workflow_id)
-        
-        # Apply parameters using mapping
-        mapping = DEFAULT_MAPPING
-        
-        # Update prompt
-        if "prompt" in mapping:
-            node_id, field = mapping["prompt"]
-            if node_id in workflow:
-                workflow[node_id]["inputs"][field] = prompt
-        
-        # Update dimensions
-        if "width" in mapping:
-            node_id, field = mapping["width"]
-            if node_id in workflow:
-                workflow[node_id]["inputs"][field] = width
-        
-        if "height" in mapping:
-            node_id, field = mapping["height"]
-            if node_id in workflow:
-                workflow[node_id]["inputs"][field] = height
-        
-        # Update model if specified
-        if model and "model" in mapping:
-            node_id, field = mapping["model"]
-            if node_id in workflow:
-                if self.available_models and model not in self.available_models:
-                    logger.warning(f"Model '{model}' not found. Using workflow default.")
-                else:
-                    workflow[node_id]["inputs"][field] = model
-        
-        # Submit workflow
-        payload = {"prompt": workflow}
-        response = requests.post(f"{self.base_url}/prompt", json=payload)
+        if timeout is None:
+            connect, read = endpoint_timeout(path, self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout))
+            timeout = httpx.Timeout(read, connect=connect)
+        attempts = 1 + ((self.read_retries if retries is None else retries) if method == "GET" else 0)
+        for attempt in range(attempts):
+            self.breaker.check()
+            self.request_count += 1
+            started = time.perf_counter()
+            try:
+                response = await self.http.request(method, path, timeout=timeout,
+                                                   extensions={"trace": self._trace}, **kwargs)
+            except httpx.TransportError:
+                self._observe(method, path, "error", started)
+                self.breaker.record_failure()
+                # Pas de relance si c'est la dernière tentative ou si le circuit vient de s'ouvrir
+                if attempt + 1 >= attempts or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+            else:
+                self._observe(method, path, f"{response.status_code // 100}xx", started)
+                if response.status_code not in UNAVAILABLE_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts or self.breaker.state == CircuitBreaker.OPEN:
+                    return response
+            await asyncio.sleep(retry_delay(attempt))
+
+    async def _trace(self, event: str, info: dict):
+        # Une connexion TCP ouverte par requête qui n'a pas trouvé de connexion libre dans le pool
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event.endswith(".send_request_headers.started"):
+            self.requests_sent += 1
+
+    def _observe(self, method: str, path: str, status: str, started: float):
+        if self.on_request is not None:
+            self.on_request(self.base_url, method, endpoint_route(path), status, time.perf_counter() - started)
+
+    def _report_timing(self, prompt_id: str, queue_wait: float, execution: float, status: str):
+        if self.on_timing is not None:
+            self.on_timing(self.base_url, prompt_id, queue_wait, execution, status)
+
+    async def _fetch_json(self, path: str, ttl: float):
+        self.read_stats["upstream"] += 1
+        response = await self._request("GET", path)
         response.raise_for_status()
-        result = response.json()
-        prompt_id = result.get("prompt_id")
-        
+        data = response.json()
+        if ttl > 0:
+            self._read_cache[path] = (asyncio.get_running_loop().time() + ttl, data)
+        return data
+
+    def _read_done(self, path: str, task: asyncio.Task):
+        if self._reads_in_flight.get(path) is task:
+            del self._reads_in_flight[path]
+        if not task.cancelled():
+            task.exception()  # consommée ici si aucun appelant n'attend plus
+
+    async def _shared_get(self, path: str, ttl: float = 0.0):
+        """
+        GET JSON en vol unique : les appels identiques simultanés attendent la même
+        requête amont ; avec ttl > 0 la réponse est resservie pendant ttl secondes.
+        Le résultat est partagé entre les appelants : ne pas le modifier.
+
+        Raises:
+            httpx.HTTPError: erreur de la requête amont (transmise à chaque appelant)
+        """
+        loop = asyncio.get_running_loop()
+        if ttl > 0:
+            cached = self._read_cache.get(path)
+            if cached is not None and cached[0] > loop.time():
+                self.read_stats["cached"] += 1
+                return cached[1]
+        task = self._reads_in_flight.get(path)
+        if task is None:
+            task = loop.create_task(self._fetch_json(path, ttl))
+            self._reads_in_flight[path] = task
+            task.add_done_callback(lambda t, p=path: self._read_done(p, t))
+        else:
+            self.read_stats["coalesced"] += 1
+        # shield : l'annulation d'un appelant n'interrompt pas la requête des autres
+        return await asyncio.shield(task)
+
+    def transport_stats(self) -> dict:
+        """
+        Compteurs du transport HTTP async.
+
+        Returns:
+            dict: requêtes envoyées, connexions ouvertes et requêtes servies
+                  par une connexion déjà ouverte (keep-alive), lectures partagées...
+        """
+        return {
+            "pool_size": self.pool_size,
+            "timeout": list(self.timeout) if isinstance(self.timeout, tuple) else self.timeout,
+            "requests": self.request_count,
+            "connections_opened": self.connections_opened,
+            "connections_reused": max(self.requests_sent - self.connections_opened, 0),
+            "reads": {**self.read_stats, "ttl_s": self.read_ttl},
+            "circuit": self.breaker.get_stats(),
+            "history_tracker": self.history_tracker.get_stats(),
+        }
+
+    def configure_circuit(self, failure_threshold: int, reset_timeout: float):
+        """Seuil d'échecs et délai de réouverture du disjoncteur (seuil 0 = désactivé)"""
+        self.breaker.failure_threshold = failure_threshold
+        self.breaker.reset_timeout = reset_timeout
+
+    def circuit_stats(self) -> dict:
+        """État du disjoncteur, par URL de backend"""
+        return {self.base_url: self.breaker.get_stats()}
+
+    async def aclose(self):
+        """Ferme la connexion WebSocket et les connexions du pool"""
+        await self.tracker.stop()
+        await self.history_tracker.stop()
+        for task in (self._models_task, self._models_refresher, *self._record_tasks,
+                     *self._reads_in_flight.values()):
+            if task is not None:
+                task.cancel()
+        await self.http.aclose()
+
+    async def _get_available_models(self):
+        """Fetch list of available checkpoint models from ComfyUI"""
+        try:
+            response = await self._request("GET", "/object_info/CheckpointLoaderSimple")
+            if response.status_code != 200:
+                logger.warning("Failed to fetch model list; using default handling")
+                return []
+            data = response.json()
+            models = data["CheckpointLoaderSimple"]["input"]["required"]["ckpt_name"][0]
+            logger.info(f"Available models: {len(models)} models found")
+            return models
+        except Exception as e:
+            logger.warning(f"Error fetching models: {e}")
+            return []
+
+    async def get_available_models(self) -> list:
+        """
+        Checkpoints disponibles (stale-while-revalidate) : chargés au premier usage,
+        rafraîchis toutes les models_refresh_interval secondes par une tâche de fond ;
+        une liste périmée est servie immédiatement pendant son rechargement.
+        """
+        loop = asyncio.get_running_loop()
+        if self.available_models is None:
+            async with self._models_lock:
+                if self.available_models is None:
+                    await self._refresh_models()
+        elif loop.time() - self._models_at > self.models_refresh_interval:
+            if self._models_task is None or self._models_task.done():
+                self._models_task = loop.create_task(self._refresh_models())
+        if self._models_refresher is None or self._models_refresher.done():
+            self._models_refresher = loop.create_task(self._models_refresh_loop())
+        return self.available_models or []
+
+    async def _refresh_models(self):
+        models = await self._get_available_models()
+        # Une erreur ne remplace pas une liste déjà connue
+        if models or self.available_models is None:
+            self.available_models = models
+        if models:
+            self._models_at = asyncio.get_running_loop().time()
+
+    async def _models_refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.models_refresh_interval)
+            await self._refresh_models()
+
+    async def list_models(self, model_type: str = "checkpoints") -> dict:
+        """Liste les modèles d'un dossier ComfyUI (checkpoints depuis le cache, autres via /models)"""
+        if model_type == "checkpoints":
+            models = await self.get_available_models()
+            return {"model_type": model_type, "models": models,
+                    "age_s": round(asyncio.get_running_loop().time() - self._models_at, 1) if self._models_at else None}
+        try:
+            response = await self._request("GET", f"/models/{model_type}")
+            response.raise_for_status()
+            return {"model_type": model_type, "models": response.json()}
+        except Exception as e:
+            logger.error(f"Erreur list_models({model_type}): {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def _build_generation(self, prompt, width, height, workflow_id, model, params: dict) -> dict:
+        """Workflow prêt à soumettre, paramètres appliqués"""
+        workflow, bindings = self._load_compiled(workflow_id)
+        if model:
+            await self.get_available_models()
+        params.update(prompt=prompt, width=width, height=height, model=model)
+        self._apply_parameters(workflow, bindings, params)
+        return workflow
+
+    async def _submit(self, workflow: dict) -> str:
+        self.tracker.start()
+        response = await self._request("POST", "/prompt", json=self._prompt_payload(workflow))
+        response.raise_for_status()
+        prompt_id = response.json().get("prompt_id")
         if not prompt_id:
             raise ValueError("No prompt_id returned from ComfyUI")
-        
+        self.tracker.mark_submitted(prompt_id)
+        if self.on_submit is not None:
+            self.on_submit(prompt_id)
         logger.info(f"Workflow submitted. Prompt ID: {prompt_id}")
-        
-        # Poll for completion
-        max_wait = 120
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            history_response = requests.get(f"{self.base_url}/history/{prompt_id}")
-            history_response.raise_for_status()
-            history = history_response.json()
-            
-            if prompt_id in history:
-                outputs = history[prompt_id].get("outputs", {})
-                for node_output in outputs.values():
-                    if "images" in node_output:
-                        images = node_output["images"]
-                        if images:
-                            img = images[0]
-                            filename = img["filename"]
-                            subfolder = img.get("subfolder", "")
-                            img_type = img.get("type", "output")
-                            
-                            url = f"{self.base_url}/view?filename={filename}"
-                            if subfolder:
-                                url += f"&subfolder={subfolder}"
-                            url += f"&type={img_type}"
-                            
-                            logger.info(f"Image generated: {url}")
-                            return url
-            
-            time.sleep(1)
-        
-        raise TimeoutError(f"Image generation timed out after {max_wait} seconds")
-    
-    def get_queue_info(self) -> dict:
+        return prompt_id
+
+    async def submit_generation(self, prompt, width=512, height=512, workflow_id="basic_api_test",
+                                model=None, **params) -> str:
+        """Prépare le workflow avec les paramètres, le soumet à /prompt et retourne le prompt_id"""
+        workflow = await self._build_generation(prompt, width, height, workflow_id, model, params)
+        return await self._submit(workflow)
+
+    async def _run_cached(self, workflow: dict, timeout: float, use_cache: bool = True):
         """
-        Récupère les informations de la file d'attente ComfyUI
-        
+        Exécute un workflow (ou réutilise un résultat identique) et attend sa fin.
+
         Returns:
-            dict: État de la queue avec running et pending
+            (prompt_id, entrée d'historique, "hit" | "in_flight" | None)
+        """
+        if not use_cache:
+            prompt_id = await self._submit(workflow)
+            return prompt_id, await self.tracker.wait(prompt_id, timeout=timeout), None
+
+        key = workflow_key(workflow)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached["prompt_id"], {"outputs": cached["outputs"]}, "hit"
+        prompt_id = self.result_cache.in_flight(key)
+        if prompt_id is not None:
+            return prompt_id, await self.tracker.wait(prompt_id, timeout=timeout), "in_flight"
+
+        prompt_id = await self._submit(workflow)
+        self.result_cache.begin(key, prompt_id)
+        try:
+            entry = await self.tracker.wait(prompt_id, timeout=timeout)
+            self.result_cache.put(key, prompt_id, entry.get("outputs"))
+            return prompt_id, entry, None
+        finally:
+            self.result_cache.end(key, prompt_id)
+
+    async def generate_image(self, prompt, width=512, height=512, workflow_id="basic_api_test", model=None,
+                             use_cache=True, timeout=None, **params):
+        """
+        Generate an image using ComfyUI with a predefined workflow.
+        Automatically converts UI format workflows to API format.
+        Extra params (seed, steps, cfg, negative_prompt...) see GENERATION_PARAMETERS.
+        A workflow identical to a previous successful run returns its image without
+        re-rendering (use_cache=False to force a new run).
+        Waits at most `timeout` seconds (default: generation_timeout).
         """
+        workflow = await self._build_generation(prompt, width, height, workflow_id, model, params)
+
+        prompt_id, entry, cached = await self._run_cached(workflow, timeout or self.generation_timeout, use_cache)
+        url = self._image_url_from_history({prompt_id: entry}, prompt_id)
+        if not url:
+            raise ValueError(f"Prompt {prompt_id} terminé sans image en sortie")
+        logger.info(f"Image generated: {url}" + (f" (cache: {cached})" if cached else ""))
+        return url
+
+    async def generate_batch(self, workflow_id: str, jobs: list, timeout: Optional[float] = None,
+                             use_cache: bool = True):
+        """
+        Génère plusieurs variantes d'un même workflow.
+        Tous les jobs sont soumis à /prompt d'affilée (la queue ComfyUI reste pleine),
+        puis suivis ensemble ; les résultats sont produits au fil des fins de job.
+        Un job identique à une exécution réussie précédente (ou à un autre job du lot)
+        n'est pas soumis une seconde fois.
+
+        Args:
+            workflow_id: workflow commun à tous les jobs
+            jobs: liste de dicts de paramètres (voir GENERATION_PARAMETERS)
+            timeout: délai maximal global (s, défaut: generation_timeout)
+            use_cache: réutilise les résultats des workflows identiques
+
+        Yields:
+            dict: index, prompt_id, status (success|error), url, images, cached, error, elapsed
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + (timeout or self.generation_timeout)
+
+        pending = []
+        for index, params in enumerate(jobs):
+            params = dict(params or {})
+            try:
+                extra = {k: v for k, v in params.items() if k in GENERATION_PARAMETERS}
+                workflow = await self._build_generation(
+                    extra.pop("prompt", ""),
+                    extra.pop("width", 512),
+                    extra.pop("height", 512),
+                    workflow_id,
+                    extra.pop("model", None),
+                    extra,
+                )
+                key = workflow_key(workflow) if use_cache else None
+                cached = self.result_cache.get(key) if key else None
+                if cached is not None:
+                    urls = self._image_urls({"outputs": cached["outputs"]})
+                    yield {"index": index, "prompt_id": cached["prompt_id"], "status": "success",
+                           "url": urls[0] if urls else None, "images": urls, "cached": "hit",
+                           "elapsed": round(loop.time() - started, 3)}
+                    continue
+                prompt_id = self.result_cache.in_flight(key) if key else None
+                if prompt_id is not None:
+                    pending.append((index, prompt_id, None, "in_flight"))
+                    continue
+                prompt_id = await self._submit(workflow)
+                if key:
+                    self.result_cache.begin(key, prompt_id)
+                pending.append((index, prompt_id, key, None))
+            except Exception as e:
+                yield {"index": index, "prompt_id": None, "status": "error", "error": str(e),
+                       "elapsed": round(loop.time() - started, 3)}
+
+        async def _wait(index, prompt_id, key, cached):
+            try:
+                entry = await self.tracker.wait(prompt_id, timeout=max(deadline - loop.time(), 0.001))
+                if key:
+                    self.result_cache.put(key, prompt_id, entry.get("outputs"))
+                urls = self._image_urls(entry)
+                return {"index": index, "prompt_id": prompt_id, "status": "success",
+                        "url": urls[0] if urls else None, "images": urls, "cached": cached}
+            except Exception as e:
+                return {"index": index, "prompt_id": prompt_id, "status": "error", "error": str(e)}
+            finally:
+                if key:
+                    self.result_cache.end(key, prompt_id)
+
+        for done in asyncio.as_completed([_wait(*job) for job in pending]):
+            result = await done
+            result["elapsed"] = round(loop.time() - started, 3)
+            yield result
+
+    def _prompt_payload(self, workflow: dict) -> dict:
+        """Payload /prompt ; le client_id fait router les événements d'exécution vers notre /ws"""
+        return {"prompt": workflow, "client_id": self.tracker.client_id}
+
+    async def wait_for_completion(self, prompt_id: str, timeout: Optional[float] = None) -> dict:
+        """Attend la fin d'un prompt (au plus timeout s, défaut: generation_timeout) et retourne son entrée d'historique"""
+        return await self.tracker.wait(prompt_id, timeout=timeout or self.generation_timeout)
+
+    async def get_queue_info(self) -> dict:
+        """Récupère les informations de la file d'attente ComfyUI (running et pending)"""
         try:
-            response = requests.get(f"{self.base_url}/queue")
-            response.raise_for_status()
-            return response.json()
+            return await self._shared_get("/queue", self.read_ttl)
         except Exception as e:
             logger.error(f"Erreur lors de la récupération de la queue: {e}")
             return {"queue_running": [], "queue_pending": []}
-    
-    def get_object_info(self, node_class: str = None) -> dict:
-        """
-        Récupère les informations des nodes ComfyUI
-        
-        Args:
-            node_class: Classe spécifique à récupérer (optionnel)
-        
-        Returns:
-            dict: Informations sur les nodes disponibles
-        """
+
+    async def get_object_info(self, node_class: str = None) -> dict:
+        """Récupère les informations des nodes ComfyUI (toutes ou une classe)"""
         try:
-            if node_class:
-                response = requests.get(f"{self.base_url}/object_info/{node_class}")
-            else:
-                response = requests.get(f"{self.base_url}/object_info")
-            response.raise_for_status()
-            return response.json()
+            path = f"/object_info/{node_class}" if node_class else "/object_info"
+            return await self._shared_get(path)
         except Exception as e:
             logger.error(f"Erreur lors de la récupération de object_info: {e}")
             return {}
-    
-    def queue_prompt(self, workflow: dict) -> dict:
-        """Envoie un workflow à ComfyUI pour exécution"""
+
+    async def get_node_catalog(self, force_refresh: bool = False) -> NodeCatalog:
+        """Catalogue /object_info en cache (rechargé après node_catalog_ttl secondes)"""
+        async with self._node_catalog_lock:
+            catalog = self._node_catalog
+            if force_refresh or catalog is None or catalog.age() > self.node_catalog_ttl:
+                data = await self.get_object_info()
+                if data:
+                    catalog = self._node_catalog = NodeCatalog(data)
+                elif catalog is None:
+                    return NodeCatalog({})
+            return catalog
+
+    def invalidate_node_catalog(self):
+        """Force le rechargement du catalogue au prochain appel"""
+        self._node_catalog = None
+
+    async def queue_prompt(self, workflow: dict, use_cache: bool = True) -> dict:
+        """
+        Envoie un workflow à ComfyUI pour exécution.
+        Si le même graphe a déjà réussi (ou est en cours), son prompt_id est renvoyé
+        avec "cached" ("hit" : sorties et images incluses, "in_flight" : exécution en cours)
+        au lieu d'une nouvelle soumission.
+        """
+        key = workflow_key(workflow) if use_cache else None
+        if key:
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return {"prompt_id": cached["prompt_id"], "number": None, "node_errors": {}, "cached": "hit",
+                        "outputs": cached["outputs"], "images": self._image_urls({"outputs": cached["outputs"]})}
+            prompt_id = self.result_cache.in_flight(key)
+            if prompt_id is not None:
+                return {"prompt_id": prompt_id, "number": None, "node_errors": {}, "cached": "in_flight"}
         try:
-            payload = {"prompt": workflow}
-            response = requests.post(f"{self.base_url}/prompt", json=payload)
+            self.tracker.start()
+            response = await self._request("POST", "/prompt", json=self._prompt_payload(workflow))
             response.raise_for_status()
-            return response.json()
+            result = response.json()
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi du workflow: {e}")
             return {"status": "error", "message": str(e)}
-    
-    def get_history(self, prompt_id: str) -> dict:
-        """Récupère l'historique d'un prompt (outputs, status)"""
+        prompt_id = result.get("prompt_id") if isinstance(result, dict) else None
+        if prompt_id and self.on_submit is not None:
+            self.on_submit(prompt_id)
+        if prompt_id:
+            self.tracker.mark_submitted(prompt_id)
+            # Les agents suivent ce prompt via get_history : servi par le suivi groupé
+            self.history_tracker.watch(prompt_id)
+        if key and prompt_id:
+            self.result_cache.begin(key, prompt_id)
+            task = asyncio.get_running_loop().create_task(self._record_result(key, prompt_id))
+            self._record_tasks.add(task)
+            task.add_done_callback(self._record_tasks.discard)
+        return result
+
+    async def _record_result(self, key: str, prompt_id: str):
+        """Mémorise les sorties d'un prompt soumis par queue_prompt quand il réussit"""
         try:
-            resp = requests.get(f"{self.base_url}/history/{prompt_id}")
-            resp.raise_for_status()
-            return resp.json()
+            entry = await self.tracker.wait(prompt_id, timeout=self.result_record_timeout)
+            self.result_cache.put(key, prompt_id, entry.get("outputs"))
+        except Exception as e:
+            logger.debug(f"Résultat de {prompt_id} non mis en cache: {e}")
+        finally:
+            self.result_cache.end(key, prompt_id)
+
+    async def _fetch_history(self, prompt_id: str) -> dict:
+        return await self._shared_get(f"/history/{prompt_id}")
+
+    async def get_history(self, prompt_id: str) -> dict:
+        """
+        Récupère l'historique d'un prompt (outputs, status).
+        Un prompt suivi par history_tracker est servi depuis son dernier cycle, sans requête.
+        """
+        snapshot = self.history_tracker.snapshot(prompt_id)
+        if snapshot is not None:
+            return snapshot
+        try:
+            return await self._fetch_history(prompt_id)
         except Exception as e:
             logger.error(f"Erreur get_history({prompt_id}): {e}")
             return {"status": "error", "message": str(e)}
-   
-    def interrupt(self) -> dict:
-        """Sends an interrupt request to ComfyUI"""
+
+    async def interrupt(self, prompt_id: str = "") -> dict:
+        """Sends an interrupt request to ComfyUI (limited to prompt_id when given, on recent ComfyUI)"""
         try:
-            response = requests.post(f"{self.base_url}/interrupt")
+            response = await self._request("POST", "/interrupt", json={"prompt_id": prompt_id} if prompt_id else None)
             response.raise_for_status()
             logger.info("Interrupt request sent to ComfyUI.")
             return {"status": "success", "message": "Interrupt request sent"}
         except Exception as e:
             logger.error(f"Error sending interrupt request: {e}")
             return {"status": "error", "message": str(e)}
-   
+
     async def get_system_stats(self) -> dict:
         """Récupère les stats CPU, RAM, GPU du backend ComfyUI"""
-        import aiohttp
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/system_stats") as response:
-                    response.raise_for_status()
-                    return await response.json()
+            return await self._shared_get("/system_stats", self.read_ttl)
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des stats système: {e}")
             return {"status": "error", "message": str(e)}
@@ -0,0 +1,242 @@
+"""
+Suivi de fin d'exécution des prompts ComfyUI via son WebSocket (/ws).
+Une seule connexion persistante écoute les événements executing / executed /
+execution_error et réveille les appels en attente dès qu'un job se termine.
+Si la socket tombe, les attentes repassent en polling de /history (groupé pour
+tous les prompts quand un poll_history partagé est fourni).
+"""
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+# Nombre de jobs terminés gardés en mémoire (événement reçu avant l'appel à wait)
+MAX_FINISHED = 512
+
+
+class ExecutionError(RuntimeError):
+    """Le prompt s'est terminé en erreur ou a été interrompu côté ComfyUI"""
+
+
+def ws_url_from_base(base_url: str) -> str:
+    """http://host:8188 -> ws://host:8188/ws"""
+    if base_url.startswith("https://"):
+        return "wss://" + base_url[len("https://"):].rstrip("/") + "/ws"
+    if base_url.startswith("http://"):
+        return "ws://" + base_url[len("http://"):].rstrip("/") + "/ws"
+    return base_url.rstrip("/") + "/ws"
+
+
+class CompletionTracker:
+    """
+    Attente événementielle de la fin des prompts ComfyUI.
+
+    Args:
+        ws_url: URL du WebSocket ComfyUI (ex: ws://127.0.0.1:8188/ws)
+        fetch_history: coroutine prompt_id -> réponse de GET /history/{prompt_id}
+        poll_history: coroutine de même forme pour le polling de secours (ex: HistoryTracker.check) ;
+                      par défaut fetch_history
+        client_id: identifiant envoyé à ComfyUI (les prompts doivent être soumis avec le même)
+        poll_interval: période de polling quand la socket est indisponible (s)
+        safety_poll_interval: vérification de secours quand la socket est connectée (s)
+    """
+
+    def __init__(self, ws_url: str, fetch_history: Callable[[str], Awaitable[dict]],
+                 client_id: Optional[str] = None, poll_interval: float = 1.0,
+                 safety_poll_interval: float = 15.0, max_reconnect_delay: float = 30.0,
+                 poll_history: Optional[Callable[[str], Awaitable[dict]]] = None):
+        self.ws_url = ws_url
+        self.fetch_history = fetch_history
+        self.poll_history = poll_history or fetch_history
+        self.client_id = client_id or uuid.uuid4().hex
+        self.poll_interval = poll_interval
+        self.safety_poll_interval = safety_poll_interval
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: Dict[str, list] = {}
+        self._outputs: Dict[str, dict] = {}
+        self._finished: "OrderedDict[str, tuple]" = OrderedDict()
+        # Horodatages (monotonic) de soumission et de début d'exécution, pour on_timing
+        self._submitted: "OrderedDict[str, float]" = OrderedDict()
+        self._started: Dict[str, float] = {}
+        # on_timing(prompt_id, attente en file, durée d'exécution, status) à la fin de chaque prompt marqué
+        self.on_timing: Optional[Callable[[str, float, float, str], None]] = None
+        self.stats = {"events": 0, "completed_by_event": 0, "completed_by_poll": 0, "reconnects": 0}
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    def start(self):
+        """Démarre la connexion en tâche de fond (idempotent, nécessite une boucle active)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Arrête la tâche de fond et libère les attentes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        self.connected = False
+
+    async def _run(self):
+        delay = 1.0
+        url = f"{self.ws_url}?clientId={self.client_id}"
+        while True:
+            try:
+                async with websockets.connect(url, max_size=None) as ws:
+                    self.connected = True
+                    delay = 1.0
+                    logger.info(f"WebSocket ComfyUI connecté ({self.ws_url})")
+                    async for raw in ws:
+                        if isinstance(raw, bytes):
+                            continue  # aperçus binaires (previews)
+                        self._handle_message(raw)
+            except asyncio.CancelledError:
+                self.connected = False
+                raise
+            except Exception as e:
+                logger.warning(f"WebSocket ComfyUI indisponible ({e}), polling /history en secours")
+            self.connected = False
+            self.stats["reconnects"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    # ------------------------------------------------------------------
+    # Événements
+    # ------------------------------------------------------------------
+    def mark_submitted(self, prompt_id: str):
+        """Note l'heure de soumission d'un prompt (attente en file = début d'exécution - soumission)"""
+        self._submitted[prompt_id] = time.monotonic()
+        while len(self._submitted) > MAX_FINISHED:
+            stale, _ = self._submitted.popitem(last=False)
+            self._started.pop(stale, None)
+
+    def _handle_message(self, raw: str):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        msg_type = msg.get("type")
+        data = msg.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        self.stats["events"] += 1
+
+        if msg_type == "execution_start":
+            if prompt_id in self._submitted:
+                self._started[prompt_id] = time.monotonic()
+        elif msg_type == "executed":
+            node = data.get("node")
+            if node is not None and data.get("output") is not None:
+                self._outputs.setdefault(prompt_id, {})[str(node)] = data["output"]
+        elif msg_type == "execution_success" or (msg_type == "executing" and data.get("node") is None):
+            self._finish(prompt_id, "success", None)
+        elif msg_type == "execution_error":
+            message = data.get("exception_message") or "execution_error"
+            self._finish(prompt_id, "error", f"{data.get('node_type', '')} {message}".strip())
+        elif msg_type == "execution_interrupted":
+            self._finish(prompt_id, "error", "interrupted")
+
+    def _finish(self, prompt_id: str, status: str, detail: Optional[str]):
+        if prompt_id in self._finished:
+            return
+        outputs = self._outputs.pop(prompt_id, {})
+        submitted = self._submitted.pop(prompt_id, None)
+        started = self._started.pop(prompt_id, None)
+        if submitted is not None and started is not None and self.on_timing is not None:
+            now = time.monotonic()
+            try:
+                self.on_timing(prompt_id, started - submitted, now - started, status)
+            except Exception as e:
+                logger.debug(f"on_timing en échec: {e}")
+        self._finished[prompt_id] = (status, detail, outputs)
+        while len(self._finished) > MAX_FINISHED:
+            self._finished.popitem(last=False)
+        for fut in self._waiters.pop(prompt_id, []):
+            if not fut.done():
+                fut.set_result(self._finished[prompt_id])
+
+    # ------------------------------------------------------------------
+    # Attente
+    # ------------------------------------------------------------------
+    async def wait(self, prompt_id: str, timeout: float = 120) -> Dict[str, Any]:
+        """
+        Attend la fin d'un prompt.
+
+        Returns:
+            dict: entrée d'historique du prompt ({"outputs": ..., "status": ...})
+
+        Raises:
+            ExecutionError: le prompt a échoué ou a été interrompu
+            TimeoutError: pas de fin après `timeout` secondes
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        if prompt_id in self._finished:
+            return await self._resolve(prompt_id, self._finished[prompt_id])
+
+        fut = loop.create_future()
+        self._waiters.setdefault(prompt_id, []).append(fut)
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Image generation timed out after {timeout} seconds")
+                interval = self.safety_poll_interval if self.connected else self.poll_interval
+                try:
+                    finished = await asyncio.wait_for(asyncio.shield(fut), min(interval, remaining))
+                    self.stats["completed_by_event"] += 1
+                    return await self._resolve(prompt_id, finished)
+                except asyncio.TimeoutError:
+                    entry = await self._poll(prompt_id, self.poll_history)
+                    if entry is not None:
+                        self.stats["completed_by_poll"] += 1
+                        return self._check_entry(prompt_id, entry)
+        finally:
+            waiters = self._waiters.get(prompt_id)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+                if not waiters:
+                    del self._waiters[prompt_id]
+
+    async def _poll(self, prompt_id: str, fetch: Optional[Callable[[str], Awaitable[dict]]] = None) -> Optional[dict]:
+        try:
+            history = await (fetch or self.fetch_history)(prompt_id)
+        except Exception as e:
+            logger.warning(f"Polling /history/{prompt_id} en échec: {e}")
+            return None
+        if isinstance(history, dict) and prompt_id in history:
+            return history[prompt_id]
+        return None
+
+    async def _resolve(self, prompt_id: str, finished: tuple) -> dict:
+        status, detail, outputs = finished
+        if status != "success":
+            raise ExecutionError(f"Prompt {prompt_id} en échec: {detail}")
+        # L'historique fait foi ; à défaut on reconstruit à partir des événements 'executed'
+        entry = await self._poll(prompt_id)
+        if entry is None:
+            entry = {"outputs": outputs, "status": {"status_str": "success", "completed": True}}
+        return self._check_entry(prompt_id, entry)
+
+    def _check_entry(self, prompt_id: str, entry: dict) -> dict:
+        status = entry.get("status") or {}
+        if status.get("status_str") == "error":
+            raise ExecutionError(f"Prompt {prompt_id} en échec (voir get_history)")
+        return entry
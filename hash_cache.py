@@ -0,0 +1,154 @@
+"""
+Cache persistant des empreintes sha256 des gros fichiers (modèles).
+Les entrées sont indexées par chemin et validées par (taille, mtime, inode) ;
+les fichiers inconnus sont hachés dans un pool de threads et signalés "pending"
+au lieu de bloquer l'appelant.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 8 * 1024 * 1024          # lectures de 8 MB (hashlib relâche le GIL)
+FINGERPRINT_BLOCK = 1024 * 1024       # 1 MB en tête + 1 MB en queue
+
+
+def _file_key(st: os.stat_result) -> list:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def sha256_file(path: Path, block_size: int = READ_BLOCK) -> str:
+    """sha256 d'un fichier par grandes lectures dans un tampon réutilisé"""
+    h = hashlib.sha256()
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def fast_fingerprint(path: Path, block_size: int = FINGERPRINT_BLOCK) -> str:
+    """
+    Empreinte rapide (taille + premier et dernier MB). Suffit à reconnaître un
+    fichier, ne remplace pas un sha256 pour vérifier son intégrité.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha256()
+    h.update(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        h.update(f.read(block_size))
+        if size > block_size:
+            f.seek(max(size - block_size, block_size))
+            h.update(f.read(block_size))
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Args:
+        sidecar: fichier JSON où les empreintes sont conservées entre redémarrages
+        workers: threads de hachage en parallèle
+    """
+
+    def __init__(self, sidecar: Path, workers: int = 2):
+        self.sidecar = Path(sidecar)
+        self._entries: Dict[str, dict] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self.stats = {"hits": 0, "misses": 0, "hashed": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.sidecar, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries = data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Cache de hash illisible ({self.sidecar}): {e}")
+
+    def _save_locked(self):
+        try:
+            self.sidecar.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.sidecar.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.sidecar)
+        except Exception as e:
+            logger.warning(f"Écriture du cache de hash impossible: {e}")
+
+    def lookup(self, path: Path) -> Optional[str]:
+        """sha256 connu et toujours valide pour ce fichier, sinon None"""
+        path = Path(path)
+        st = path.stat()
+        with self._lock:
+            entry = self._entries.get(str(path))
+            if entry and entry.get("key") == _file_key(st):
+                self.stats["hits"] += 1
+                return entry["sha256"]
+        return None
+
+    def get(self, path: Path) -> dict:
+        """
+        Returns:
+            {"status": "cached", "sha256": ...} ou {"status": "pending"} (hachage lancé en arrière-plan)
+        """
+        sha = self.lookup(path)
+        if sha is not None:
+            return {"status": "cached", "sha256": sha}
+        self.schedule(path)
+        return {"status": "pending", "sha256": None}
+
+    def schedule(self, path: Path) -> Future:
+        """Lance (une seule fois par fichier) le calcul du sha256 dans le pool"""
+        key = str(Path(path))
+        with self._lock:
+            fut = self._pending.get(key)
+            if fut is None:
+                self.stats["misses"] += 1
+                fut = self._pool.submit(self._hash, Path(path))
+                self._pending[key] = fut
+            return fut
+
+    def compute(self, path: Path, timeout: Optional[float] = None) -> str:
+        """sha256 du fichier, en attendant le calcul si nécessaire"""
+        sha = self.lookup(path)
+        if sha is not None:
+            return sha
+        return self.schedule(path).result(timeout=timeout)
+
+    def _hash(self, path: Path) -> str:
+        key = str(path)
+        try:
+            st = path.stat()
+            sha = sha256_file(path)
+            # Fichier modifié pendant la lecture : on ne met pas en cache
+            if _file_key(path.stat()) == _file_key(st):
+                with self._lock:
+                    self._entries[key] = {"key": _file_key(st), "sha256": sha}
+                    self.stats["hashed"] += 1
+                    self._save_locked()
+            return sha
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
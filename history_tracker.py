@@ -0,0 +1,199 @@
+"""
+Suivi groupé des prompts en cours par polling de ComfyUI.
+Au lieu d'un GET /history/{prompt_id} par appelant et par seconde, un seul cycle
+interroge /queue, puis /history?max_items=N pour les prompts sortis de la file,
+et répond à tous les appelants à partir de ces deux réponses. La période
+s'allonge quand la file est longue (les jobs suivis ne finiront pas de sitôt).
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Période du cycle : minimum, ajout par job en file, maximum (s)
+MIN_TICK = 0.5
+TICK_PER_QUEUED = 0.25
+MAX_TICK = 5.0
+# Taille minimale de la page /history?max_items
+HISTORY_BATCH = 64
+# Entrées d'historique terminées gardées pour les lectures suivantes
+MAX_FINISHED = 512
+
+
+class HistoryTracker:
+    """
+    Args:
+        fetch_json: coroutine chemin -> JSON d'un GET ComfyUI (lève en cas d'erreur)
+        min_interval / max_interval: bornes de la période du cycle (s)
+        per_queued: allongement de la période par job présent dans la file (s)
+        history_batch: taille minimale de la page /history demandée
+    """
+
+    def __init__(self, fetch_json: Callable[[str], Awaitable[dict]], min_interval: float = MIN_TICK,
+                 max_interval: float = MAX_TICK, per_queued: float = TICK_PER_QUEUED,
+                 history_batch: int = HISTORY_BATCH):
+        self.fetch_json = fetch_json
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.per_queued = per_queued
+        self.history_batch = history_batch
+        self.interval = min_interval
+        # prompt_id suivi -> futures des appelants qui attendent le prochain cycle
+        self._watched: Dict[str, list] = {}
+        self._queued: set = set()
+        # Mis en file pendant la requête /queue du cycle en cours (absents de sa réponse)
+        self._submitted: set = set()
+        self._tick_at: Optional[float] = None
+        self._finished: "OrderedDict[str, dict]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"ticks": 0, "queue_requests": 0, "history_requests": 0, "resolved": 0, "errors": 0}
+
+    # ------------------------------------------------------------------
+    # Enregistrement et lecture
+    # ------------------------------------------------------------------
+    def watch(self, prompt_id: str):
+        """Suit un prompt qui vient d'être mis en file, jusqu'à sa sortie (démarre le cycle si besoin)"""
+        if prompt_id not in self._finished:
+            self._watched.setdefault(prompt_id, [])
+            self._queued.add(prompt_id)
+            self._submitted.add(prompt_id)
+            self._ensure_running()
+
+    def snapshot(self, prompt_id: str) -> Optional[dict]:
+        """
+        Historique connu sans requête : {prompt_id: entrée} si terminé, {} si le prompt
+        était encore en file au dernier cycle (récent), None si l'état est inconnu.
+        """
+        entry = self._finished.get(prompt_id)
+        if entry is not None:
+            return {prompt_id: entry}
+        if prompt_id in self._watched and prompt_id in self._queued and self._tick_at is not None:
+            if asyncio.get_running_loop().time() - self._tick_at <= self.interval:
+                return {}
+        return None
+
+    async def check(self, prompt_id: str) -> dict:
+        """
+        Historique du prompt au prochain cycle ({} tant qu'il n'est pas terminé).
+
+        Raises:
+            Exception: erreur de la requête du cycle
+        """
+        snapshot = self._finished.get(prompt_id)
+        if snapshot is not None:
+            return {prompt_id: snapshot}
+        fut = asyncio.get_running_loop().create_future()
+        self._watched.setdefault(prompt_id, []).append(fut)
+        self._ensure_running()
+        return await fut
+
+    # ------------------------------------------------------------------
+    # Cycle
+    # ------------------------------------------------------------------
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        for waiters in self._watched.values():
+            for fut in waiters:
+                if not fut.done():
+                    fut.cancel()
+        self._watched.clear()
+
+    async def _run(self):
+        while self._watched:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.interval = self.max_interval
+                logger.warning(f"Suivi groupé de /history en échec: {e}")
+                self._fail_waiters(e)
+            if self._watched:
+                await asyncio.sleep(self.interval)
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        self.stats["ticks"] += 1
+        self.stats["queue_requests"] += 1
+        self._submitted = set()
+        queue = await self.fetch_json("/queue")
+        items = (queue.get("queue_running") or []) + (queue.get("queue_pending") or [])
+        self._queued = {item[1] for item in items if isinstance(item, (list, tuple)) and len(item) > 1}
+        self._queued |= self._submitted
+        self._tick_at = loop.time()
+        self.interval = min(self.max_interval, self.min_interval + self.per_queued * len(items))
+
+        done = [pid for pid in self._watched if pid not in self._queued]
+        history: dict = {}
+        if done:
+            self.stats["history_requests"] += 1
+            size = max(self.history_batch, len(done))
+            history = dict(await self.fetch_json(f"/history?max_items={size}"))
+            # Prompts trop anciens pour la page : demande individuelle (rare)
+            missing = [pid for pid in done if pid not in history]
+            if missing:
+                self.stats["history_requests"] += len(missing)
+                pages = await asyncio.gather(*(self.fetch_json(f"/history/{pid}") for pid in missing))
+                for page in pages:
+                    if isinstance(page, dict):
+                        history.update(page)
+
+        for pid in list(self._watched):
+            if pid in self._queued:
+                self._reply(pid, {}, keep=True)
+            elif pid in history:
+                self._remember(pid, history[pid])
+                self.stats["resolved"] += 1
+                self._reply(pid, {pid: history[pid]}, keep=False)
+            else:
+                # Ni en file ni dans l'historique : prompt inconnu, on cesse de le suivre
+                self._reply(pid, {}, keep=False)
+
+    def _reply(self, prompt_id: str, result: dict, keep: bool):
+        waiters = self._watched.get(prompt_id, [])
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(result)
+        if keep:
+            self._watched[prompt_id] = []
+        else:
+            self._watched.pop(prompt_id, None)
+
+    def _fail_waiters(self, error: Exception):
+        """
+        Transmet l'erreur du cycle aux appelants. Un prompt que personne n'attend
+        (suivi par watch() seul, ou dont les appelants ont déjà reçu une erreur) cesse
+        d'être suivi : sans cela une panne de ComfyUI ferait tourner le cycle indéfiniment.
+        """
+        for pid, waiters in list(self._watched.items()):
+            if not waiters:
+                del self._watched[pid]
+                self._queued.discard(pid)
+                continue
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_exception(error)
+            self._watched[pid] = []
+
+    def _remember(self, prompt_id: str, entry: dict):
+        self._finished[prompt_id] = entry
+        self._finished.move_to_end(prompt_id)
+        while len(self._finished) > MAX_FINISHED:
+            self._finished.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "watched": len(self._watched), "interval_s": round(self.interval, 3)}
@@ -0,0 +1,186 @@
+"""
+Métriques au format texte Prometheus (exposées sur /metrics).
+Compteurs et histogrammes en mémoire, sans dépendance : une observation coûte
+une recherche dichotomique dans les bornes et trois incréments. Les valeurs déjà
+tenues ailleurs (caches, WebSocket, disjoncteurs) sont lues au moment du rendu
+par des collecteurs.
+"""
+
+import time
+import bisect
+import logging
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from fastmcp.server.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bornes des histogrammes (s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+GENERATION_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# Échantillons d'un collecteur : (nom, type, aide, [(labels, valeur), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [compte par borne (non cumulé, dernier = +Inf), somme, nombre]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class MetricsRegistry:
+    """Métriques du serveur ; render() produit le texte servi sur /metrics"""
+
+    def __init__(self, prefix: str = "comfyui_mcp"):
+        self.prefix = prefix
+        self._metrics: list = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+        self.tool_calls = self.counter("tool_calls_total", "Appels d'outils MCP", ("tool",))
+        self.tool_errors = self.counter("tool_errors_total", "Appels d'outils MCP en erreur", ("tool",))
+        self.tool_duration = self.histogram("tool_duration_seconds", "Durée des appels d'outils MCP", ("tool",))
+        self.upstream_requests = self.counter(
+            "upstream_requests_total", "Requêtes HTTP vers ComfyUI", ("backend", "method", "endpoint", "status"))
+        self.upstream_duration = self.histogram(
+            "upstream_request_duration_seconds", "Durée des requêtes HTTP vers ComfyUI",
+            ("backend", "method", "endpoint"))
+        self.generation_queue_wait = self.histogram(
+            "generation_queue_wait_seconds", "Attente en file ComfyUI avant exécution", ("backend",),
+            GENERATION_BUCKETS)
+        self.generation_execution = self.histogram(
+            "generation_execution_seconds", "Durée d'exécution ComfyUI", ("backend", "status"), GENERATION_BUCKETS)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(f"{self.prefix}_{name}", help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.prefix}_{name}", help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """collector() renvoie des familles (nom sans préfixe, type, aide, échantillons)"""
+        self._collectors.append(collector)
+
+    # Points d'entrée branchés sur le client ComfyUI (on_request / on_timing)
+    def observe_upstream(self, backend: str, method: str, endpoint: str, status, seconds: float):
+        self.upstream_requests.inc(backend, method, endpoint, status)
+        self.upstream_duration.observe(seconds, backend, method, endpoint)
+
+    def observe_generation(self, backend: str, prompt_id: str, queue_wait: float, execution: float, status: str):
+        self.generation_queue_wait.observe(queue_wait, backend)
+        self.generation_execution.observe(execution, backend, status)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Collecteur de métriques en échec: {e}")
+                continue
+            for name, kind, help, samples in families:
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {help}")
+                lines.append(f"# TYPE {full} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{full}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class ToolMetricsMiddleware(Middleware):
+    """
+    Compte et chronomètre chaque appel d'outil MCP. Un appel est en erreur s'il lève,
+    si le résultat est marqué is_error, ou s'il renvoie {"status": "error"}.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def on_call_tool(self, context, call_next):
+        name = getattr(context.message, "name", "?")
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await call_next(context)
+            structured = getattr(result, "structured_content", None)
+            failed = bool(getattr(result, "is_error", False)) or (
+                isinstance(structured, dict) and structured.get("status") == "error")
+            return result
+        finally:
+            registry = self.registry
+            registry.tool_calls.inc(name)
+            if failed:
+                registry.tool_errors.inc(name)
+            registry.tool_duration.observe(time.perf_counter() - started, name)
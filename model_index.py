@@ -0,0 +1,248 @@
+"""
+Index de la bibliothèque de modèles (COMFYUI_ROOT/models).
+Les en-têtes safetensors sont lus directement (8 octets de longueur + JSON),
+sans charger de tenseurs ni importer torch. Le rafraîchissement est incrémental :
+un fichier dont la taille et le mtime n'ont pas changé n'est pas relu.
+"""
+
+import os
+import json
+import struct
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_EXTS = {".safetensors", ".sft", ".ckpt", ".pt", ".pth", ".bin", ".gguf"}
+MAX_HEADER_BYTES = 100 * 1024 * 1024
+MAX_METADATA_VALUE = 512  # les valeurs plus longues (ex: ss_tag_frequency) sont tronquées dans l'index
+
+# Préfixes de clés de tenseurs caractéristiques d'une architecture
+ARCHITECTURE_HINTS = (
+    ("double_blocks.", "flux"),
+    ("model.diffusion_model.double_blocks.", "flux"),
+    ("joint_blocks.", "sd3"),
+    ("model.diffusion_model.joint_blocks.", "sd3"),
+    ("conditioner.embedders.1.", "sdxl"),
+    ("lora_te2_", "sdxl"),
+    ("cond_stage_model.transformer.", "sd1"),
+    ("cond_stage_model.model.", "sd2"),
+)
+
+
+def read_safetensors_header(path: Path) -> dict:
+    """
+    Lit l'en-tête JSON d'un fichier safetensors.
+
+    Raises:
+        ValueError: fichier tronqué ou en-tête invalide
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError("Fichier safetensors tronqué")
+        (length,) = struct.unpack("<Q", prefix)
+        if length <= 0 or length > MAX_HEADER_BYTES:
+            raise ValueError(f"Taille d'en-tête invalide ({length})")
+        raw = f.read(length)
+    if len(raw) != length:
+        raise ValueError("En-tête safetensors tronqué")
+    header = json.loads(raw)
+    if not isinstance(header, dict):
+        raise ValueError("En-tête safetensors invalide")
+    return header
+
+
+def guess_base_model(metadata: dict, tensor_names) -> Optional[str]:
+    """Architecture de base d'après les métadonnées, sinon d'après les noms de tenseurs"""
+    for key in ("modelspec.architecture", "ss_base_model_version", "ss_sd_model_name"):
+        value = metadata.get(key)
+        if value:
+            return str(value)
+    for name in tensor_names:
+        for prefix, arch in ARCHITECTURE_HINTS:
+            if name.startswith(prefix):
+                return arch
+    return None
+
+
+def summarize_safetensors(header: dict, trim_metadata: bool = True) -> dict:
+    """Nombre de tenseurs, dtypes, total de paramètres et métadonnées d'un en-tête"""
+    metadata = header.get("__metadata__") or {}
+    dtypes: Dict[str, int] = {}
+    parameters = 0
+    names = []
+    for name, spec in header.items():
+        if name == "__metadata__" or not isinstance(spec, dict):
+            continue
+        names.append(name)
+        dtype = spec.get("dtype", "?")
+        dtypes[dtype] = dtypes.get(dtype, 0) + 1
+        count = 1
+        for dim in spec.get("shape") or []:
+            count *= int(dim)
+        parameters += count
+    if trim_metadata:
+        metadata = {k: (v if not isinstance(v, str) or len(v) <= MAX_METADATA_VALUE
+                        else v[:MAX_METADATA_VALUE] + "…")
+                    for k, v in metadata.items()}
+    return {
+        "tensor_count": len(names),
+        "dtypes": dtypes,
+        "parameters": parameters,
+        "base_model": guess_base_model(metadata, names),
+        "metadata": metadata,
+    }
+
+
+class ModelIndex:
+    """
+    Args:
+        models_dir: dossier models de ComfyUI
+        sidecar: fichier JSON où l'index est conservé entre redémarrages (optionnel)
+        min_refresh_interval: deux parcours du disque sont espacés d'au moins ce délai (s)
+    """
+
+    def __init__(self, models_dir: Path, sidecar: Optional[Path] = None, min_refresh_interval: float = 5.0):
+        self.models_dir = Path(models_dir)
+        self.sidecar = Path(sidecar) if sidecar else None
+        self.min_refresh_interval = min_refresh_interval
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self.stats = {"refreshes": 0, "parsed": 0, "reused": 0}
+        self._load()
+
+    def _load(self):
+        if not self.sidecar:
+            return
+        try:
+            with open(self.sidecar, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get("models_dir") == str(self.models_dir):
+                self._entries = data.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Index des modèles illisible ({self.sidecar}): {e}")
+
+    def _save_locked(self):
+        if not self.sidecar:
+            return
+        try:
+            self.sidecar.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.sidecar.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"models_dir": str(self.models_dir), "entries": self._entries}, f)
+            os.replace(tmp, self.sidecar)
+        except Exception as e:
+            logger.warning(f"Écriture de l'index des modèles impossible: {e}")
+
+    def refresh(self, force: bool = False):
+        """Parcourt models/ et ne relit que les fichiers nouveaux ou modifiés"""
+        with self._lock:
+            if not force and self._entries and time.monotonic() - self._refreshed_at < self.min_refresh_interval:
+                return
+            self.stats["refreshes"] += 1
+            seen = set()
+            changed = False
+            visited_real = set()
+            for dirpath, dirnames, filenames in os.walk(self.models_dir, followlinks=True):
+                # Protection contre les boucles de liens symboliques / jonctions
+                try:
+                    st = os.stat(dirpath)
+                except OSError:
+                    dirnames[:] = []
+                    continue
+                real_key = (st.st_dev, st.st_ino)
+                if real_key in visited_real and st.st_ino:
+                    dirnames[:] = []
+                    continue
+                visited_real.add(real_key)
+                for filename in filenames:
+                    ext = os.path.splitext(filename)[1].lower()
+                    if ext not in MODEL_EXTS:
+                        continue
+                    path = Path(dirpath) / filename
+                    rel = path.relative_to(self.models_dir).as_posix()
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+                    seen.add(rel)
+                    entry = self._entries.get(rel)
+                    if entry and entry["size_bytes"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                        self.stats["reused"] += 1
+                        continue
+                    self._entries[rel] = self._describe(path, rel, ext, st)
+                    self.stats["parsed"] += 1
+                    changed = True
+            for rel in list(self._entries):
+                if rel not in seen:
+                    del self._entries[rel]
+                    changed = True
+            if changed:
+                self._save_locked()
+            self._refreshed_at = time.monotonic()
+
+    def _describe(self, path: Path, rel: str, ext: str, st: os.stat_result) -> dict:
+        entry = {
+            "name": rel,
+            "type": rel.split("/", 1)[0] if "/" in rel else "",
+            "extension": ext,
+            "size_bytes": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+        if ext in (".safetensors", ".sft"):
+            try:
+                entry.update(summarize_safetensors(read_safetensors_header(path)))
+            except Exception as e:
+                entry["error"] = str(e)
+        return entry
+
+    def search(self, query: str = "", model_type: str = "", base_model: str = "",
+               min_size_bytes: int = 0, max_size_bytes: int = 0,
+               offset: int = 0, limit: int = 50, with_metadata: bool = False) -> dict:
+        """
+        Recherche dans l'index.
+
+        Args:
+            query: sous-chaîne du chemin relatif (insensible à la casse)
+            model_type: dossier de premier niveau (checkpoints, loras, vae...)
+            base_model: sous-chaîne de l'architecture détectée (sdxl, flux...)
+            min_size_bytes, max_size_bytes: bornes de taille (0 = sans borne)
+        """
+        self.refresh()
+        query = query.lower()
+        model_type = model_type.lower()
+        base_model = base_model.lower()
+        with self._lock:
+            matches = []
+            for rel in sorted(self._entries):
+                entry = self._entries[rel]
+                if query and query not in rel.lower():
+                    continue
+                if model_type and entry["type"].lower() != model_type:
+                    continue
+                if base_model and base_model not in str(entry.get("base_model") or "").lower():
+                    continue
+                if min_size_bytes and entry["size_bytes"] < min_size_bytes:
+                    continue
+                if max_size_bytes and entry["size_bytes"] > max_size_bytes:
+                    continue
+                matches.append(entry)
+        offset = max(offset, 0)
+        page = matches[offset:offset + max(limit, 1)]
+        hidden = {"mtime_ns"} if with_metadata else {"mtime_ns", "metadata"}
+        page = [{k: v for k, v in e.items() if k not in hidden} for e in page]
+        next_offset = offset + len(page)
+        return {
+            "total": len(matches),
+            "offset": offset,
+            "count": len(page),
+            "next_offset": next_offset if next_offset < len(matches) else None,
+            "models": page,
+        }
@@ -0,0 +1,238 @@
+"""
+Documentation statique des custom nodes ComfyUI.
+Chaque fichier .py est analysé avec `ast` (sans l'importer) ; les résultats sont
+mis en cache par fichier (mtime, taille) et seuls les fichiers modifiés sont
+réanalysés, dans un petit pool de threads quand ils sont nombreux. Pas de pool de
+processus : sous Windows (spawn) chaque worker réimporterait server.py, et sous
+Linux il forkerait le serveur multi-thread, pour une simple analyse ast.
+"""
+
+import os
+import ast
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_ITEMS = 50               # classes / clés de mapping listées par fichier
+PARALLEL_THRESHOLD = 32      # en dessous, l'analyse reste dans le thread appelant
+MAX_WORKERS = 4              # threads d'analyse au plus (lectures de fichiers en parallèle)
+NODE_ATTRIBUTES = ("RETURN_TYPES", "RETURN_NAMES", "FUNCTION", "CATEGORY", "OUTPUT_NODE", "DESCRIPTION")
+
+
+def _static_value(node: ast.AST) -> Any:
+    """
+    Valeur d'une expression quand elle est déterminable statiquement ; les parties
+    dynamiques (appels, variables) sont remplacées par leur source entre chevrons.
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.Tuple, ast.List)):
+        return [_static_value(elt) for elt in node.elts]
+    if isinstance(node, ast.Dict):
+        result = {}
+        for key, value in zip(node.keys, node.values):
+            if key is None:
+                result["**"] = f"<{ast.unparse(value)}>"
+            else:
+                k = _static_value(key)
+                result[k if isinstance(k, (str, int, float, bool)) else str(k)] = _static_value(value)
+        return result
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    return f"<{ast.unparse(node)}>"
+
+
+def _input_types(func: ast.FunctionDef) -> Any:
+    """Valeur retournée par INPUT_TYPES si c'est un unique return en tête de fonction"""
+    returns = [stmt for stmt in func.body if isinstance(stmt, ast.Return) and stmt.value is not None]
+    if len(returns) != 1:
+        return None
+    value = returns[0].value
+    if isinstance(value, ast.Name):
+        # return inputs  (variable locale construite juste avant)
+        for stmt in func.body:
+            if isinstance(stmt, ast.Assign) and any(isinstance(t, ast.Name) and t.id == value.id for t in stmt.targets):
+                return _static_value(stmt.value)
+        return None
+    return _static_value(value)
+
+
+def _describe_class(cls: ast.ClassDef) -> dict:
+    info = {}
+    for stmt in cls.body:
+        if isinstance(stmt, ast.Assign):
+            for target in stmt.targets:
+                if isinstance(target, ast.Name) and target.id in NODE_ATTRIBUTES:
+                    info[target.id] = _static_value(stmt.value)
+        elif isinstance(stmt, ast.FunctionDef) and stmt.name == "INPUT_TYPES":
+            value = _input_types(stmt)
+            if value is not None:
+                info["INPUT_TYPES"] = value
+    return info
+
+
+def _mapping_entries(tree: ast.Module) -> List[tuple]:
+    """(clé, nom de classe) déclarés dans NODE_CLASS_MAPPINGS, quelle que soit la forme"""
+    entries = []
+
+    def add(node, key, value):
+        entries.append(((node.lineno, node.col_offset), key, value.id if isinstance(value, ast.Name) else None))
+
+    def add_dict(node):
+        if isinstance(node, ast.Dict):
+            for key, value in zip(node.keys, node.values):
+                if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                    add(key, key.value, value)
+
+    for node in ast.walk(tree):
+        # NODE_CLASS_MAPPINGS = {...}  /  NODE_CLASS_MAPPINGS: dict = {...}
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+            value = node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets = [node.target]
+            value = node.value
+        else:
+            targets = []
+            value = None
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id == "NODE_CLASS_MAPPINGS":
+                add_dict(value)
+            # NODE_CLASS_MAPPINGS["Key"] = Class
+            elif (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name)
+                  and target.value.id == "NODE_CLASS_MAPPINGS"
+                  and isinstance(target.slice, ast.Constant) and isinstance(target.slice.value, str)):
+                add(target, target.slice.value, value)
+        # NODE_CLASS_MAPPINGS.update({...})
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "update"
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == "NODE_CLASS_MAPPINGS"
+                and node.args):
+            add_dict(node.args[0])
+    # ast.walk parcourt en largeur : on rétablit l'ordre du source
+    entries.sort(key=lambda e: e[0])
+    return [(key, class_name) for _, key, class_name in entries]
+
+
+def parse_node_file(path: str) -> dict:
+    """
+    Analyse un fichier de custom nodes (sans état partagé : exécutable depuis le pool de threads).
+
+    Returns:
+        dict: classes, node_keys et, par node, les attributs déterminables statiquement
+    """
+    item: Dict[str, Any] = {"classes": []}
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            source = f.read()
+        tree = ast.parse(source, filename=path)
+    except SyntaxError as e:
+        item["error"] = f"SyntaxError ligne {e.lineno}: {e.msg}"
+        return item
+    except Exception as e:
+        item["error"] = str(e)
+        return item
+
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    item["classes"] = list(classes)[:MAX_ITEMS]
+
+    entries = _mapping_entries(tree)
+    if entries:
+        item["node_keys"] = [key for key, _ in entries][:MAX_ITEMS]
+        nodes = {}
+        for key, class_name in entries[:MAX_ITEMS]:
+            cls = classes.get(class_name) if class_name else None
+            details = _describe_class(cls) if cls is not None else {}
+            nodes[key] = {"class": class_name, **details}
+        item["nodes"] = nodes
+    return item
+
+
+class NodeAutodoc:
+    """
+    Cache des analyses par fichier de custom_nodes/<dossier>/*.py.
+
+    Args:
+        custom_nodes_dir: dossier custom_nodes de ComfyUI
+        max_workers: threads d'analyse (défaut: min(MAX_WORKERS, nombre de CPU))
+    """
+
+    def __init__(self, custom_nodes_dir: Path, max_workers: Optional[int] = None):
+        self.custom_nodes_dir = Path(custom_nodes_dir)
+        self.max_workers = max(1, max_workers or min(MAX_WORKERS, os.cpu_count() or 1))
+        self._cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.stats = {"parsed": 0, "reused": 0}
+
+    def _parse_many(self, paths: List[str]) -> List[dict]:
+        if len(paths) < PARALLEL_THRESHOLD:
+            return [parse_node_file(p) for p in paths]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="node-autodoc")
+        try:
+            return list(self._pool.map(parse_node_file, paths))
+        except Exception as e:
+            logger.warning(f"Analyse parallèle indisponible ({e}), analyse séquentielle")
+            self._pool = None
+            return [parse_node_file(p) for p in paths]
+
+    def collect(self, folder: str = "", details: bool = False) -> List[dict]:
+        """
+        Documentation de tous les dossiers de custom_nodes (ou d'un seul).
+
+        Args:
+            folder: nom d'un dossier de custom_nodes (vide = tous)
+            details: inclut INPUT_TYPES / RETURN_TYPES / ... par node
+        """
+        with self._lock:
+            layout = []
+            stale = []
+            seen = set()
+            for folder_path in sorted(self.custom_nodes_dir.iterdir()):
+                if not folder_path.is_dir() or (folder and folder_path.name != folder):
+                    continue
+                files = []
+                for py in sorted(folder_path.glob("*.py")):
+                    key = str(py)
+                    try:
+                        st = py.stat()
+                    except OSError:
+                        continue
+                    seen.add(key)
+                    cached = self._cache.get(key)
+                    if cached is None or cached[0] != (st.st_mtime_ns, st.st_size):
+                        stale.append((key, (st.st_mtime_ns, st.st_size)))
+                    files.append((py.name, key))
+                layout.append((folder_path.name, files))
+
+            if stale:
+                results = self._parse_many([key for key, _ in stale])
+                for (key, signature), result in zip(stale, results):
+                    self._cache[key] = (signature, result)
+            self.stats["parsed"] += len(stale)
+            self.stats["reused"] += len(seen) - len(stale)
+            if not folder:
+                for key in list(self._cache):
+                    if key not in seen:
+                        del self._cache[key]
+
+            data = []
+            for folder_name, files in layout:
+                entry = {"folder": folder_name, "files": []}
+                for file_name, key in files:
+                    item = {"file": file_name, **self._cache[key][1]}
+                    if not details:
+                        item.pop("nodes", None)
+                    entry["files"].append(item)
+                if entry["files"]:
+                    data.append(entry)
+            return data
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,147 @@
+"""
+Index incrémental du dossier output/ de ComfyUI.
+Seuls les dossiers dont le mtime a changé sont relus ; dans un dossier relu, chaque
+fichier est re-stat (DirEntry.stat : gratuit sous Windows, un stat sous POSIX) pour
+que taille et date suivent les fichiers réécrits sur place. Limite : un fichier
+réécrit sur place dans un dossier qui n'a ni gagné ni perdu d'entrée (mtime du
+dossier inchangé) garde son ancienne date jusqu'à la prochaine relecture du dossier.
+Les requêtes "N plus récents" utilisent une sélection top-k au lieu d'un tri complet.
+"""
+
+import os
+import heapq
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _DirEntry:
+    __slots__ = ("mtime_ns", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: Dict[str, Tuple[int, float]], subdirs: List[str]):
+        self.mtime_ns = mtime_ns
+        self.files = files        # nom -> (taille, mtime)
+        self.subdirs = subdirs    # chemins relatifs des sous-dossiers
+
+
+class OutputIndex:
+    """
+    Index en mémoire des fichiers d'un dossier (récursif), mis à jour à la demande.
+
+    Args:
+        root: dossier indexé
+        min_refresh_interval: deux rafraîchissements sont espacés d'au moins ce délai (s)
+    """
+
+    def __init__(self, root: Path, min_refresh_interval: float = 1.0):
+        self.root = Path(root)
+        self.min_refresh_interval = min_refresh_interval
+        self._dirs: Dict[str, _DirEntry] = {}
+        self._lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self.stats = {"refreshes": 0, "dirs_rescanned": 0, "files_stat": 0}
+
+    def refresh(self, force: bool = False):
+        """Met l'index à jour (ne relit que les dossiers modifiés)"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._dirs and now - self._refreshed_at < self.min_refresh_interval:
+                return
+            self._refresh_locked()
+            self._refreshed_at = time.monotonic()
+
+    def _refresh_locked(self):
+        self.stats["refreshes"] += 1
+        seen = set()
+        visited_real = set()
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            path = self.root / rel if rel else self.root
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # Protection contre les boucles de liens symboliques / jonctions
+            real_key = (st.st_dev, st.st_ino)
+            if real_key in visited_real and st.st_ino:
+                continue
+            visited_real.add(real_key)
+            seen.add(rel)
+
+            entry = self._dirs.get(rel)
+            if entry is None or entry.mtime_ns != st.st_mtime_ns:
+                entry = self._scan_dir(path, rel, st.st_mtime_ns)
+                self._dirs[rel] = entry
+            stack.extend(entry.subdirs)
+
+        for rel in list(self._dirs):
+            if rel not in seen:
+                del self._dirs[rel]
+
+    def _scan_dir(self, path: Path, rel: str, mtime_ns: int) -> _DirEntry:
+        self.stats["dirs_rescanned"] += 1
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for de in it:
+                    try:
+                        if de.is_dir():
+                            subdirs.append(f"{rel}/{de.name}" if rel else de.name)
+                            continue
+                        if not de.is_file():
+                            continue
+                        # Même nom et même inode ne suffisent pas : un fichier réécrit
+                        # sur place (troncature + écriture) change de taille et de date
+                        st = de.stat()
+                        self.stats["files_stat"] += 1
+                        files[de.name] = (st.st_size, st.st_mtime)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"Lecture impossible de {path}: {e}")
+        return _DirEntry(mtime_ns, files, subdirs)
+
+    def _iter_files(self, exts: Optional[set], subfolder: str, name_contains: str) -> Iterable[Tuple[float, int, str, str]]:
+        subfolder = subfolder.strip("/\\").replace("\\", "/")
+        name_contains = name_contains.lower()
+        for rel, entry in self._dirs.items():
+            if subfolder and rel != subfolder and not rel.startswith(subfolder + "/"):
+                continue
+            for name, (size, mtime) in entry.files.items():
+                if exts is not None:
+                    dot = name.rfind(".")
+                    if dot < 0 or name[dot + 1:].lower() not in exts:
+                        continue
+                if name_contains and name_contains not in name.lower():
+                    continue
+                yield (mtime, size, rel, name)
+
+    def newest(self, limit: int = 100, exts: Optional[set] = None, subfolder: str = "",
+               name_contains: str = "") -> List[Tuple[float, int, str, str]]:
+        """
+        Les `limit` fichiers les plus récents (sélection top-k).
+
+        Args:
+            exts: extensions autorisées sans le point (None = toutes)
+            subfolder: limite la recherche à un sous-dossier (récursif)
+            name_contains: filtre sur le nom de fichier (insensible à la casse)
+
+        Returns:
+            liste de (mtime, taille, sous-dossier relatif, nom), du plus récent au plus ancien
+        """
+        self.refresh()
+        with self._lock:
+            return heapq.nlargest(max(limit, 0), self._iter_files(exts, subfolder, name_contains),
+                                  key=lambda item: item[0])
+
+    def count(self, exts: Optional[set] = None, subfolder: str = "", name_contains: str = "") -> int:
+        """Nombre de fichiers correspondant aux filtres"""
+        self.refresh()
+        with self._lock:
+            return sum(1 for _ in self._iter_files(exts, subfolder, name_contains))
@@ -0,0 +1,320 @@
+"""
+Profilage à la demande des appels d'outils MCP.
+Un administrateur choisit les outils visés et la proportion d'appels capturés ;
+chaque capture est écrite dans un dossier borné (nombre de fichiers et taille) :
+  - mode "sampler" : échantillonnage des piles (sys._current_frames) toutes les
+    `interval` secondes, fichier .collapsed prêt pour flamegraph.pl / speedscope ;
+  - mode "cprofile" : cProfile sur la boucle asyncio, fichier .pstats. cProfile ne
+    suit que le thread où il est activé : les outils synchrones (exécutés par
+    FastMCP dans un pool de threads) sont capturés par l'échantillonneur, sur le
+    seul thread du pool qui exécute l'appel capturé (enregistré via une ContextVar,
+    que anyio copie dans ce thread) : workers inactifs, threads de fond et autres
+    appels restent hors de la capture.
+Une seule capture à la fois ; les appels concurrents passent sans profilage.
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import random
+import cProfile
+import inspect
+import logging
+import functools
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterable, Optional
+
+from fastmcp.server.middleware import Middleware
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_FILES = 50
+PROFILE_MAX_BYTES = 50 * 1024 * 1024
+SAMPLE_INTERVAL = 0.005
+MODES = ("sampler", "cprofile")
+PROFILE_EXTS = (".collapsed", ".pstats")
+
+# Échantillonneur de la capture en cours, visible dans le thread qui exécute l'outil synchrone
+_ACTIVE_SAMPLER: ContextVar[Optional["StackSampler"]] = ContextVar("active_sampler", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """Pile racine;...;feuille d'un frame"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class StackSampler:
+    """
+    Échantillonneur de piles dans un thread dédié.
+
+    Args:
+        interval: période d'échantillonnage (s)
+        only: identifiants de threads à suivre (None = tous)
+        exclude: identifiants de threads ignorés
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, only: Optional[Iterable[int]] = None,
+                 exclude: Iterable[int] = ()):
+        self.interval = interval
+        self.only = set(only) if only is not None else None
+        self.exclude = set(exclude)
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tool-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def track(self, tid: int):
+        """Ajoute un thread à suivre"""
+        self.only = (self.only or set()) | {tid}
+
+    def untrack(self, tid: int):
+        self.only = (self.only or set()) - {tid}
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me or tid in self.exclude or (self.only is not None and tid not in self.only):
+                    continue
+                if tid not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == tid), None)
+                    names[tid] = thread.name if thread else str(tid)
+                self.samples[f"{names[tid]};{_collapse(frame)}"] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ToolProfiler:
+    """
+    Args:
+        directory: dossier des captures
+        max_files / max_bytes: bornes du dossier (les plus anciennes captures sont supprimées)
+    """
+
+    def __init__(self, directory: Path, max_files: int = PROFILE_MAX_FILES, max_bytes: int = PROFILE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.tools: set = set()
+        self.sample_rate = 1.0
+        self.mode = "sampler"
+        self.interval = SAMPLE_INTERVAL
+        self.remaining = 0
+        self._busy = False
+        self.captures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tools) and self.remaining > 0
+
+    def configure(self, tools: Iterable[str], sample_rate: float = 1.0, mode: str = "sampler",
+                  max_captures: int = 20, interval: float = SAMPLE_INTERVAL) -> dict:
+        """
+        Raises:
+            ValueError: mode inconnu, taux hors de ]0, 1] ou intervalle non positif
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode inconnu '{mode}' (attendu: {', '.join(MODES)})")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate doit être dans ]0, 1]")
+        if interval <= 0:
+            raise ValueError("interval doit être positif")
+        self.tools = {t.strip() for t in tools if t and t.strip()}
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+        self.remaining = max(0, max_captures)
+        return self.status()
+
+    def disable(self) -> dict:
+        self.tools = set()
+        self.remaining = 0
+        return self.status()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tools": sorted(self.tools),
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "interval_s": self.interval,
+            "remaining_captures": self.remaining,
+            "captures": self.captures,
+            "directory": str(self.directory),
+            "max_files": self.max_files,
+            "max_bytes": self.max_bytes,
+        }
+
+    def reserve(self, tool: str) -> bool:
+        """Vrai si cet appel doit être capturé (la place est alors prise jusqu'à la fin de capture())"""
+        if (tool not in self.tools or self.remaining <= 0 or self._busy
+                or (self.sample_rate < 1 and random.random() >= self.sample_rate)):
+            return False
+        self._busy = True
+        self.remaining -= 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Fichiers
+    # ------------------------------------------------------------------
+    def _store(self, tool: str, ext: str, write) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        path = self.directory / f"{stamp}_{tool}{ext}"
+        write(path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        files = self.list_files()
+        total = sum(f["size"] for f in files)
+        # list_files trie du plus récent au plus ancien
+        while files and (len(files) > self.max_files or total > self.max_bytes):
+            oldest = files.pop()
+            total -= oldest["size"]
+            try:
+                (self.directory / oldest["name"]).unlink()
+            except OSError:
+                pass
+
+    def list_files(self) -> list:
+        if not self.directory.is_dir():
+            return []
+        files = []
+        for p in self.directory.iterdir():
+            if p.suffix in PROFILE_EXTS and p.is_file():
+                st = p.stat()
+                files.append({"name": p.name, "size": st.st_size, "mtime": st.st_mtime})
+        files.sort(key=lambda f: (f["mtime"], f["name"]), reverse=True)
+        return files
+
+    def read(self, name: str, top: int = 40) -> dict:
+        """
+        Contenu d'une capture : piles .collapsed en texte, .pstats résumé (top fonctions)
+        et renvoyé en binaire par l'appelant si besoin.
+
+        Raises:
+            ValueError: nom invalide ou capture introuvable
+        """
+        path = self.directory / name
+        if os.path.basename(name) != name or path.suffix not in PROFILE_EXTS or not path.is_file():
+            raise ValueError(f"Capture introuvable: {name}")
+        if path.suffix == ".collapsed":
+            return {"name": name, "format": "collapsed", "content": path.read_text(encoding="utf-8")}
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats("cumulative").print_stats(top)
+        return {"name": name, "format": "pstats", "summary": out.getvalue()}
+
+    # ------------------------------------------------------------------
+    # Capture
+    # ------------------------------------------------------------------
+    async def capture(self, tool: str, run_async: bool, call):
+        """Exécute call() sous profilage (après reserve()) et écrit la capture ; renvoie le résultat de call()"""
+        use_cprofile = self.mode == "cprofile" and run_async
+        profile = sampler = token = None
+        started = time.perf_counter()
+        try:
+            if use_cprofile:
+                profile = cProfile.Profile()
+                profile.enable()
+            else:
+                # Outil async : la boucle seule ; outil sync : le thread du pool qui
+                # l'exécute, ajouté par track_thread() au début de l'appel
+                sampler = StackSampler(self.interval, only=[threading.get_ident()] if run_async else [])
+                if not run_async:
+                    token = _ACTIVE_SAMPLER.set(sampler)
+                sampler.start()
+            return await call()
+        finally:
+            if token is not None:
+                _ACTIVE_SAMPLER.reset(token)
+            if profile is not None:
+                profile.disable()
+            if sampler is not None:
+                sampler.stop()
+            self._busy = False
+            self.captures += 1
+            self._write(tool, profile, sampler, time.perf_counter() - started)
+
+    def _write(self, tool: str, profile, sampler, elapsed: float):
+        try:
+            if profile is not None:
+                path = self._store(tool, ".pstats", lambda p: profile.dump_stats(str(p)))
+            elif sampler is not None and sampler.samples:
+                text = sampler.collapsed()
+                path = self._store(tool, ".collapsed", lambda p: p.write_text(text, encoding="utf-8"))
+            else:
+                logger.info(f"Appel de {tool} trop court ({elapsed:.3f}s) pour être échantillonné")
+                return
+            logger.info(f"Profil de {tool} ({elapsed:.3f}s) écrit dans {path.name}")
+        except Exception as e:
+            logger.warning(f"Écriture du profil de {tool} impossible: {e}")
+
+
+def track_thread(fn):
+    """
+    Enveloppe la fonction d'un outil synchrone : pendant un appel capturé, le thread
+    qui l'exécute est ajouté à l'échantillonneur de la capture (sans effet sinon).
+    """
+    if getattr(fn, "_profiler_tracked", False):
+        return fn
+
+    @functools.wraps(fn)
+    def tracked(*args, **kwargs):
+        sampler = _ACTIVE_SAMPLER.get()
+        if sampler is None:
+            return fn(*args, **kwargs)
+        tid = threading.get_ident()
+        sampler.track(tid)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Le thread retourne au pool : la suite (renvoi du résultat) n'est plus l'outil
+            sampler.untrack(tid)
+
+    tracked._profiler_tracked = True
+    return tracked
+
+
+class ProfilingMiddleware(Middleware):
+    """Capture les appels des outils sélectionnés dans ToolProfiler (sans effet sinon)"""
+
+    def __init__(self, profiler: ToolProfiler, server):
+        self.profiler = profiler
+        self.server = server
+
+    async def on_call_tool(self, context, call_next):
+        name = getattr(context.message, "name", "")
+        if not self.profiler.reserve(name):
+            return await call_next(context)
+        try:
+            tool = await self.server.get_tool(name)
+        except Exception:
+            tool = None
+        fn = getattr(tool, "fn", None)
+        run_async = fn is None or inspect.iscoroutinefunction(fn)
+        if not run_async:
+            tool.fn = track_thread(fn)
+        return await self.profiler.capture(name, run_async, lambda: call_next(context))
@@ -0,0 +1,143 @@
+"""
+Protection des appels vers ComfyUI : timeouts par endpoint, nouvelles tentatives
+(avec gigue) pour les lectures, et disjoncteur qui échoue immédiatement quand
+ComfyUI ne répond plus au lieu d'empiler des appels bloqués.
+"""
+
+import time
+import random
+import threading
+from typing import Optional, Tuple
+
+# Timeout de lecture par préfixe de chemin (s) ; les autres chemins gardent celui du client
+ENDPOINT_READ_TIMEOUTS = {
+    "/queue": 10.0,
+    "/history": 30.0,
+    "/system_stats": 10.0,
+    "/interrupt": 10.0,
+    "/models": 30.0,
+    "/prompt": 60.0,
+}
+
+# Nouvelles tentatives des GET : nombre, délai de base et plafond (s)
+READ_RETRIES = 2
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+
+# Réponses qui signalent un ComfyUI injoignable derrière un proxy
+UNAVAILABLE_STATUSES = frozenset({502, 503, 504})
+
+# Disjoncteur : échecs consécutifs avant ouverture, délai avant la requête d'essai (s)
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 15.0
+
+
+def endpoint_route(path: str) -> str:
+    """Premier segment du chemin, sans paramètres (/history/abc?x=1 -> /history)"""
+    return "/" + path.lstrip("/").split("?", 1)[0].split("/", 1)[0]
+
+
+def endpoint_timeout(path: str, default: Tuple[float, float]) -> Tuple[float, float]:
+    """(connect, read) pour un chemin : read plafonné par le timeout propre à l'endpoint"""
+    connect, read = default
+    limit = ENDPOINT_READ_TIMEOUTS.get(endpoint_route(path))
+    return (connect, min(read, limit) if limit is not None else read)
+
+
+def retry_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Attente avant la tentative attempt+1 : backoff exponentiel à gigue complète"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitOpenError(ConnectionError):
+    """ComfyUI est considéré indisponible : l'appel est refusé sans être envoyé"""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur fermé / ouvert / semi-ouvert, utilisable depuis plusieurs threads.
+
+    - fermé : les appels passent ; failure_threshold échecs consécutifs l'ouvrent
+    - ouvert : les appels échouent aussitôt (CircuitOpenError) pendant reset_timeout
+    - semi-ouvert : une seule requête d'essai passe ; son succès referme le circuit,
+      son échec le rouvre
+
+    Args:
+        failure_threshold: échecs consécutifs avant ouverture
+        reset_timeout: durée d'ouverture avant la requête d'essai (s)
+        name: libellé utilisé dans les messages d'erreur
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, name: str = "ComfyUI"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at: Optional[float] = None
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def check(self):
+        """
+        Autorise un appel ou lève CircuitOpenError.
+        En semi-ouvert, une seule requête d'essai à la fois (une nouvelle est permise si
+        la précédente n'a rien rapporté après reset_timeout, ex: appel annulé).
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_at = None
+            if self._state == self.HALF_OPEN and (
+                    self._probe_at is None or now - self._probe_at >= self.reset_timeout):
+                self._probe_at = now
+                return
+            self.stats["rejected"] += 1
+            retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+        raise CircuitOpenError(f"{self.name} indisponible (circuit ouvert, nouvel essai dans {retry_in:.0f}s)")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self.stats["failures"] += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and 0 < self.failure_threshold <= self._failures):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+                self.stats["opened"] += 1
+
+    def get_stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout,
+                **self.stats,
+            }
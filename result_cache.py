@@ -0,0 +1,116 @@
+"""
+Cache des résultats de workflows, adressé par le contenu.
+Un workflow au format API est normalisé (clés triées, métadonnées d'affichage
+retirées, flottants entiers ramenés à des entiers) puis haché ; le hash pointe
+vers le prompt_id et les sorties de la dernière exécution réussie. Une soumission
+identique récupère ces sorties sans repasser par le GPU.
+
+Limite : une entrée qui désigne un fichier (LoadImage "photo.png") est comparée
+par son nom ; si le fichier change sous le même nom, il faut passer use_cache=False.
+"""
+
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = 24 * 3600.0
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def workflow_key(workflow: dict) -> str:
+    """sha256 de la forme canonique d'un workflow API (class_type + inputs de chaque node)"""
+    canonical = {
+        str(node_id): {"class_type": node.get("class_type"), "inputs": _normalize(node.get("inputs") or {})}
+        for node_id, node in workflow.items()
+        if isinstance(node, dict)
+    }
+    raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Args:
+        max_entries: nombre d'entrées gardées (les moins récemment utilisées sortent d'abord)
+        max_age: durée de validité d'une entrée (s), 0 = illimitée
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, max_age: float = RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # hash -> prompt_id des exécutions en cours (évite de soumettre deux fois le même graphe)
+        self._in_flight: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        """Entrée {"prompt_id", "outputs", "created"} encore valide, sinon None"""
+        entry = self._entries.get(key)
+        if entry is not None and self.max_age and time.time() - entry["created"] > self.max_age:
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def peek(self, key: str) -> Optional[str]:
+        """prompt_id de l'entrée (valide ou non), sans effet sur les statistiques"""
+        entry = self._entries.get(key)
+        return entry["prompt_id"] if entry is not None else None
+
+    def put(self, key: str, prompt_id: str, outputs: dict):
+        if not outputs or self.max_entries <= 0:
+            return
+        self._entries[key] = {"prompt_id": prompt_id, "outputs": outputs, "created": time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def in_flight(self, key: str) -> Optional[str]:
+        """prompt_id d'une exécution identique en cours, s'il y en a une"""
+        return self._in_flight.get(key)
+
+    def begin(self, key: str, prompt_id: str):
+        self._in_flight[key] = prompt_id
+
+    def end(self, key: str, prompt_id: str):
+        if self._in_flight.get(key) == prompt_id:
+            del self._in_flight[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_age_s": self.max_age,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
@@ -1,6 +1,6 @@
 """
 ComfyUI MCP Server - Version propre et stable (avec outils admin)
-- Outils ComfyUI (HTTP) via client synchrone
+- Outils ComfyUI (HTTP) via client asyncio
 - Gestion workflows locaux
 - Contrôle UI via WebSocket (optionnel)
 - Middleware API Key
@@ -18,12 +18,16 @@ import uuid
 import logging
 import atexit
 import signal
-from typing import Any, Dict
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
 from urllib.parse import quote
-from base64 import b64decode, b64encode
+from base64 import b64decode, b64encode, urlsafe_b64decode, urlsafe_b64encode
 
 def _sha256_of_file(path):
     import hashlib
@@ -38,12 +42,41 @@ def _sha256_of_file(path):
 # ---------------------------------------------------------------------
 load_dotenv()
 
+from auth import APIKeyMiddleware, parse_api_keys
+
 COMFYUI_BASE_URL = os.getenv("COMFYUI_BASE_URL", "http://127.0.0.1:8188")
-API_KEY = os.getenv("MCP_API_KEY")
+# Plusieurs instances ComfyUI (séparées par des virgules) : les prompts sont répartis entre elles
+COMFYUI_BASE_URLS = [u.strip() for u in os.getenv("COMFYUI_BASE_URLS", "").split(",") if u.strip()] or [COMFYUI_BASE_URL]
+COMFYUI_POOL_SIZE = int(os.getenv("COMFYUI_POOL_SIZE", "10"))
+COMFYUI_CONNECT_TIMEOUT = float(os.getenv("COMFYUI_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "600"))
+OBJECT_INFO_TTL = float(os.getenv("OBJECT_INFO_TTL", "300"))
+MODELS_REFRESH_INTERVAL = float(os.getenv("MODELS_REFRESH_INTERVAL", "300"))
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "0.25"))
+# Résilience : relances des lectures, disjoncteur (échecs consécutifs, délai avant essai)
+COMFYUI_READ_RETRIES = int(os.getenv("COMFYUI_READ_RETRIES", "2"))
+COMFYUI_BREAKER_THRESHOLD = int(os.getenv("COMFYUI_BREAKER_THRESHOLD", "5"))
+COMFYUI_BREAKER_RESET = float(os.getenv("COMFYUI_BREAKER_RESET", "15"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "5"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+# Clés API nommées ("nom:clé,..."), MCP_API_KEY reste acceptée sous le nom "default"
+API_KEYS = parse_api_keys(os.getenv("MCP_API_KEYS", ""), os.getenv("MCP_API_KEY"))
+HTTP_RATE_LIMIT = int(os.getenv("HTTP_RATE_LIMIT", "120"))
+HTTP_RATE_WINDOW = float(os.getenv("HTTP_RATE_WINDOW", "60"))
 WORKFLOWS_DIR = Path(__file__).parent / "workflows"
 WORKFLOWS_DIR.mkdir(exist_ok=True)
 ENABLE_BROWSER_CONTROL = os.getenv("ENABLE_BROWSER_CONTROL", "true").lower() == "true"
 WEBSOCKET_TOKEN = os.getenv("WEBSOCKET_TOKEN")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+BROWSER_REPLY_TIMEOUT = float(os.getenv("BROWSER_REPLY_TIMEOUT", "15"))
+# Profilage à la demande des outils (désactivé par défaut) et bornes du dossier des captures
+ENABLE_PROFILING = os.getenv("ENABLE_PROFILING", "false").lower() == "true"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(Path(__file__).parent / "profiles")))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_MB = float(os.getenv("PROFILE_MAX_MB", "50"))
 
 # Chemins ComfyUI
 COMFYUI_ROOT = Path(os.getenv("COMFYUI_ROOT", "")).resolve() if os.getenv("COMFYUI_ROOT") else None
@@ -64,11 +97,10 @@ logger = logging.getLogger("ComfyUIMCP")
 # ---------------------------------------------------------------------
 # Imports FastMCP APRÈS configuration
 # ---------------------------------------------------------------------
-from fastmcp import FastMCP
-from fastapi import Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastmcp import FastMCP, Context
+from fastapi import Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from starlette.routing import WebSocketRoute
 
 # ---------------------------------------------------------------------
@@ -112,78 +144,289 @@ def _safe_join(root: Path, *parts: str) -> Path:
 # Rate Limiter
 # ---------------------------------------------------------------------
 class RateLimiter:
-    def __init__(self, max_requests: int = 30, window_seconds: int = 60):
+    """
+    Limiteur à fenêtre glissante approchée (compteurs de la fenêtre courante et de la
+    précédente, pondérés) : O(1) en temps et en mémoire par client, horloge monotone.
+    Les clients inactifs depuis deux fenêtres sont oubliés au fil des appels.
+    """
+
+    def __init__(self, max_requests: int = 30, window_seconds: float = 60):
         self.max_requests = max_requests
-        self.window = timedelta(seconds=window_seconds)
-        self.requests = {}
+        self.window = float(window_seconds)
+        # client -> [index de fenêtre, compteur précédent, compteur courant], du moins au plus récent
+        self.requests: "OrderedDict[str, list]" = OrderedDict()
+
+    def _evict_idle(self, window_index: int):
+        while self.requests:
+            oldest = next(iter(self.requests.values()))
+            if window_index - oldest[0] < 2:
+                break
+            self.requests.popitem(last=False)
+
+    def _state(self, client_id: str, now: float) -> list:
+        window_index = int(now // self.window)
+        self._evict_idle(window_index)
+        state = self.requests.get(client_id)
+        if state is None:
+            state = [window_index, 0, 0]
+            self.requests[client_id] = state
+        elif state[0] != window_index:
+            state[1] = state[2] if window_index - state[0] == 1 else 0
+            state[2] = 0
+            state[0] = window_index
+        self.requests.move_to_end(client_id)
+        return state
+
+    def _estimate(self, state: list, now: float) -> float:
+        elapsed = (now % self.window) / self.window
+        return state[1] * (1.0 - elapsed) + state[2]
 
     def is_allowed(self, client_id: str) -> bool:
-        now = datetime.now()
-        entries = [t for t in self.requests.get(client_id, []) if now - t < self.window]
-        if len(entries) >= self.max_requests:
-            self.requests[client_id] = entries
+        now = time.monotonic()
+        state = self._state(client_id, now)
+        if self._estimate(state, now) >= self.max_requests:
             return False
-        entries.append(now)
-        self.requests[client_id] = entries
+        state[2] += 1
         return True
 
+    def retry_after(self, client_id: str) -> float:
+        """Délai (s) avant qu'une nouvelle requête de ce client soit acceptée"""
+        now = time.monotonic()
+        state = self.requests.get(client_id)
+        if state is None:
+            return 0.0
+        state = self._state(client_id, now)
+        if self._estimate(state, now) < self.max_requests:
+            return 0.0
+        if state[2] >= self.max_requests or state[1] == 0:
+            return self.window - (now % self.window)
+        # le poids de la fenêtre précédente doit descendre sous (max - courant) / précédent
+        needed = 1.0 - (self.max_requests - state[2]) / state[1]
+        return max(0.0, needed * self.window - (now % self.window))
+
     def reset(self, client_id: str):
         self.requests.pop(client_id, None)
 
 rate_limiter = RateLimiter()
+# HTTP (endpoint MCP) : par clé API uniquement. Sans clé configurée, pas de limite : derrière
+# cloudflared tous les clients arrivent en 127.0.0.1 et partageraient un seul quota par IP
+http_rate_limiter = RateLimiter(HTTP_RATE_LIMIT, HTTP_RATE_WINDOW) if HTTP_RATE_LIMIT > 0 and API_KEYS else None
 
 # ---------------------------------------------------------------------
 # WebSocket Manager
 # ---------------------------------------------------------------------
+class _Outbound:
+    """File d'envoi et tâche d'écriture d'une extension connectée"""
+
+    __slots__ = ("info", "queue", "writer", "sent", "failed")
+
+    def __init__(self, info: dict, queue_size: int):
+        self.info = info
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.authenticated_connections: dict[WebSocket, dict] = {}
+    """
+    Diffusion des commandes vers les extensions Chrome.
+    Chaque connexion a sa propre file et sa tâche d'écriture : une extension lente
+    ne retarde ni les autres ni l'outil appelant. Une extension dont la file est
+    pleine ou dont l'envoi dépasse send_timeout est déconnectée.
+    """
+
+    def __init__(self, send_timeout: float = 5.0, queue_size: int = 100):
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.connections: dict[WebSocket, _Outbound] = {}
+        # id de commande -> future de la réponse de l'extension
+        self.pending: dict[str, asyncio.Future] = {}
+        self.stats = {"connections": 0, "received": 0, "enqueued": 0, "sent": 0, "send_failures": 0,
+                      "evicted": 0, "replies": 0, "unmatched_replies": 0, "reply_timeouts": 0}
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.connections)
+
+    @property
+    def authenticated_connections(self) -> dict[WebSocket, dict]:
+        return {ws: out.info for ws, out in self.connections.items()}
 
     async def connect(self, websocket: WebSocket, client_info: dict):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        self.authenticated_connections[websocket] = client_info
+        out = _Outbound(client_info, self.queue_size)
+        out.writer = asyncio.create_task(self._writer(websocket, out))
+        self.connections[websocket] = out
+        self.stats["connections"] += 1
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.authenticated_connections:
-            del self.authenticated_connections[websocket]
+        out = self.connections.pop(websocket, None)
+        if out is not None and out.writer is not None and out.writer is not asyncio.current_task():
+            out.writer.cancel()
+
+    async def _evict(self, websocket: WebSocket, reason: str):
+        if websocket not in self.connections:
+            return
+        client_id = self.connections[websocket].info.get("client_id")
+        logger.warning(f"Extension {client_id} déconnectée: {reason}")
+        self.stats["evicted"] += 1
+        self.disconnect(websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=1013, reason=reason), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _writer(self, websocket: WebSocket, out: _Outbound):
+        while True:
+            command = await out.queue.get()
+            try:
+                await asyncio.wait_for(websocket.send_json(command), self.send_timeout)
+                out.sent += 1
+                self.stats["sent"] += 1
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                out.failed += 1
+                self.stats["send_failures"] += 1
+                await self._evict(websocket, "send timeout")
+                return
+            except Exception:
+                out.failed += 1
+                self.stats["send_failures"] += 1
+                self.disconnect(websocket)
+                return
 
     async def send_command(self, command: dict):
+        """
+        Met la commande dans la file de chaque extension et rend la main aussitôt.
+
+        Returns:
+            dict: nombre d'extensions servies, extensions évincées, statistiques d'envoi
+        """
         if not ENABLE_BROWSER_CONTROL:
             return {"status": "disabled", "message": "Browser control is disabled"}
-        if not self.active_connections:
+        if not self.connections:
             return {"status": "error", "message": "No browser extension connected"}
-        
-        disconnected = []
-        for connection in self.active_connections:
+
+        queued = 0
+        slow = []
+        for websocket, out in list(self.connections.items()):
             try:
-                await connection.send_json(command)
-            except Exception:
-                disconnected.append(connection)
-        
-        for conn in disconnected:
-            self.disconnect(conn)
-        
-        return {"status": "sent", "connections": len(self.active_connections)}
+                out.queue.put_nowait(command)
+                queued += 1
+            except asyncio.QueueFull:
+                slow.append(websocket)
+        for websocket in slow:
+            await self._evict(websocket, "outbound queue full")
+        self.stats["enqueued"] += queued
+
+        if not queued:
+            return {"status": "error", "message": "No browser extension connected", "evicted": len(slow)}
+        return {
+            "status": "queued",
+            "connections": queued,
+            "evicted": len(slow),
+            "pending": {out.info.get("client_id"): out.queue.qsize() for out in self.connections.values()},
+            "delivery": dict(self.stats),
+        }
 
-manager = ConnectionManager()
+    async def request(self, command: dict, timeout: float) -> dict:
+        """
+        Envoie une commande avec un identifiant et attend la première réponse d'une extension.
+
+        Returns:
+            dict: {"status": "success", "data": ...} ou {"status": "error", "message": ...}
+        """
+        command_id = uuid.uuid4().hex
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[command_id] = fut
+        try:
+            delivery = await self.send_command({**command, "id": command_id})
+            if delivery.get("status") != "queued":
+                return delivery
+            try:
+                reply = await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                self.stats["reply_timeouts"] += 1
+                return {"status": "error", "message": f"Pas de réponse de l'extension après {timeout:g}s",
+                        "connections": delivery["connections"]}
+        finally:
+            self.pending.pop(command_id, None)
+
+        if reply.get("type") == "error":
+            return {"status": "error", "message": reply.get("message") or "Erreur côté extension"}
+        return {"status": "success", "data": reply.get("data"), "connections": delivery["connections"]}
+
+    def resolve(self, message: dict) -> bool:
+        """Transmet une réponse d'extension à la commande en attente ; False si aucune n'attend cet id"""
+        fut = self.pending.get(str(message.get("id")))
+        if fut is None or fut.done():
+            self.stats["unmatched_replies"] += 1
+            return False
+        fut.set_result(message)
+        self.stats["replies"] += 1
+        return True
+
+manager = ConnectionManager(send_timeout=WS_SEND_TIMEOUT, queue_size=WS_QUEUE_SIZE)
 
 # ---------------------------------------------------------------------
 # Clients
 # ---------------------------------------------------------------------
-from comfyui_client import ComfyUIClient
-client = ComfyUIClient(base_url=COMFYUI_BASE_URL)
+from comfyui_client import AsyncComfyUIClient
+from backend_pool import BackendPool
+from result_cache import ResultCache
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, ToolMetricsMiddleware
+from profiler import ProfilingMiddleware, ToolProfiler
+if len(COMFYUI_BASE_URLS) > 1:
+    client = BackendPool(
+        COMFYUI_BASE_URLS,
+        workflows_dir=WORKFLOWS_DIR,
+        pool_size=COMFYUI_POOL_SIZE,
+        timeout=(COMFYUI_CONNECT_TIMEOUT, HTTP_TIMEOUT),
+    )
+else:
+    client = AsyncComfyUIClient(
+        base_url=COMFYUI_BASE_URLS[0],
+        workflows_dir=WORKFLOWS_DIR,
+        pool_size=COMFYUI_POOL_SIZE,
+        timeout=(COMFYUI_CONNECT_TIMEOUT, HTTP_TIMEOUT),
+    )
+client.node_catalog_ttl = OBJECT_INFO_TTL
+client.models_refresh_interval = MODELS_REFRESH_INTERVAL
+client.read_ttl = READ_CACHE_TTL
+client.read_retries = COMFYUI_READ_RETRIES
+client.configure_circuit(COMFYUI_BREAKER_THRESHOLD, COMFYUI_BREAKER_RESET)
+client.result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE, max_age=RESULT_CACHE_TTL)
+client.result_record_timeout = GENERATION_TIMEOUT
+client.generation_timeout = GENERATION_TIMEOUT
+metrics = MetricsRegistry()
+client.on_request = metrics.observe_upstream
+client.on_timing = metrics.observe_generation
 
 from browser_controller import BrowserController
-browser = BrowserController(manager)
+from output_index import OutputIndex
+from hash_cache import HashCache, fast_fingerprint
+from model_index import ModelIndex, read_safetensors_header, summarize_safetensors
+from node_autodoc import NodeAutodoc
+browser = BrowserController(manager, reply_timeout=BROWSER_REPLY_TIMEOUT)
 
 # =====================================================================
 # FastMCP instance (UNE SEULE LIGNE)
 # =====================================================================
-mcp = FastMCP("ComfyUI MCP Server")
+@asynccontextmanager
+async def _lifespan(server):
+    """Ferme le client ComfyUI (WebSocket, suivi de /history, tâches de fond, pool HTTP) à l'arrêt"""
+    try:
+        yield {}
+    finally:
+        await client.aclose()
+
+mcp = FastMCP("ComfyUI MCP Server", lifespan=_lifespan)
+mcp.add_middleware(ToolMetricsMiddleware(metrics))
+profiler = ToolProfiler(PROFILE_DIR, max_files=PROFILE_MAX_FILES, max_bytes=int(PROFILE_MAX_MB * 1024 * 1024))
+if ENABLE_PROFILING:
+    mcp.add_middleware(ProfilingMiddleware(profiler, mcp))
 
 # ===========================================
 # Zone d'échange fichiers (output/MCP_exchange)
@@ -217,70 +460,126 @@ def _ensure_exchange_dir() -> Path:
 # OUTILS MCP (@mcp.tool())
 # =====================================================================
 
-# Tools ComfyUI (client synchrone)
+# Tools ComfyUI (client asyncio : n'immobilise pas la boucle d'événements)
 @mcp.tool()
-def queue_prompt(workflow: dict) -> dict:
-    """Envoie un workflow à ComfyUI pour exécution"""
-    return client.queue_prompt(workflow)
+async def queue_prompt(workflow: dict, use_cache: bool = True) -> dict:
+    """
+    Envoie un workflow à ComfyUI pour exécution.
+    Un workflow identique à une exécution réussie renvoie directement ses sorties
+    ("cached": "hit") ; use_cache=False force un nouveau rendu (ex: image d'entrée modifiée).
+    """
+    return await client.queue_prompt(workflow, use_cache=use_cache)
 
 @mcp.tool()
-def get_queue_status() -> dict:
+async def get_queue_status() -> dict:
     """Récupère l'état de la file d'attente ComfyUI"""
-    return client.get_queue_info()
+    return await client.get_queue_info()
 
 @mcp.tool()
-def get_history(prompt_id: str) -> dict:
+async def get_history(prompt_id: str) -> dict:
     """Récupère l'historique d'un prompt spécifique"""
-    return client.get_history(prompt_id)
+    return await client.get_history(prompt_id)
 
 @mcp.tool()
-def cancel_prompt(prompt_id: str = "") -> dict: # Le prompt_id n'est pas utilisé par l'API interrupt
-    """Annule un prompt en cours d'exécution"""
-    return client.interrupt() # Appelle la nouvelle méthode
+async def cancel_prompt(prompt_id: str = "") -> dict:
+    """Annule un prompt en cours d'exécution (sur le backend qui l'exécute)"""
+    return await client.interrupt(prompt_id)
 
 @mcp.tool()
-def get_system_stats() -> dict:
+async def get_system_stats() -> dict:
     """Récupère les statistiques système de ComfyUI"""
-    return client.get_system_stats()
+    return await client.get_system_stats()
 
 @mcp.tool()
-def list_models(model_type: str = "checkpoints") -> dict:
+async def list_models(model_type: str = "checkpoints") -> dict:
     """Liste les modèles disponibles dans ComfyUI"""
     if hasattr(client, "list_models"):
-        return client.list_models(model_type)
+        return await client.list_models(model_type)
     try:
-        info = client.get_object_info("CheckpointLoaderSimple")
+        info = await client.get_object_info("CheckpointLoaderSimple")
         models = info.get("CheckpointLoaderSimple", {}).get("input", {}).get("required", {}).get("ckpt_name", [[]])[0]
         return {"model_type": "checkpoints", "models": models}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @mcp.tool()
-def upload_image(image_path: str) -> dict:
+async def upload_image(image_path: str) -> dict:
     """Upload une image vers ComfyUI"""
     if hasattr(client, "upload_image"):
-        return client.upload_image(image_path)
+        return await client.upload_image(image_path)
     return {"status": "error", "message": "upload_image non implémenté"}
 
 @mcp.tool()
-def get_image(filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
+async def get_image(filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
     """Récupère une image depuis ComfyUI"""
     if hasattr(client, "get_image"):
-        return client.get_image(filename, subfolder, folder_type)
+        return await client.get_image(filename, subfolder, folder_type)
     return b""
 
 @mcp.tool()
-def list_node_types() -> dict:
-    """Liste tous les types de nœuds disponibles"""
-    return client.get_object_info()
+async def list_node_types(category: str = "", name: str = "", fields: str = "names",
+                          offset: int = 0, limit: int = 100, refresh: bool = False) -> dict:
+    """
+    Liste les types de nœuds disponibles (catalogue /object_info mis en cache).
+
+    Args:
+        category: préfixe de catégorie (ex: 'sampling', 'loaders')
+        name: filtre sur le nom ou le nom affiché
+        fields: 'names' (noms seuls), 'summary' (nom, catégorie, sorties) ou 'full' (specs d'entrées complètes)
+        offset, limit: pagination (next_offset indique la page suivante)
+        refresh: ignore le cache et relit /object_info
+    """
+    catalog = await client.get_node_catalog(force_refresh=refresh)
+    try:
+        result = catalog.query(category=category, name=name, fields=fields, offset=offset, limit=limit)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "catalog_age_s": round(catalog.age(), 1), **result}
 
 @mcp.tool()
-def interrupt_execution() -> dict:
+async def interrupt_execution() -> dict:
     """Interrompt l'exécution en cours"""
     if hasattr(client, "interrupt"):
-        return client.interrupt()
+        return await client.interrupt()
     return {"status": "error", "message": "interrupt non implémenté"}
 
+@mcp.tool()
+async def generate_batch(workflow_id: str, jobs: list[dict], use_cache: bool = True, timeout: float = 0,
+                         ctx: Context = None) -> dict:
+    """
+    Génère plusieurs variantes d'un workflow en une seule fois.
+    Tous les jobs sont soumis d'affilée à ComfyUI puis suivis ensemble.
+
+    Args:
+        workflow_id: workflow à utiliser (ex: 'flux/basic')
+        jobs: liste de paramètres, ex: [{"prompt": "un chat", "width": 768, "height": 512, "seed": 42}]
+              (prompt, negative_prompt, width, height, batch_size, model, seed, steps, cfg,
+              sampler_name, scheduler, denoise ; voir inspect_workflow pour ceux du workflow)
+        use_cache: réutilise les résultats des jobs identiques déjà exécutés
+        timeout: attente maximale du lot en secondes (0 = GENERATION_TIMEOUT, à augmenter
+                 pour la vidéo ou les upscales longs)
+
+    Returns:
+        Résultats dans l'ordre de fin d'exécution (index = position dans jobs)
+    """
+    if not jobs:
+        return {"status": "error", "message": "Liste 'jobs' vide"}
+    if timeout < 0:
+        return {"status": "error", "message": "timeout doit être positif (0 = GENERATION_TIMEOUT)"}
+    results = []
+    async for result in client.generate_batch(workflow_id, jobs, timeout=timeout or GENERATION_TIMEOUT,
+                                              use_cache=use_cache):
+        results.append(result)
+        if ctx is not None:
+            await ctx.report_progress(len(results), len(jobs))
+    failed = sum(1 for r in results if r["status"] != "success")
+    return {
+        "status": "success" if not failed else "partial",
+        "count": len(results),
+        "failed": failed,
+        "results": results,
+    }
+
 # Gestion des workflows
 @mcp.tool()
 def save_workflow(name: str, workflow: dict) -> dict:
@@ -401,6 +700,14 @@ def inspect_workflow(name: str) -> dict:
             "path": str(wf_path)
         }
 
+    # Paramètres de génération applicables (index calculé une fois par version du fichier)
+    try:
+        bindings = client.get_workflow_bindings(str(rel_path.with_suffix("")).replace("\\", "/"))
+        info["parameters"] = {param: [f"{nid}.{field}" for nid, field in targets]
+                              for param, targets in bindings.items()}
+    except Exception as e:
+        info["parameters_error"] = str(e)
+
     return {"status": "success", "workflow": info}
 
 # Contrôle UI Chrome
@@ -420,7 +727,7 @@ async def ui_fill_input(selector: str, text: str) -> dict:
 
 @mcp.tool()
 async def ui_get_current_workflow() -> dict:
-    """Récupère le workflow actuel depuis l'interface Chrome"""
+    """Récupère le workflow affiché dans l'interface Chrome (format UI, dans data.workflow)"""
     if not ENABLE_BROWSER_CONTROL:
         return {"status": "disabled", "message": "Browser control disabled"}
     return await browser.get_workflow()
@@ -579,54 +886,45 @@ def list_custom_subdir(folder: str) -> dict:
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+_node_autodoc = None
+
 @mcp.tool()
-def autodoc_nodes() -> dict:
-    """Génère automatiquement la documentation des custom nodes"""
+def autodoc_nodes(folder: str = "", details: bool = False) -> dict:
+    """
+    Génère automatiquement la documentation des custom nodes (analyse statique, sans import).
+    Seuls les fichiers modifiés depuis l'appel précédent sont réanalysés.
+
+    Args:
+        folder: limite à un dossier de custom_nodes (vide = tous)
+        details: inclut par node INPUT_TYPES, RETURN_TYPES, RETURN_NAMES, FUNCTION, CATEGORY
+                 quand ils sont déterminables statiquement (les parties dynamiques apparaissent
+                 sous la forme "<expression>")
+    """
+    global _node_autodoc
     _require_root(CUSTOM_NODES_DIR, "custom_nodes")
-    
-    data = []
-    class_rx = re.compile(r"^class\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(", flags=re.MULTILINE)
-    mapping_rx = re.compile(r"NODE_CLASS_MAPPINGS\s*=\s*\{([^}]*)\}", flags=re.DOTALL)
-    
-    for folder in sorted(CUSTOM_NODES_DIR.iterdir()):
-        if not folder.is_dir():
-            continue
-        
-        entry = {"folder": folder.name, "files": []}
-        for py in sorted(folder.glob("*.py")):
-            item = {"file": py.name, "classes": []}
-            try:
-                text = py.read_text(encoding="utf-8", errors="ignore")
-                item["classes"] = class_rx.findall(text)[:50]
-                
-                m = mapping_rx.search(text)
-                if m:
-                    keys = []
-                    for line in m.group(1).splitlines():
-                        line = line.strip()
-                        if line.startswith("#") or ":" not in line:
-                            continue
-                        key = line.split(":", 1)[0].strip().strip("'\"")
-                        if key and len(keys) < 50:
-                            keys.append(key)
-                    if keys:
-                        item["node_keys"] = keys
-            except Exception as e:
-                item["error"] = str(e)
-            
-            entry["files"].append(item)
-        
-        if entry["files"]:
-            data.append(entry)
-    
+    if _node_autodoc is None or _node_autodoc.custom_nodes_dir != CUSTOM_NODES_DIR:
+        _node_autodoc = NodeAutodoc(CUSTOM_NODES_DIR)
+    data = _node_autodoc.collect(folder=folder, details=details)
     return {"status": "success", "custom_nodes": data}
 
 # Liste les images de COMFYUI_ROOT/output (hors MCP_exchange si tu veux tout)
+_output_index = None
+
+def _get_output_index(output_dir: Path):
+    """Index incrémental de output/ (créé au premier appel, conservé entre les appels)"""
+    global _output_index
+    if _output_index is None or _output_index.root != output_dir:
+        _output_index = OutputIndex(output_dir)
+    return _output_index
+
 @mcp.tool()
-def list_output_images(limit: int = 100, exts: str = "png,jpg,jpeg,webp") -> dict:
+def list_output_images(limit: int = 100, exts: str = "png,jpg,jpeg,webp",
+                       subfolder: str = "", name_contains: str = "") -> dict:
     """
     Liste les images du dossier ComfyUI/output (triées du plus récent au plus ancien).
     exts: extensions autorisées, séparées par virgules.
+    subfolder: limite à un sous-dossier de output (récursif).
+    name_contains: filtre sur le nom de fichier.
     """
     _require_root(COMFYUI_ROOT, "COMFYUI_ROOT")
     output_dir = _safe_join(COMFYUI_ROOT, "output")
@@ -634,26 +932,21 @@ def list_output_images(limit: int = 100, exts: str = "png,jpg,jpeg,webp") -> dic
         return {"status": "success", "files": []}
 
     allowed = {e.strip().lower().lstrip(".") for e in exts.split(",") if e.strip()}
+    index = _get_output_index(output_dir)
     items = []
-    for p in output_dir.rglob("*"):
-        if p.is_file() and p.suffix.lower().lstrip(".") in allowed:
-            rel = p.relative_to(output_dir)
-            stat = p.stat()
-            filename = p.name
-            subfolder = str(rel.parent).replace("\\", "/") if rel.parent != Path(".") else ""
-            view = f"/view?filename={quote(filename)}&type=output"
-            if subfolder:
-                view += f"&subfolder={quote(subfolder)}"
-            items.append({
-                "filename": filename,
-                "subfolder": subfolder,
-                "size_bytes": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                "view_path": view,
-            })
+    for mtime, size, rel, filename in index.newest(limit, allowed, subfolder, name_contains):
+        view = f"/view?filename={quote(filename)}&type=output"
+        if rel:
+            view += f"&subfolder={quote(rel)}"
+        items.append({
+            "filename": filename,
+            "subfolder": rel,
+            "size_bytes": size,
+            "modified": datetime.fromtimestamp(mtime).isoformat(),
+            "view_path": view,
+        })
 
-    items.sort(key=lambda x: x["modified"], reverse=True)
-    return {"status": "success", "count": len(items[:limit]), "files": items[:limit]}
+    return {"status": "success", "count": len(items), "files": items}
 @mcp.tool()
 def list_exchange(limit: int = 200, exts: str = "png,jpg,jpeg,webp,bmp,tif,tiff,txt,md,html,htm,json,js,py,css") -> dict:
     """Liste les fichiers dans output/MCP_exchange (du + récent au + ancien)."""
@@ -674,14 +967,52 @@ def list_exchange(limit: int = 200, exts: str = "png,jpg,jpeg,webp,bmp,tif,tiff,
     files.sort(key=lambda x: x["modified"], reverse=True)
     return {"status":"success","count":len(files[:limit]),"files":files[:limit]}
 
+IMG_MIMES = {
+    ".png":"image/png",".jpg":"image/jpeg",".jpeg":"image/jpeg",
+    ".webp":"image/webp",".bmp":"image/bmp",".tif":"image/tiff",".tiff":"image/tiff"
+}
+MAX_READ_CHUNK = 3 * 1024 * 1024  # 3 MB, multiple de 3 : les morceaux base64 se concatènent
+
+def _encode_continuation(name: str, offset: int, length: int, mtime_ns: int) -> str:
+    raw = json.dumps({"n": name, "o": offset, "l": length, "m": mtime_ns}, separators=(",", ":"))
+    return urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_continuation(token: str) -> dict:
+    try:
+        data = json.loads(urlsafe_b64decode(token.encode("ascii")))
+        return {"n": str(data["n"]), "o": int(data["o"]), "l": int(data["l"]), "m": int(data["m"])}
+    except Exception:
+        raise ValueError("continuation invalide")
+
+def _utf8_complete_prefix(data: bytes) -> int:
+    """Longueur du plus long préfixe qui ne coupe pas un caractère UTF-8 en deux"""
+    try:
+        data.decode("utf-8")
+        return len(data)
+    except UnicodeDecodeError as e:
+        if e.start >= len(data) - 3 and e.reason == "unexpected end of data":
+            return e.start
+        return len(data)
+
 @mcp.tool()
-def read_exchange(name: str, as_data_url: bool = True) -> dict:
+def read_exchange(name: str, as_data_url: bool = True, offset: int = 0, length: int = 0,
+                  continuation: str = "", metadata_only: bool = False) -> dict:
     """
     Lit un fichier dans output/MCP_exchange.
     - Images: si as_data_url=True -> data:image/...;base64, sinon base64 brut.
     - Textes: renvoie content (str).
+    - metadata_only=True : taille, date et sha256 seulement (pas de contenu).
+    - Lecture par morceaux : offset/length (octets), puis 'continuation' renvoyé
+      pour lire la suite. Automatique au-delà de 3 MB ; les morceaux base64
+      d'une image se concatènent directement.
     """
     root = _ensure_exchange_dir()
+    if continuation:
+        try:
+            token = _decode_continuation(continuation)
+        except ValueError as e:
+            return {"status":"error","message":str(e)}
+        name, offset, length = token["n"], token["o"], token["l"]
     safe = _sanitize_name_for_any(name)
     path = _safe_join(root, safe)
 
@@ -690,20 +1021,54 @@ def read_exchange(name: str, as_data_url: bool = True) -> dict:
 
     ext = path.suffix.lower()
     try:
-        if ext in TEXT_EXTS:
-            txt = path.read_text(encoding="utf-8", errors="replace")
-            return {"status":"success","name":safe,"ext":ext,"mode":"text","content":txt}
-        else:
+        st = path.stat()
+        if continuation and token["m"] != st.st_mtime_ns:
+            return {"status":"error","message":"Le fichier a changé depuis le morceau précédent"}
+
+        if metadata_only:
+            import hashlib
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            return {"status":"success","name":safe,"ext":ext,"mode":"metadata",
+                    "size_bytes":st.st_size,"modified":datetime.fromtimestamp(st.st_mtime).isoformat(),
+                    "mime":IMG_MIMES.get(ext, "text/plain" if ext in TEXT_EXTS else "application/octet-stream"),
+                    "sha256":h.hexdigest()}
+
+        chunked = bool(continuation) or length > 0 or offset > 0 or st.st_size > MAX_READ_CHUNK
+        if not chunked:
+            if ext in TEXT_EXTS:
+                txt = path.read_text(encoding="utf-8", errors="replace")
+                return {"status":"success","name":safe,"ext":ext,"mode":"text","content":txt}
             raw = path.read_bytes()
             b64 = b64encode(raw).decode("ascii")
             if as_data_url:
-                mime = {
-                    ".png":"image/png",".jpg":"image/jpeg",".jpeg":"image/jpeg",
-                    ".webp":"image/webp",".bmp":"image/bmp",".tif":"image/tiff",".tiff":"image/tiff"
-                }.get(ext, "application/octet-stream")
+                mime = IMG_MIMES.get(ext, "application/octet-stream")
                 return {"status":"success","name":safe,"ext":ext,"mode":"data_url","data_url":f"data:{mime};base64,{b64}"}
-            else:
-                return {"status":"success","name":safe,"ext":ext,"mode":"base64","base64":b64}
+            return {"status":"success","name":safe,"ext":ext,"mode":"base64","base64":b64}
+
+        # Lecture d'un morceau [offset, offset+length) sans charger le fichier entier
+        offset = max(offset, 0)
+        length = min(length if length > 0 else MAX_READ_CHUNK, MAX_READ_CHUNK)
+        if ext not in TEXT_EXTS:
+            length = max(length - length % 3, 3)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if ext in TEXT_EXTS and offset + len(data) < st.st_size:
+            data = data[:_utf8_complete_prefix(data)] or data
+        next_offset = offset + len(data)
+        eof = next_offset >= st.st_size
+        result = {"status":"success","name":safe,"ext":ext,"size_bytes":st.st_size,
+                  "offset":offset,"length":len(data),"eof":eof,
+                  "continuation":None if eof else _encode_continuation(safe, next_offset, length, st.st_mtime_ns)}
+        if ext in TEXT_EXTS:
+            result.update(mode="text_chunk", content=data.decode("utf-8", errors="replace"))
+        else:
+            result.update(mode="base64_chunk", mime=IMG_MIMES.get(ext, "application/octet-stream"),
+                          base64=b64encode(data).decode("ascii"))
+        return result
     except Exception as e:
         return {"status":"error","message":str(e)}
 
@@ -761,10 +1126,27 @@ def delete_exchange(name: str) -> dict:
         return {"status":"error","message":str(e)}
 
 
+MODEL_HASH_CACHE = Path(os.getenv("MODEL_HASH_CACHE", str(Path(__file__).parent / ".cache" / "model_hashes.json")))
+_hash_cache = None
+
+def _get_hash_cache() -> HashCache:
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = HashCache(MODEL_HASH_CACHE)
+    return _hash_cache
+
 @mcp.tool()
-def model_info(name: str) -> dict:
-    """Récupère les informations détaillées d'un modèle"""
+def model_info(name: str, hash_mode: str = "sha256", wait: bool = False) -> dict:
+    """
+    Récupère les informations détaillées d'un modèle.
+    hash_mode: 'sha256' (empreinte complète, mise en cache), 'fast' (taille + début/fin
+    du fichier, immédiat) ou 'none'.
+    wait: si le sha256 n'est pas encore en cache, attend le calcul au lieu de
+    renvoyer sha256_status='pending' (rappeler plus tard pour le résultat).
+    """
     _require_root(MODELS_DIR, "models")
+    if hash_mode not in ("sha256", "fast", "none"):
+        return {"status": "error", "message": "hash_mode invalide (sha256|fast|none)"}
     
     rel = name.strip().lstrip("\\/")
     target = _safe_join(MODELS_DIR, rel)
@@ -778,22 +1160,121 @@ def model_info(name: str) -> dict:
         "path": str(target),
         "size_bytes": stat.st_size,
         "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-        "sha256": _sha256_of_file(target),
         "extension": target.suffix.lower()
     }
     
-    if target.suffix.lower() == ".safetensors":
+    if hash_mode == "sha256":
+        cache = _get_hash_cache()
+        if wait:
+            info["sha256"] = cache.compute(target)
+            info["sha256_status"] = "ready"
+        else:
+            result = cache.get(target)
+            info["sha256"] = result["sha256"]
+            info["sha256_status"] = result["status"]
+    elif hash_mode == "fast":
+        info["fingerprint"] = fast_fingerprint(target)
+    
+    if target.suffix.lower() in (".safetensors", ".sft"):
+        # Lecture directe de l'en-tête JSON : ni tenseurs chargés, ni torch
         try:
-            from safetensors import safe_open
-            md = {}
-            with safe_open(str(target), framework="pt") as f:
-                md = f.metadata() or {}
-            info["safetensors_metadata"] = md
+            summary = summarize_safetensors(read_safetensors_header(target), trim_metadata=False)
+            info["safetensors_metadata"] = summary.pop("metadata")
+            info.update(summary)
         except Exception as e:
             info["safetensors_metadata"] = {"warning": f"Non disponible ({e})"}
     
     return info
 
+_model_index = None
+
+@mcp.tool()
+def search_models(query: str = "", model_type: str = "", base_model: str = "",
+                  min_size_mb: float = 0, max_size_mb: float = 0,
+                  offset: int = 0, limit: int = 50, with_metadata: bool = False,
+                  refresh: bool = False) -> dict:
+    """
+    Recherche dans la bibliothèque de modèles (COMFYUI_ROOT/models).
+    Pour chaque fichier : type (dossier), taille, et pour les safetensors nombre de
+    tenseurs, dtypes, nombre de paramètres et architecture de base détectée.
+
+    Args:
+        query: filtre sur le chemin (ex: 'juggernaut')
+        model_type: 'checkpoints', 'loras', 'vae', ...
+        base_model: 'sdxl', 'flux', 'sd1', ...
+        min_size_mb, max_size_mb: bornes de taille en MB (0 = sans borne)
+        with_metadata: inclut les métadonnées safetensors (valeurs longues tronquées)
+        refresh: force la relecture du disque (sinon au plus toutes les 5 s)
+    """
+    global _model_index
+    _require_root(MODELS_DIR, "models")
+    if _model_index is None:
+        _model_index = ModelIndex(MODELS_DIR, sidecar=MODEL_HASH_CACHE.parent / "model_index.json")
+    if refresh:
+        _model_index.refresh(force=True)
+    result = _model_index.search(
+        query=query, model_type=model_type, base_model=base_model,
+        min_size_bytes=int(min_size_mb * 1024 * 1024), max_size_bytes=int(max_size_mb * 1024 * 1024),
+        offset=offset, limit=limit, with_metadata=with_metadata,
+    )
+    return {"status": "success", **result}
+
+# Profilage à la demande (ENABLE_PROFILING=true)
+def _profiling_disabled() -> dict:
+    return {"status": "disabled", "message": "Profilage désactivé (ENABLE_PROFILING=true pour l'activer)"}
+
+@mcp.tool()
+def profiling_configure(tools: str, sample_rate: float = 1.0, mode: str = "sampler",
+                        max_captures: int = 20, interval_ms: float = 5.0) -> dict:
+    """
+    Active le profilage des outils indiqués ; chaque appel capturé produit un fichier
+    lisible avec get_profile. S'arrête seul après max_captures captures.
+
+    Args:
+        tools: noms d'outils séparés par des virgules (vide = arrêt du profilage)
+        sample_rate: proportion des appels capturés (0 < x <= 1)
+        mode: "sampler" (piles échantillonnées, .collapsed pour flamegraph) ou
+              "cprofile" (.pstats ; les outils synchrones restent échantillonnés)
+        max_captures: nombre de captures avant arrêt automatique
+        interval_ms: période d'échantillonnage du mode sampler
+    """
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    names = [t for t in tools.split(",") if t.strip()]
+    if not names:
+        return {"status": "success", **profiler.disable()}
+    try:
+        return {"status": "success", **profiler.configure(names, sample_rate, mode, max_captures, interval_ms / 1000)}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+@mcp.tool()
+def profiling_status() -> dict:
+    """État du profilage et captures disponibles (de la plus récente à la plus ancienne)"""
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    return {"status": "success", **profiler.status(), "profiles": profiler.list_files()}
+
+@mcp.tool()
+def get_profile(name: str, top: int = 40, raw: bool = False) -> dict:
+    """
+    Lit une capture de profilage.
+
+    Args:
+        name: nom du fichier (voir profiling_status)
+        top: nombre de fonctions du résumé .pstats (tri par temps cumulé)
+        raw: renvoie aussi le fichier .pstats en base64 (à ouvrir avec pstats / snakeviz)
+    """
+    if not ENABLE_PROFILING:
+        return _profiling_disabled()
+    try:
+        result = profiler.read(name, top=top)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    if raw and result["format"] == "pstats":
+        result["content_base64"] = b64encode((profiler.directory / name).read_bytes()).decode("ascii")
+    return {"status": "success", **result}
+
 # =====================================================================
 # ROUTES HTTP personnalisées (@mcp.custom_route)
 # =====================================================================
@@ -801,21 +1282,64 @@ def model_info(name: str) -> dict:
 @mcp.custom_route("/health", methods=["GET"])
 async def health_check(request: Request) -> JSONResponse:
     """Health check endpoint"""
+    # Borné par HEALTH_CHECK_TIMEOUT ; un circuit ouvert répond sans appel à ComfyUI
     try:
-        status = client.get_queue_info()
-        comfyui_status = "connected" if status else "unknown"
+        await asyncio.wait_for(client.get_queue_info(), HEALTH_CHECK_TIMEOUT)
+        circuits = client.circuit_stats()
+        up = sum(1 for c in circuits.values() if c["state"] == "closed" and c["consecutive_failures"] == 0)
+        comfyui_status = "connected" if up == len(circuits) else ("degraded" if up else "disconnected")
+    except asyncio.TimeoutError:
+        comfyui_status = "timeout"
     except Exception:
         comfyui_status = "disconnected"
-    
+
     return JSONResponse({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "comfyui": comfyui_status,
+        "comfyui_circuit": client.circuit_stats(),
         "browser_control_enabled": ENABLE_BROWSER_CONTROL,
         "chrome_connections": len(manager.active_connections) if ENABLE_BROWSER_CONTROL else 0,
-        "api_key_enabled": bool(API_KEY)
+        "api_key_enabled": bool(API_KEYS),
+        "api_key_count": len(API_KEYS),
+        "comfyui_transport": client.transport_stats(),
+        "workflow_cache": client.workflow_cache.stats(),
+        "result_cache": client.result_cache.stats()
     })
 
+def _collect_runtime_metrics():
+    """Compteurs tenus par les composants (WebSocket, caches, disjoncteurs), lus au rendu"""
+    ws = manager.stats
+    yield ("ws_connections", "gauge", "Extensions Chrome connectées", [({}, len(manager.connections))])
+    yield ("ws_connections_total", "counter", "Connexions WebSocket acceptées", [({}, ws["connections"])])
+    yield ("ws_messages_received_total", "counter", "Messages WebSocket reçus", [({}, ws["received"])])
+    yield ("ws_commands_sent_total", "counter", "Commandes envoyées aux extensions", [({}, ws["sent"])])
+    yield ("ws_send_failures_total", "counter", "Envois WebSocket en échec", [({}, ws["send_failures"])])
+    yield ("ws_evictions_total", "counter", "Extensions déconnectées (file pleine ou envoi trop lent)", [({}, ws["evicted"])])
+    yield ("ws_reply_timeouts_total", "counter", "Réponses d'extension non reçues à temps", [({}, ws["reply_timeouts"])])
+
+    caches = {"workflow": client.workflow_cache.stats(), "result": client.result_cache.stats()}
+    if _node_autodoc is not None:
+        caches["autodoc"] = {"hits": _node_autodoc.stats["reused"], "misses": _node_autodoc.stats["parsed"]}
+    yield ("cache_hits_total", "counter", "Accès cache servis", [({"cache": n}, c["hits"]) for n, c in caches.items()])
+    yield ("cache_misses_total", "counter", "Accès cache manqués", [({"cache": n}, c["misses"]) for n, c in caches.items()])
+    yield ("cache_hit_ratio", "gauge", "Taux de succès des caches", [({"cache": n}, c.get("hit_rate")) for n, c in caches.items()])
+
+    backends = [b.client for b in client.backends] if isinstance(client, BackendPool) else [client]
+    yield ("upstream_reads_total", "counter", "Lectures GET partagées (upstream, coalesced, cached)",
+           [({"backend": b.base_url, "result": k}, v) for b in backends for k, v in b.read_stats.items()])
+    yield ("circuit_open", "gauge", "Disjoncteur ComfyUI ouvert (1) ou fermé / en essai (0)",
+           [({"backend": url}, int(c["state"] == "open")) for url, c in client.circuit_stats().items()])
+
+
+metrics.add_collector(_collect_runtime_metrics)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> Response:
+    """Métriques au format texte Prometheus (protégé par la clé API comme les autres routes)"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @mcp.custom_route("/debug/tools", methods=["GET"])
 async def debug_tools(request: Request):
     try:
@@ -867,14 +1391,23 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             data = await websocket.receive_text()
+            manager.stats["received"] += 1
+            try:
+                msg = json.loads(data) if data else None
+            except ValueError as e:
+                logger.error(f"Erreur traitement message: {e}")
+                continue
+            
+            # Réponse à une commande en attente : pas décomptée par le rate limiter
+            if isinstance(msg, dict) and msg.get("id") and manager.resolve(msg):
+                continue
             
             if not rate_limiter.is_allowed(client_id):
                 await websocket.send_json({"error": "Rate limit exceeded"})
                 continue
             
-            if data:
+            if isinstance(msg, dict):
                 try:
-                    msg = json.loads(data)
                     if msg.get("type") == "ping":
                         await websocket.send_json({
                             "type": "pong",
@@ -941,31 +1474,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# API Key middleware
-class APIKeyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Skip auth for health and WebSocket
-        if request.url.path in ["/health", "/ws"] or request.headers.get("upgrade") == "websocket":
-            return await call_next(request)
-        
-        # Si pas d'API key configurée, passer
-        if not API_KEY:
-            return await call_next(request)
-        
-        # Vérifier l'API key
-        api_key = request.headers.get("X-API-Key") or request.headers.get("x-api-key")
-        if api_key != API_KEY:
-            raise HTTPException(status_code=401, detail="Invalid or missing API Key")
-        
-        return await call_next(request)
-
-app.add_middleware(APIKeyMiddleware)
+# API Key middleware (ASGI pur : ne bufferise pas les réponses SSE)
+app.add_middleware(APIKeyMiddleware, keys=API_KEYS, rate_limiter=http_rate_limiter)
 
 # ---------------------------------------------------------------------
 # Cleanup
 # ---------------------------------------------------------------------
+# Le client ComfyUI (async) est fermé par _lifespan : atexit ne peut pas attendre aclose()
 def cleanup():
     logger.info("🛑 Arrêt du serveur MCP ComfyUI")
+    if _hash_cache is not None:
+        _hash_cache.shutdown()
+    if _node_autodoc is not None:
+        _node_autodoc.shutdown()
 
 atexit.register(cleanup)
 signal.signal(signal.SIGINT, lambda s, f: sys.exit(0))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules du serveur importables depuis les tests (dépôt sans paquet)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,252 @@
+"""
+Faux serveur ComfyUI pour les tests (starlette + uvicorn, dans la boucle du test).
+Routes imitées : POST /prompt, GET /queue, GET /history[/{id}], POST /interrupt,
+GET /object_info/{classe}, GET /system_stats et le WebSocket /ws (événements
+execution_start / executing / executed / execution_error / execution_interrupted
+envoyés au client_id du prompt).
+
+Les jobs s'exécutent un par un (comme ComfyUI) en job_seconds secondes ; un
+workflow contenant un node "RaiseError" finit en erreur.
+"""
+
+import json
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+
+def run_async(coro, timeout: float = 30.0):
+    """Exécute un scénario async de test (borné par timeout)"""
+    return asyncio.run(asyncio.wait_for(coro, timeout))
+
+
+class FakeComfyUI:
+    """
+    Args:
+        job_seconds: durée d'exécution de chaque job (s)
+        backlog: jobs factices ajoutés à queue_pending (charge simulée, jamais exécutés)
+    """
+
+    def __init__(self, job_seconds: float = 0.05, backlog: int = 0):
+        self.job_seconds = job_seconds
+        self.backlog = backlog
+        self.unavailable = False        # toutes les routes HTTP répondent 503
+        self.reject_prompts = False     # POST /prompt répond 400 (workflow invalide)
+        self.accept_websockets = True
+        self.history = {}
+        self.pending = []               # [(prompt_id, client_id, workflow)]
+        self.running = None
+        self.sockets = {}               # client_id -> WebSocket
+        self.hits = {}                  # route -> nombre d'appels
+        self.prompts = []               # prompt_id soumis, dans l'ordre
+        self.interrupts = []            # corps JSON reçus sur /interrupt
+        self.url = ""
+        self._interrupted = asyncio.Event()
+        self._server = None
+        self._tasks = []
+
+    # ------------------------------------------------------------------
+    # Cycle de vie
+    # ------------------------------------------------------------------
+    async def start(self) -> "FakeComfyUI":
+        app = Starlette(routes=[
+            Route("/prompt", self._prompt, methods=["POST"]),
+            Route("/queue", self._queue),
+            Route("/history", self._history_all),
+            Route("/history/{prompt_id}", self._history_one),
+            Route("/interrupt", self._interrupt, methods=["POST"]),
+            Route("/object_info/{node_class}", self._object_info),
+            Route("/system_stats", self._system_stats),
+            WebSocketRoute("/ws", self._ws),
+        ])
+        config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="off",
+                                access_log=False, timeout_graceful_shutdown=1)
+        self._server = uvicorn.Server(config)
+        self._tasks = [asyncio.get_running_loop().create_task(self._server.serve()),
+                       asyncio.get_running_loop().create_task(self._worker())]
+        while not self._server.started:
+            if self._tasks[0].done():
+                self._tasks[0].result()
+            await asyncio.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        await self.drop_websockets()
+        self._server.should_exit = True
+        self._tasks[1].cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def drop_websockets(self, refuse: bool = False):
+        """Ferme les WebSockets ouverts ; refuse=True rejette aussi les reconnexions"""
+        if refuse:
+            self.accept_websockets = False
+        for ws in list(self.sockets.values()):
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        self.sockets.clear()
+
+    # ------------------------------------------------------------------
+    # Exécution des jobs
+    # ------------------------------------------------------------------
+    async def _send(self, client_id, msg_type: str, data: dict):
+        ws = self.sockets.get(client_id)
+        if ws is not None:
+            try:
+                await ws.send_text(json.dumps({"type": msg_type, "data": data}))
+            except Exception:
+                self.sockets.pop(client_id, None)
+
+    async def _worker(self):
+        while True:
+            if not self.pending:
+                await asyncio.sleep(0.01)
+                continue
+            prompt_id, client_id, workflow = self.pending.pop(0)
+            self.running = prompt_id
+            self._interrupted.clear()
+            await self._send(client_id, "execution_start", {"prompt_id": prompt_id})
+            await self._send(client_id, "executing", {"node": "9", "prompt_id": prompt_id})
+            try:
+                await asyncio.wait_for(self._interrupted.wait(), self.job_seconds)
+                interrupted = True
+            except asyncio.TimeoutError:
+                interrupted = False
+            fails = any(isinstance(n, dict) and n.get("class_type") == "RaiseError" for n in workflow.values())
+            outputs = {}
+            if interrupted:
+                await self._send(client_id, "execution_interrupted", {"prompt_id": prompt_id, "node_id": "9"})
+            elif fails:
+                await self._send(client_id, "execution_error", {
+                    "prompt_id": prompt_id, "node_id": "9", "node_type": "RaiseError",
+                    "exception_message": "boom"})
+            else:
+                outputs = {"9": {"images": [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]}}
+                await self._send(client_id, "executed", {"node": "9", "output": outputs["9"], "prompt_id": prompt_id})
+            ok = not interrupted and not fails
+            self.history[prompt_id] = {
+                "prompt": [len(self.history), prompt_id, workflow, {"client_id": client_id}, ["9"]],
+                "outputs": outputs,
+                "status": {"status_str": "success" if ok else "error", "completed": ok, "messages": []},
+            }
+            self.running = None
+            if ok:
+                await self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    # ------------------------------------------------------------------
+    # Routes
+    # ------------------------------------------------------------------
+    def _hit(self, name: str):
+        self.hits[name] = self.hits.get(name, 0) + 1
+        if self.unavailable:
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        return None
+
+    async def _prompt(self, request):
+        refused = self._hit("prompt")
+        if refused:
+            return refused
+        body = await request.json()
+        if self.reject_prompts:
+            return JSONResponse({"error": {"type": "prompt_outputs_failed_validation"}, "node_errors": {}},
+                                status_code=400)
+        prompt_id = str(uuid.uuid4())
+        self.pending.append((prompt_id, body.get("client_id"), body["prompt"]))
+        self.prompts.append(prompt_id)
+        return JSONResponse({"prompt_id": prompt_id, "number": len(self.prompts), "node_errors": {}})
+
+    async def _queue(self, request):
+        refused = self._hit("queue")
+        if refused:
+            return refused
+        running = [[0, self.running, {}, {}, []]] if self.running else []
+        pending = [[i + 1, pid, {}, {}, []] for i, (pid, _, _) in enumerate(self.pending)]
+        pending += [[len(pending) + i + 1, f"backlog-{i}", {}, {}, []] for i in range(self.backlog)]
+        return JSONResponse({"queue_running": running, "queue_pending": pending})
+
+    async def _history_all(self, request):
+        refused = self._hit("history")
+        if refused:
+            return refused
+        max_items = int(request.query_params.get("max_items", len(self.history) or 1))
+        return JSONResponse(dict(list(self.history.items())[-max_items:]))
+
+    async def _history_one(self, request):
+        refused = self._hit("history_one")
+        if refused:
+            return refused
+        prompt_id = request.path_params["prompt_id"]
+        return JSONResponse({prompt_id: self.history[prompt_id]} if prompt_id in self.history else {})
+
+    async def _interrupt(self, request):
+        refused = self._hit("interrupt")
+        if refused:
+            return refused
+        raw = await request.body()
+        body = json.loads(raw) if raw else {}
+        self.interrupts.append(body)
+        target = body.get("prompt_id")
+        if self.running and (not target or target == self.running):
+            self._interrupted.set()
+        return JSONResponse({})
+
+    async def _object_info(self, request):
+        refused = self._hit("object_info")
+        if refused:
+            return refused
+        node_class = request.path_params["node_class"]
+        if node_class != "CheckpointLoaderSimple":
+            return JSONResponse({})
+        return JSONResponse({node_class: {"input": {"required": {"ckpt_name": [["model.safetensors"]]}}}})
+
+    async def _system_stats(self, request):
+        refused = self._hit("system_stats")
+        if refused:
+            return refused
+        return JSONResponse({"system": {"os": "fake"}, "devices": []})
+
+    async def _ws(self, websocket: WebSocket):
+        if not self.accept_websockets:
+            await websocket.close()
+            return
+        await websocket.accept()
+        client_id = websocket.query_params.get("clientId") or uuid.uuid4().hex
+        self.sockets[client_id] = websocket
+        await websocket.send_text(json.dumps({"type": "status", "data": {"sid": client_id}}))
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            if self.sockets.get(client_id) is websocket:
+                del self.sockets[client_id]
+
+
+@asynccontextmanager
+async def fake_comfyui(count: int = 1, **options):
+    """Démarre `count` faux serveurs ComfyUI (liste) et les arrête en sortie"""
+    fakes = [await FakeComfyUI(**options).start() for _ in range(count)]
+    try:
+        yield fakes
+    finally:
+        await asyncio.gather(*(fake.stop() for fake in fakes))
+
+
+async def wait_until(predicate, timeout: float = 5.0, interval: float = 0.02):
+    """Attend que predicate() soit vrai (AssertionError après timeout)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("condition non atteinte dans le délai")
+        await asyncio.sleep(interval)
@@ -0,0 +1,57 @@
+"""Middleware de clé API et limite de débit par clé"""
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from auth import APIKeyMiddleware
+
+
+class _Limiter:
+    """Limiteur minimal : max_requests par identifiant, sans fenêtre"""
+
+    def __init__(self, max_requests: int):
+        self.max_requests = max_requests
+        self.counts = {}
+
+    def is_allowed(self, client_id: str) -> bool:
+        self.counts[client_id] = self.counts.get(client_id, 0) + 1
+        return self.counts[client_id] <= self.max_requests
+
+    def retry_after(self, client_id: str) -> float:
+        return 30.0
+
+
+def _client(keys, limiter) -> TestClient:
+    async def ok(request):
+        return JSONResponse({"status": "success"})
+    app = Starlette(routes=[Route("/mcp", ok), Route("/health", ok)])
+    app.add_middleware(APIKeyMiddleware, keys=keys, rate_limiter=limiter)
+    return TestClient(app)
+
+
+def test_missing_or_wrong_key_is_rejected():
+    client = _client({"chatgpt": "k1"}, None)
+    assert client.get("/mcp").status_code == 401
+    assert client.get("/mcp", headers={"X-API-Key": "bad"}).status_code == 401
+    assert client.get("/mcp", headers={"X-API-Key": "k1"}).status_code == 200
+    assert client.get("/health").status_code == 200
+
+
+def test_rate_limit_is_counted_per_key():
+    limiter = _Limiter(2)
+    client = _client({"chatgpt": "k1", "script": "k2"}, limiter)
+    assert [client.get("/mcp", headers={"X-API-Key": "k1"}).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/mcp", headers={"X-API-Key": "k2"}).status_code == 200
+    limited = client.get("/mcp", headers={"X-API-Key": "k1"})
+    assert limited.headers["retry-after"] == "30"
+    assert set(limiter.counts) == {"key:chatgpt", "key:script"}
+
+
+def test_no_rate_limit_by_address_without_keys():
+    # Derrière cloudflared, tous les clients ont la même adresse : pas de quota partagé par IP
+    limiter = _Limiter(1)
+    client = _client({}, limiter)
+    assert [client.get("/mcp").status_code for _ in range(5)] == [200] * 5
+    assert limiter.counts == {}
@@ -0,0 +1,159 @@
+"""Répartition des prompts (BackendPool) entre deux faux ComfyUI"""
+
+import asyncio
+
+from backend_pool import BackendPool
+from comfyui_client import AsyncComfyUIClient
+from result_cache import workflow_key
+from fake_comfyui import fake_comfyui, run_async, wait_until
+
+SAVE_WORKFLOW = {"9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "test"}}}
+
+
+def make_pool(fakes, workflows_dir) -> BackendPool:
+    pool = BackendPool([fake.url for fake in fakes], workflows_dir)
+    pool.read_retries = 0
+    for backend in pool.backends:
+        backend.client.tracker.poll_interval = 0.1
+        backend.client.history_tracker.min_interval = 0.05
+    return pool
+
+
+def test_submissions_go_to_the_least_loaded_backend(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2) as (busy, idle):
+            busy.backlog = 5
+            pool = make_pool([busy, idle], tmp_path)
+            try:
+                for _ in range(3):
+                    result = await pool.queue_prompt(SAVE_WORKFLOW, use_cache=False)
+                    assert result["backend"] == idle.url
+                assert busy.prompts == []
+                assert len(idle.prompts) == 3
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_concurrent_submissions_are_spread(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2, job_seconds=30) as (first, second):
+            pool = make_pool([first, second], tmp_path)
+            try:
+                await asyncio.gather(*(pool.queue_prompt(SAVE_WORKFLOW, use_cache=False) for _ in range(4)))
+                assert len(first.prompts) == len(second.prompts) == 2
+                assert [b.assigned for b in pool.backends] == [2, 2]
+                assert [b.reserved for b in pool.backends] == [0, 0]
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_rejected_or_cached_submission_adds_no_load(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2) as (rejecting, accepting):
+            rejecting.reject_prompts = True
+            accepting.backlog = 5
+            pool = make_pool([rejecting, accepting], tmp_path)
+            try:
+                assert (await pool.queue_prompt(SAVE_WORKFLOW))["status"] == "error"
+                assert rejecting.hits["prompt"] == 1
+                assert [b.load() for b in pool.backends] == [0, 5]
+                rejecting.reject_prompts = False
+                prompt_id = (await pool.queue_prompt(SAVE_WORKFLOW))["prompt_id"]
+                await wait_until(lambda: pool.result_cache.peek(workflow_key(SAVE_WORKFLOW)) == prompt_id)
+                assert (await pool.queue_prompt(SAVE_WORKFLOW))["cached"] == "hit"
+                assert [b.load() for b in pool.backends] == [1, 5]
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_history_is_read_from_the_pinned_backend(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2) as (busy, idle):
+            busy.backlog = 5
+            pool = make_pool([busy, idle], tmp_path)
+            try:
+                prompt_id = (await pool.queue_prompt(SAVE_WORKFLOW, use_cache=False))["prompt_id"]
+                busy.backlog = 0
+                await pool.wait_for_completion(prompt_id, timeout=5)
+                # get_history peut avoir un cycle de suivi groupé de retard sur /ws
+                for _ in range(100):
+                    if prompt_id in await pool.get_history(prompt_id):
+                        break
+                    await asyncio.sleep(0.02)
+                else:
+                    raise AssertionError("historique non disponible")
+                assert "history_one" not in busy.hits
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_prompt_stays_pinned_to_its_backend(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2, job_seconds=30) as (busy, idle):
+            busy.backlog = 5
+            pool = make_pool([busy, idle], tmp_path)
+            try:
+                prompt_id = (await pool.queue_prompt(SAVE_WORKFLOW, use_cache=False))["prompt_id"]
+                busy.backlog = 0
+                await wait_until(lambda: idle.running == prompt_id)
+                assert (await pool.get_history(prompt_id)) == {}
+                result = await pool.interrupt(prompt_id)
+                assert result["status"] == "success" and result["backend"] == idle.url
+                assert idle.interrupts == [{"prompt_id": prompt_id}]
+                assert busy.interrupts == []
+                assert "history_one" not in busy.hits
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_open_breaker_fails_over_to_the_other_backend(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2) as (down, up):
+            down.unavailable = True
+            pool = make_pool([down, up], tmp_path)
+            pool.configure_circuit(1, 60)
+            try:
+                for _ in range(3):
+                    result = await pool.queue_prompt(SAVE_WORKFLOW, use_cache=False)
+                    assert result["backend"] == up.url
+                assert pool.circuit_stats()[down.url]["state"] == "open"
+                assert "prompt" not in down.hits
+                assert len(up.prompts) == 3
+            finally:
+                await pool.aclose()
+    run_async(scenario())
+
+
+def test_unpinned_prompt_is_found_in_queue_and_history(tmp_path):
+    async def scenario():
+        async with fake_comfyui(2, job_seconds=30) as (other, owner):
+            # Prompts soumis hors du pool (ex. avant un redémarrage du serveur MCP)
+            direct = AsyncComfyUIClient(owner.url, tmp_path)
+            pool = make_pool([other, owner], tmp_path)
+            try:
+                running = (await direct.queue_prompt(SAVE_WORKFLOW, use_cache=False))["prompt_id"]
+                queued = (await direct.queue_prompt(SAVE_WORKFLOW, use_cache=False))["prompt_id"]
+                await wait_until(lambda: owner.running == running)
+
+                result = await pool.interrupt(queued)
+                assert result["backend"] == owner.url
+                assert owner.interrupts == [{"prompt_id": queued}]
+                assert other.interrupts == []
+
+                owner.job_seconds = 0.05
+                owner._interrupted.set()
+                await wait_until(lambda: running in owner.history)
+                hits = owner.hits.get("history_one", 0)
+                history = await pool.get_history(running)
+                assert running in history
+                # Historique lu une seule fois sur le backend trouvé
+                assert owner.hits["history_one"] == hits + 1
+            finally:
+                await direct.aclose()
+                await pool.aclose()
+    run_async(scenario())
@@ -0,0 +1,151 @@
+"""Fin des prompts (AsyncComfyUIClient + CompletionTracker) contre un faux ComfyUI"""
+
+import json
+
+import pytest
+
+from comfyui_client import AsyncComfyUIClient
+from completion_tracker import ExecutionError
+from fake_comfyui import fake_comfyui, run_async, wait_until
+
+SAVE_WORKFLOW = {"9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "test"}}}
+ERROR_WORKFLOW = {"9": {"class_type": "RaiseError", "inputs": {}}}
+
+
+def make_client(fake, workflows_dir) -> AsyncComfyUIClient:
+    (workflows_dir / "save.json").write_text(json.dumps(SAVE_WORKFLOW), encoding="utf-8")
+    client = AsyncComfyUIClient(fake.url, workflows_dir)
+    client.read_retries = 0
+    client.tracker.poll_interval = 0.1
+    client.history_tracker.min_interval = 0.05
+    return client
+
+
+async def connected_client(fake, workflows_dir) -> AsyncComfyUIClient:
+    client = make_client(fake, workflows_dir)
+    client.tracker.start()
+    await wait_until(lambda: client.tracker.connected)
+    return client
+
+
+def test_generate_image_completes_on_websocket_event(tmp_path):
+    async def scenario():
+        async with fake_comfyui() as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                url = await client.generate_image("un chat", workflow_id="save")
+                assert f"filename={fake.prompts[0]}.png" in url
+                assert client.tracker.stats["completed_by_event"] == 1
+                assert client.tracker.stats["completed_by_poll"] == 0
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_execution_error_is_raised(tmp_path):
+    async def scenario():
+        async with fake_comfyui() as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                result = await client.queue_prompt(ERROR_WORKFLOW, use_cache=False)
+                with pytest.raises(ExecutionError, match="boom"):
+                    await client.wait_for_completion(result["prompt_id"], timeout=5)
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_interrupted_prompt_is_an_error(tmp_path):
+    async def scenario():
+        async with fake_comfyui(job_seconds=30) as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                result = await client.queue_prompt(SAVE_WORKFLOW, use_cache=False)
+                await wait_until(lambda: fake.running == result["prompt_id"])
+                assert (await client.interrupt(result["prompt_id"]))["status"] == "success"
+                with pytest.raises(ExecutionError, match="interrupted"):
+                    await client.wait_for_completion(result["prompt_id"], timeout=5)
+                assert fake.interrupts == [{"prompt_id": result["prompt_id"]}]
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_websocket_drop_falls_back_to_history_polling(tmp_path):
+    async def scenario():
+        async with fake_comfyui() as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                await fake.drop_websockets(refuse=True)
+                await wait_until(lambda: not client.tracker.connected)
+                result = await client.queue_prompt(SAVE_WORKFLOW, use_cache=False)
+                entry = await client.wait_for_completion(result["prompt_id"], timeout=5)
+                assert entry["outputs"]["9"]["images"][0]["filename"] == f"{result['prompt_id']}.png"
+                assert client.tracker.stats["completed_by_poll"] == 1
+                # Polling de secours groupé : /queue + /history?max_items, pas de /history/{id} par attente
+                assert fake.hits.get("queue", 0) >= 1
+                assert fake.hits.get("history", 0) >= 1
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_polling_fallback_reports_execution_error(tmp_path):
+    async def scenario():
+        async with fake_comfyui() as (fake,):
+            fake.accept_websockets = False
+            client = make_client(fake, tmp_path)
+            try:
+                result = await client.queue_prompt(ERROR_WORKFLOW, use_cache=False)
+                with pytest.raises(ExecutionError):
+                    await client.wait_for_completion(result["prompt_id"], timeout=5)
+                assert not client.tracker.connected
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_wait_times_out_while_job_still_runs(tmp_path):
+    async def scenario():
+        async with fake_comfyui(job_seconds=30) as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                result = await client.queue_prompt(SAVE_WORKFLOW, use_cache=False)
+                with pytest.raises(TimeoutError):
+                    await client.wait_for_completion(result["prompt_id"], timeout=0.3)
+                assert fake.running == result["prompt_id"]
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_generate_image_timeout_is_configurable(tmp_path):
+    async def scenario():
+        async with fake_comfyui(job_seconds=30) as (fake,):
+            client = await connected_client(fake, tmp_path)
+            try:
+                with pytest.raises(TimeoutError):
+                    await client.generate_image("un chat", workflow_id="save", use_cache=False, timeout=0.3)
+                client.generation_timeout = 0.3
+                with pytest.raises(TimeoutError):
+                    await client.generate_image("un chien", workflow_id="save", use_cache=False)
+                assert len(fake.prompts) == 2
+            finally:
+                await client.aclose()
+    run_async(scenario())
+
+
+def test_generate_batch_timeout_defaults_to_generation_timeout(tmp_path):
+    async def scenario():
+        async with fake_comfyui(job_seconds=30) as (fake,):
+            client = await connected_client(fake, tmp_path)
+            client.generation_timeout = 0.3
+            try:
+                jobs = [{"prompt": "un chat"}, {"prompt": "un chien"}]
+                results = [r async for r in client.generate_batch("save", jobs, use_cache=False)]
+                assert [r["status"] for r in results] == ["error", "error"]
+                assert all(r["elapsed"] < 5 for r in results)
+                assert len(fake.prompts) == 2
+            finally:
+                await client.aclose()
+    run_async(scenario())
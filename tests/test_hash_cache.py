@@ -0,0 +1,103 @@
+"""Cache persistant des sha256 (HashCache) : sidecar, validation, hachage en arrière-plan"""
+
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+from hash_cache import HashCache, fast_fingerprint, sha256_file
+
+
+@pytest.fixture
+def model(tmp_path):
+    path = tmp_path / "model.safetensors"
+    path.write_bytes(b"poids" * 1000)
+    return path
+
+
+def _cache(tmp_path) -> HashCache:
+    return HashCache(tmp_path / "cache" / "hashes.json", workers=1)
+
+
+def test_sha256_file_matches_hashlib(model):
+    assert sha256_file(model, block_size=7) == hashlib.sha256(model.read_bytes()).hexdigest()
+
+
+def test_unknown_file_is_pending_then_cached(tmp_path, model):
+    cache = _cache(tmp_path)
+    # Occupe l'unique thread du pool : le hachage reste en attente pendant les assertions
+    release = threading.Event()
+    cache._pool.submit(release.wait, 5)
+    try:
+        assert cache.get(model) == {"status": "pending", "sha256": None}
+        fut = cache.schedule(model)
+        assert cache.pending() == 1
+        release.set()
+        sha = fut.result(timeout=5)
+        assert sha == hashlib.sha256(model.read_bytes()).hexdigest()
+        assert cache.get(model) == {"status": "cached", "sha256": sha}
+        assert cache.stats == {"hits": 1, "misses": 1, "hashed": 1}
+        assert cache.pending() == 0
+    finally:
+        release.set()
+        cache.shutdown()
+
+
+def test_sidecar_is_reused_after_restart(tmp_path, model):
+    first = _cache(tmp_path)
+    try:
+        sha = first.compute(model, timeout=5)
+    finally:
+        first.shutdown()
+    assert str(model) in json.loads(first.sidecar.read_text(encoding="utf-8"))
+
+    second = _cache(tmp_path)
+    try:
+        assert second.lookup(model) == sha
+        assert second.stats == {"hits": 1, "misses": 0, "hashed": 0}
+    finally:
+        second.shutdown()
+
+
+def test_modified_file_misses_the_sidecar(tmp_path, model):
+    cache = _cache(tmp_path)
+    try:
+        old = cache.compute(model, timeout=5)
+        st = model.stat()
+        # Même taille, mtime différente : l'entrée n'est plus valide
+        model.write_bytes(b"POIDS" * 1000)
+        os.utime(model, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert cache.lookup(model) is None
+        new = cache.compute(model, timeout=5)
+        assert new != old
+        assert cache.stats["misses"] == 2
+    finally:
+        cache.shutdown()
+
+
+def test_unreadable_sidecar_starts_empty(tmp_path, model):
+    sidecar = tmp_path / "cache" / "hashes.json"
+    sidecar.parent.mkdir()
+    sidecar.write_text("{pas du json", encoding="utf-8")
+    cache = _cache(tmp_path)
+    try:
+        assert cache.lookup(model) is None
+        cache.compute(model, timeout=5)
+        # Le sidecar corrompu est remplacé par un JSON valide
+        assert str(model) in json.loads(sidecar.read_text(encoding="utf-8"))
+    finally:
+        cache.shutdown()
+
+
+def test_fast_fingerprint_reads_head_and_tail(tmp_path):
+    a = tmp_path / "a.bin"
+    b = tmp_path / "b.bin"
+    a.write_bytes(b"x" * 10 + b"milieu" + b"y" * 10)
+    b.write_bytes(b"x" * 10 + b"MILIEU" + b"y" * 10)
+    # Seul le milieu diffère : même empreinte rapide, sha256 différents
+    assert fast_fingerprint(a, block_size=8) == fast_fingerprint(b, block_size=8)
+    assert sha256_file(a) != sha256_file(b)
+    b.write_bytes(b"x" * 10 + b"milieu" + b"y" * 9 + b"z")
+    assert fast_fingerprint(a, block_size=8) != fast_fingerprint(b, block_size=8)
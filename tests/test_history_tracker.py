@@ -0,0 +1,62 @@
+"""Suivi groupé des prompts (HistoryTracker) quand ComfyUI ne répond plus"""
+
+import asyncio
+
+import pytest
+
+from fake_comfyui import run_async, wait_until
+from history_tracker import HistoryTracker
+
+
+def make_tracker(fetch_json) -> HistoryTracker:
+    return HistoryTracker(fetch_json, min_interval=0.01, max_interval=0.01)
+
+
+async def unavailable(path: str) -> dict:
+    raise ConnectionError("ComfyUI indisponible")
+
+
+def test_watched_prompts_without_waiters_are_dropped_after_a_failure():
+    async def scenario():
+        tracker = make_tracker(unavailable)
+        tracker.watch("orphelin")
+        await wait_until(lambda: tracker._task.done())
+        stats = tracker.get_stats()
+        assert stats["watched"] == 0
+        assert stats["errors"] == 1
+        assert tracker.snapshot("orphelin") is None
+    run_async(scenario())
+
+
+def test_waiters_get_the_error_then_polling_stops():
+    async def scenario():
+        tracker = make_tracker(unavailable)
+        tracker.watch("orphelin")
+        with pytest.raises(ConnectionError):
+            await tracker.check("attendu")
+        await wait_until(lambda: tracker._task.done())
+        stats = tracker.get_stats()
+        assert stats["watched"] == 0
+        # Un cycle en échec par appelant, pas de polling de /queue sans fin
+        assert stats["queue_requests"] == 2
+    run_async(scenario())
+
+
+def test_polling_resumes_for_a_new_waiter():
+    async def scenario():
+        calls = []
+
+        async def recovering(path: str) -> dict:
+            calls.append(path)
+            if len(calls) == 1:
+                raise ConnectionError("ComfyUI indisponible")
+            if path == "/queue":
+                return {"queue_running": [], "queue_pending": []}
+            return {"p": {"outputs": {}, "status": {"completed": True}}}
+
+        tracker = make_tracker(recovering)
+        with pytest.raises(ConnectionError):
+            await tracker.check("p")
+        assert await asyncio.wait_for(tracker.check("p"), 5) == {"p": {"outputs": {}, "status": {"completed": True}}}
+        await tracker.stop()
+    run_async(scenario())
@@ -0,0 +1,100 @@
+"""Rendu Prometheus des métriques (compteurs, histogrammes, collecteurs, middleware)"""
+
+from fastmcp import Client, FastMCP
+
+from fake_comfyui import run_async
+from metrics import MetricsRegistry, ToolMetricsMiddleware
+
+
+def _lines(registry: MetricsRegistry, name: str) -> list:
+    return [line for line in registry.render().splitlines()
+            if line.startswith(f"comfyui_mcp_{name}") and not line.startswith("#")]
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = MetricsRegistry()
+    hist = registry.histogram("latency_seconds", "Latence", ("route",), buckets=(1.0, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.5, 2.0):
+        hist.observe(value, "/a")
+    # Bornes triées ; une valeur égale à une borne compte dans cette borne (le = « ≤ »)
+    assert _lines(registry, "latency_seconds") == [
+        'comfyui_mcp_latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'comfyui_mcp_latency_seconds_bucket{route="/a",le="0.5"} 4',
+        'comfyui_mcp_latency_seconds_bucket{route="/a",le="1"} 4',
+        'comfyui_mcp_latency_seconds_bucket{route="/a",le="+Inf"} 5',
+        'comfyui_mcp_latency_seconds_sum{route="/a"} 2.95',
+        'comfyui_mcp_latency_seconds_count{route="/a"} 5',
+    ]
+
+
+def test_series_are_kept_per_label_set():
+    registry = MetricsRegistry()
+    registry.observe_upstream("b1", "GET", "/queue", 200, 0.02)
+    registry.observe_upstream("b1", "GET", "/queue", 200, 0.03)
+    registry.observe_upstream("b2", "POST", "/prompt", 500, 0.2)
+    assert _lines(registry, "upstream_requests_total") == [
+        'comfyui_mcp_upstream_requests_total{backend="b1",method="GET",endpoint="/queue",status="200"} 2',
+        'comfyui_mcp_upstream_requests_total{backend="b2",method="POST",endpoint="/prompt",status="500"} 1',
+    ]
+    counts = [line for line in _lines(registry, "upstream_request_duration_seconds") if "_count" in line]
+    assert counts == [
+        'comfyui_mcp_upstream_request_duration_seconds_count{backend="b1",method="GET",endpoint="/queue"} 2',
+        'comfyui_mcp_upstream_request_duration_seconds_count{backend="b2",method="POST",endpoint="/prompt"} 1',
+    ]
+
+
+def test_label_values_are_escaped_and_help_is_rendered():
+    registry = MetricsRegistry(prefix="test")
+    counter = registry.counter("events_total", "Événements", ("name",))
+    counter.inc('a"b\\c\nd', amount=2.5)
+    text = registry.render()
+    assert "# HELP test_events_total Événements\n# TYPE test_events_total counter\n" in text
+    assert 'test_events_total{name="a\\"b\\\\c\\nd"} 2.5' in text
+
+
+def test_collectors_skip_missing_values_and_failures():
+    registry = MetricsRegistry()
+
+    def cache_stats():
+        yield ("cache_entries", "gauge", "Entrées du cache", [({"cache": "objets"}, 3), ({"cache": "vide"}, None)])
+
+    def broken():
+        raise RuntimeError("indisponible")
+
+    registry.add_collector(broken)
+    registry.add_collector(cache_stats)
+    text = registry.render()
+    assert "# TYPE comfyui_mcp_cache_entries gauge" in text
+    assert _lines(registry, "cache_entries") == ['comfyui_mcp_cache_entries{cache="objets"} 3']
+
+
+def test_middleware_counts_calls_and_error_results():
+    registry = MetricsRegistry()
+    mcp = FastMCP("metrics-test")
+
+    @mcp.tool()
+    def ok() -> dict:
+        return {"status": "success"}
+
+    @mcp.tool()
+    def fails() -> dict:
+        return {"status": "error", "message": "non"}
+
+    mcp.add_middleware(ToolMetricsMiddleware(registry))
+
+    async def scenario():
+        async with Client(mcp) as client:
+            await client.call_tool("ok", {})
+            await client.call_tool("ok", {})
+            await client.call_tool("fails", {})
+
+    run_async(scenario())
+    assert _lines(registry, "tool_calls_total") == [
+        'comfyui_mcp_tool_calls_total{tool="ok"} 2',
+        'comfyui_mcp_tool_calls_total{tool="fails"} 1',
+    ]
+    assert _lines(registry, "tool_errors_total") == ['comfyui_mcp_tool_errors_total{tool="fails"} 1']
+    assert [line for line in _lines(registry, "tool_duration_seconds") if "_count" in line] == [
+        'comfyui_mcp_tool_duration_seconds_count{tool="ok"} 2',
+        'comfyui_mcp_tool_duration_seconds_count{tool="fails"} 1',
+    ]
@@ -0,0 +1,33 @@
+"""Index de la bibliothèque de modèles (models/)"""
+
+import json
+import struct
+
+import pytest
+
+from model_index import ModelIndex
+
+
+def _write_safetensors(path, header: dict):
+    raw = json.dumps(header).encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(struct.pack("<Q", len(raw)) + raw)
+
+
+def test_safetensors_header_is_indexed(tmp_path):
+    _write_safetensors(tmp_path / "loras" / "style.safetensors",
+                       {"__metadata__": {"ss_base_model_version": "sdxl_base_v1-0"}})
+    index = ModelIndex(tmp_path, min_refresh_interval=0)
+    result = index.search(model_type="loras")
+    assert [m["name"] for m in result["models"]] == ["loras/style.safetensors"]
+    assert "error" not in result["models"][0]
+
+
+def test_symlink_loop_is_walked_once(tmp_path):
+    _write_safetensors(tmp_path / "loras" / "style.safetensors", {})
+    try:
+        (tmp_path / "loras" / "boucle").symlink_to(tmp_path, target_is_directory=True)
+    except OSError:
+        pytest.skip("liens symboliques non disponibles")
+    index = ModelIndex(tmp_path, min_refresh_interval=0)
+    assert [m["name"] for m in index.search()["models"]] == ["loras/style.safetensors"]
@@ -0,0 +1,53 @@
+"""Documentation statique des custom nodes"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from node_autodoc import MAX_WORKERS, PARALLEL_THRESHOLD, NodeAutodoc
+
+NODE_SOURCE = '''
+class {name}:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {{"required": {{"image": ("IMAGE",)}}}}
+
+    RETURN_TYPES = ("IMAGE",)
+    CATEGORY = "tests"
+
+NODE_CLASS_MAPPINGS = {{"{name}": {name}}}
+'''
+
+
+def _make_pack(root, files: int):
+    pack = root / "pack"
+    pack.mkdir(parents=True)
+    for i in range(files):
+        (pack / f"nodes_{i}.py").write_text(NODE_SOURCE.format(name=f"Node{i}"), encoding="utf-8")
+
+
+def test_many_stale_files_are_parsed_in_a_bounded_thread_pool(tmp_path):
+    files = PARALLEL_THRESHOLD + 8
+    _make_pack(tmp_path, files)
+    autodoc = NodeAutodoc(tmp_path)
+    try:
+        data = autodoc.collect(details=True)
+        assert isinstance(autodoc._pool, ThreadPoolExecutor)
+        assert autodoc.max_workers <= MAX_WORKERS
+        items = {f["file"]: f for f in data[0]["files"]}
+        assert len(items) == files
+        assert items["nodes_3.py"]["nodes"]["Node3"]["RETURN_TYPES"] == ["IMAGE"]
+        assert autodoc.stats == {"parsed": files, "reused": 0}
+
+        autodoc.collect()
+        assert autodoc.stats == {"parsed": files, "reused": files}
+    finally:
+        autodoc.shutdown()
+
+
+def test_modified_file_is_parsed_again(tmp_path):
+    _make_pack(tmp_path, 2)
+    autodoc = NodeAutodoc(tmp_path)
+    autodoc.collect()
+    (tmp_path / "pack" / "nodes_0.py").write_text("class Broken(:\n", encoding="utf-8")
+    data = autodoc.collect()
+    assert data[0]["files"][0]["error"].startswith("SyntaxError")
+    assert autodoc.stats == {"parsed": 3, "reused": 1}
@@ -0,0 +1,52 @@
+"""Index incrémental du dossier output/"""
+
+import os
+
+from output_index import OutputIndex
+
+
+def _write(path, data: bytes, mtime: float):
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+
+
+def test_new_files_are_indexed_newest_first(tmp_path):
+    _write(tmp_path / "a.png", b"a", 1000)
+    (tmp_path / "batch").mkdir()
+    _write(tmp_path / "batch" / "b.png", b"bb", 2000)
+    index = OutputIndex(tmp_path, min_refresh_interval=0)
+    assert [(rel, name) for _, _, rel, name in index.newest(10)] == [("batch", "b.png"), ("", "a.png")]
+
+    _write(tmp_path / "c.png", b"ccc", 3000)
+    assert index.newest(1)[0][3] == "c.png"
+    assert index.count(exts={"png"}) == 3
+
+
+def test_file_overwritten_in_place_gets_new_size_and_mtime(tmp_path):
+    target = tmp_path / "ComfyUI_00001_.png"
+    _write(target, b"old", 1000)
+    _write(tmp_path / "other.png", b"x", 2000)
+    index = OutputIndex(tmp_path, min_refresh_interval=0)
+    assert index.newest(1)[0][3] == "other.png"
+
+    # Même nom, même inode : troncature puis réécriture, plus un nouveau fichier dans le dossier
+    inode = target.stat().st_ino
+    with open(target, "r+b") as f:
+        f.truncate(0)
+        f.write(b"rewritten")
+    os.utime(target, (3000, 3000))
+    assert target.stat().st_ino == inode
+    _write(tmp_path / "new.png", b"n", 2500)
+
+    mtime, size, _, name = index.newest(1)[0]
+    assert (name, size, mtime) == ("ComfyUI_00001_.png", len(b"rewritten"), 3000)
+
+
+def test_removed_folder_leaves_the_index(tmp_path):
+    (tmp_path / "gone").mkdir()
+    _write(tmp_path / "gone" / "x.png", b"x", 1000)
+    index = OutputIndex(tmp_path, min_refresh_interval=0)
+    assert index.count() == 1
+    os.remove(tmp_path / "gone" / "x.png")
+    os.rmdir(tmp_path / "gone")
+    assert index.count() == 0
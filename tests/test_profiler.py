@@ -0,0 +1,64 @@
+"""Profilage des outils MCP (ProfilingMiddleware + ToolProfiler)"""
+
+import time
+import threading
+
+from fastmcp import Client, FastMCP
+
+from fake_comfyui import run_async
+from profiler import ProfilingMiddleware, ToolProfiler
+
+
+def _spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _profiled_work():
+    _spin(0.3)
+
+
+def _background_noise(stop: threading.Event):
+    while not stop.is_set():
+        _spin(0.01)
+
+
+def make_server(profiler: ToolProfiler) -> FastMCP:
+    mcp = FastMCP("profiling-test")
+
+    @mcp.tool()
+    def slow_sync_tool() -> dict:
+        _profiled_work()
+        return {"status": "success"}
+
+    mcp.add_middleware(ProfilingMiddleware(profiler, mcp))
+    return mcp
+
+
+def test_sync_tool_samples_only_its_worker_thread(tmp_path):
+    profiler = ToolProfiler(tmp_path)
+    profiler.configure(["slow_sync_tool"], mode="sampler", max_captures=5, interval=0.002)
+    mcp = make_server(profiler)
+    stop = threading.Event()
+    noise = threading.Thread(target=_background_noise, args=(stop,), daemon=True)
+    noise.start()
+
+    async def scenario():
+        async with Client(mcp) as client:
+            await client.call_tool("slow_sync_tool", {})
+            # Appel suivant : la fonction n'est pas enveloppée une seconde fois
+            await client.call_tool("slow_sync_tool", {})
+
+    try:
+        run_async(scenario())
+    finally:
+        stop.set()
+        noise.join()
+    files = profiler.list_files()
+    assert len(files) == 2
+    content = profiler.read(files[0]["name"])["content"]
+    assert "_profiled_work" in content
+    assert "_background_noise" not in content
+    # Le thread n'est échantillonné que pendant l'exécution de l'outil
+    assert all("tracked (profiler.py" in line for line in content.splitlines())
@@ -0,0 +1,68 @@
+"""Fenêtre glissante approchée du RateLimiter : pondération, Retry-After, oubli des clients inactifs"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=0.0)
+    monkeypatch.setattr(server, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_current_window_is_capped(clock):
+    limiter = RateLimiter(max_requests=4, window_seconds=10)
+    assert [limiter.is_allowed("a") for _ in range(5)] == [True] * 4 + [False]
+    # Le compteur courant est plein : il faut attendre la fenêtre suivante
+    clock.value = 3.0
+    assert limiter.retry_after("a") == pytest.approx(7.0)
+    # Les autres clients ont leur propre quota
+    assert limiter.is_allowed("b")
+
+
+def test_previous_window_is_weighted_by_elapsed_time(clock):
+    limiter = RateLimiter(max_requests=4, window_seconds=10)
+    for _ in range(4):
+        limiter.is_allowed("a")
+    # 40 % de la fenêtre 1 écoulés : 4 * 0.6 = 2.4 requêtes comptent encore
+    clock.value = 14.0
+    assert [limiter.is_allowed("a") for _ in range(3)] == [True, True, False]
+    # 4 * (1 - x) + 2 < 4 dès que x > 0.5, soit 1 s plus tard
+    assert limiter.retry_after("a") == pytest.approx(1.0)
+    clock.value = 15.01
+    assert limiter.is_allowed("a")
+
+
+def test_skipped_window_forgets_the_previous_count(clock):
+    limiter = RateLimiter(max_requests=4, window_seconds=10)
+    for _ in range(4):
+        limiter.is_allowed("a")
+    clock.value = 25.0
+    assert [limiter.is_allowed("a") for _ in range(5)] == [True] * 4 + [False]
+
+
+def test_idle_clients_are_evicted_after_two_windows(clock):
+    limiter = RateLimiter(max_requests=4, window_seconds=10)
+    limiter.is_allowed("a")
+    clock.value = 12.0
+    limiter.is_allowed("b")
+    clock.value = 21.0
+    limiter.is_allowed("c")
+    # "a" (fenêtre 0) est oublié en fenêtre 2, "b" (fenêtre 1) reste nécessaire au calcul
+    assert list(limiter.requests) == ["b", "c"]
+    assert limiter.requests["b"] == [1, 0, 1]
+
+
+def test_retry_after_and_reset(clock):
+    limiter = RateLimiter(max_requests=1, window_seconds=10)
+    assert limiter.retry_after("inconnu") == 0.0
+    assert limiter.is_allowed("a")
+    assert not limiter.is_allowed("a")
+    limiter.reset("a")
+    assert "a" not in limiter.requests
+    assert limiter.is_allowed("a")
@@ -0,0 +1,107 @@
+"""Lecture par morceaux de read_exchange (offset/length, continuation, UTF-8, base64)"""
+
+import hashlib
+import os
+from base64 import b64encode
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def exchange(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "COMFYUI_ROOT", tmp_path)
+    return server._ensure_exchange_dir()
+
+
+def _read_all(name: str, **kwargs) -> list:
+    chunks = [server.read_exchange(name, **kwargs)]
+    while chunks[-1]["continuation"]:
+        assert chunks[-1]["status"] == "success"
+        chunks.append(server.read_exchange("", continuation=chunks[-1]["continuation"]))
+    return chunks
+
+
+def test_small_file_is_read_whole(exchange):
+    (exchange / "note.txt").write_text("bonjour", encoding="utf-8")
+    result = server.read_exchange("note.txt")
+    assert result["mode"] == "text"
+    assert result["content"] == "bonjour"
+
+
+def test_byte_range_and_continuation_cover_the_text(exchange):
+    (exchange / "note.txt").write_bytes(b"0123456789")
+    first = server.read_exchange("note.txt", offset=2, length=3)
+    assert first["mode"] == "text_chunk"
+    assert (first["offset"], first["length"], first["content"]) == (2, 3, "234")
+    assert first["eof"] is False
+
+    chunks = _read_all("note.txt", offset=2, length=3)
+    assert "".join(c["content"] for c in chunks) == "23456789"
+    assert [c["offset"] for c in chunks] == [2, 5, 8]
+    assert chunks[-1]["eof"] is True and chunks[-1]["continuation"] is None
+
+
+def test_offset_past_the_end_is_an_empty_last_chunk(exchange):
+    (exchange / "note.txt").write_bytes(b"abc")
+    result = server.read_exchange("note.txt", offset=10, length=4)
+    assert result["length"] == 0
+    assert result["content"] == ""
+    assert result["eof"] is True
+
+
+def test_text_chunks_never_split_a_utf8_character(exchange):
+    text = "é" * 7 + "fin"
+    (exchange / "accents.md").write_text(text, encoding="utf-8")
+    # 5 octets : couperait le troisième « é » (2 octets) en deux
+    chunks = _read_all("accents.md", length=5)
+    assert all("�" not in c["content"] for c in chunks)
+    assert [c["length"] for c in chunks][:3] == [4, 4, 4]
+    assert "".join(c["content"] for c in chunks) == text
+
+
+def test_binary_chunks_are_rounded_to_concatenable_base64(exchange):
+    raw = os.urandom(100)
+    (exchange / "image.png").write_bytes(raw)
+    chunks = _read_all("image.png", length=10)
+    # 10 -> 9 octets : chaque morceau base64 est complet (pas de '=' intermédiaire)
+    assert all(c["length"] == 9 for c in chunks[:-1])
+    assert all(c["mime"] == "image/png" for c in chunks)
+    assert "".join(c["base64"] for c in chunks) == b64encode(raw).decode("ascii")
+
+
+def test_large_file_is_chunked_automatically(exchange, monkeypatch):
+    monkeypatch.setattr(server, "MAX_READ_CHUNK", 6)
+    (exchange / "big.txt").write_bytes(b"x" * 20)
+    chunks = _read_all("big.txt")
+    assert chunks[0]["mode"] == "text_chunk"
+    assert [c["length"] for c in chunks] == [6, 6, 6, 2]
+    # Une longueur demandée ne dépasse jamais le plafond
+    assert server.read_exchange("big.txt", length=100)["length"] == 6
+
+
+def test_continuation_is_rejected_once_the_file_changed(exchange):
+    path = exchange / "note.txt"
+    path.write_bytes(b"0123456789")
+    first = server.read_exchange("note.txt", length=4)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    result = server.read_exchange("", continuation=first["continuation"])
+    assert result["status"] == "error"
+    assert "changé" in result["message"]
+
+
+def test_invalid_continuation_is_an_error(exchange):
+    result = server.read_exchange("", continuation="pas-un-jeton")
+    assert result == {"status": "error", "message": "continuation invalide"}
+
+
+def test_metadata_only_returns_the_digest_without_content(exchange):
+    raw = b"contenu" * 1000
+    (exchange / "data.json").write_bytes(raw)
+    result = server.read_exchange("data.json", metadata_only=True)
+    assert result["mode"] == "metadata"
+    assert result["size_bytes"] == len(raw)
+    assert result["sha256"] == hashlib.sha256(raw).hexdigest()
+    assert "content" not in result
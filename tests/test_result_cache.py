@@ -0,0 +1,84 @@
+"""Clé canonique des workflows (workflow_key) et cache LRU/TTL des résultats"""
+
+import copy
+from types import SimpleNamespace
+
+import result_cache
+from result_cache import ResultCache, workflow_key
+
+WORKFLOW = {
+    "3": {"class_type": "KSampler",
+          "inputs": {"seed": 42, "cfg": 7.0, "steps": 20, "model": ["4", 0], "denoise": 1.0}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "sd15.safetensors"}},
+}
+
+
+def test_key_ignores_order_and_display_metadata():
+    reordered = {
+        "4": {"inputs": {"ckpt_name": "sd15.safetensors"}, "class_type": "CheckpointLoaderSimple"},
+        "3": {"class_type": "KSampler", "_meta": {"title": "Échantillonneur"},
+              "inputs": {"denoise": 1.0, "model": ["4", 0], "steps": 20, "cfg": 7.0, "seed": 42}},
+    }
+    assert workflow_key(reordered) == workflow_key(WORKFLOW)
+
+
+def test_integral_floats_match_integers():
+    variant = copy.deepcopy(WORKFLOW)
+    variant["3"]["inputs"].update(cfg=7, steps=20.0, denoise=1)
+    variant["3"]["inputs"]["model"] = ("4", 0.0)
+    assert workflow_key(variant) == workflow_key(WORKFLOW)
+
+
+def test_meaningful_changes_change_the_key():
+    base = workflow_key(WORKFLOW)
+    for mutate in (
+        lambda w: w["3"]["inputs"].update(seed=43),
+        lambda w: w["3"]["inputs"].update(cfg=7.5),
+        lambda w: w["3"]["inputs"].update(model=["4", 1]),
+        lambda w: w["4"].update(class_type="UNETLoader"),
+        lambda w: w.update({"5": {"class_type": "SaveImage", "inputs": {}}}),
+    ):
+        variant = copy.deepcopy(WORKFLOW)
+        mutate(variant)
+        assert workflow_key(variant) != base
+
+
+def test_non_node_entries_and_missing_inputs():
+    with_extra = dict(copy.deepcopy(WORKFLOW), extra="pas un node")
+    assert workflow_key(with_extra) == workflow_key(WORKFLOW)
+    assert workflow_key({"1": {"class_type": "X"}}) == workflow_key({"1": {"class_type": "X", "inputs": None}})
+
+
+def test_lru_eviction_and_stats():
+    cache = ResultCache(max_entries=2, max_age=0)
+    cache.put("a", "p1", {"9": {"images": []}})
+    cache.put("b", "p2", {"9": {"images": []}})
+    assert cache.get("a")["prompt_id"] == "p1"
+    cache.put("c", "p3", {"9": {"images": []}})
+    # "b" est le moins récemment utilisé
+    assert cache.get("b") is None
+    assert cache.peek("a") == "p1" and cache.peek("c") == "p3"
+    assert cache.stats() == {
+        "entries": 2, "max_entries": 2, "max_age_s": 0, "in_flight": 0,
+        "hits": 1, "misses": 1, "evictions": 1, "hit_rate": 0.5,
+    }
+
+
+def test_empty_outputs_and_expired_entries_are_not_served(monkeypatch):
+    cache = ResultCache(max_entries=4, max_age=60)
+    cache.put("vide", "p0", {})
+    assert cache.peek("vide") is None
+    cache.put("a", "p1", {"9": {"images": []}})
+    expired = cache._entries["a"]["created"] + 61
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=lambda: expired))
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_in_flight_is_released_only_by_its_prompt():
+    cache = ResultCache()
+    cache.begin("k", "p1")
+    cache.end("k", "autre")
+    assert cache.in_flight("k") == "p1"
+    cache.end("k", "p1")
+    assert cache.in_flight("k") is None
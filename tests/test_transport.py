@@ -0,0 +1,21 @@
+"""Réutilisation des connexions HTTP du client async (transport_stats)"""
+
+from comfyui_client import AsyncComfyUIClient
+from fake_comfyui import fake_comfyui, run_async
+
+
+def test_keep_alive_connection_is_reused(tmp_path):
+    async def scenario():
+        async with fake_comfyui() as (fake,):
+            client = AsyncComfyUIClient(fake.url, tmp_path)
+            client.read_ttl = 0
+            try:
+                for _ in range(3):
+                    assert (await client.get_system_stats())["system"]["os"] == "fake"
+                stats = client.transport_stats()
+                assert stats["requests"] == 3
+                assert stats["connections_opened"] == 1
+                assert stats["connections_reused"] == 2
+            finally:
+                await client.aclose()
+    run_async(scenario())
@@ -0,0 +1,71 @@
+"""Cache des workflows compilés (load_workflow), invalidé par mtime et taille"""
+
+import json
+import os
+
+from comfyui_client import AsyncComfyUIClient, WorkflowCache
+
+API_WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20, "model": ["4", 0]}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}},
+}
+
+
+def _write(path, workflow: dict, mtime: float):
+    path.write_text(json.dumps(workflow), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def make_client(workflows_dir) -> AsyncComfyUIClient:
+    # Aucune requête HTTP n'est faite : load_workflow ne lit que le disque
+    return AsyncComfyUIClient("http://127.0.0.1:1", workflows_dir)
+
+
+def test_unchanged_file_is_served_from_cache(tmp_path):
+    _write(tmp_path / "wf.json", API_WORKFLOW, 1000)
+    client = make_client(tmp_path)
+    assert client.load_workflow("wf") == API_WORKFLOW
+    assert client.load_workflow("wf") == API_WORKFLOW
+    assert (client.workflow_cache.hits, client.workflow_cache.misses) == (1, 1)
+
+
+def test_changed_mtime_or_size_reloads_the_file(tmp_path):
+    path = tmp_path / "wf.json"
+    _write(path, API_WORKFLOW, 1000)
+    client = make_client(tmp_path)
+    client.load_workflow("wf")
+
+    # Même taille, mtime différent
+    edited = json.loads(json.dumps(API_WORKFLOW))
+    edited["3"]["inputs"]["seed"] = 2
+    _write(path, edited, 2000)
+    assert client.load_workflow("wf")["3"]["inputs"]["seed"] == 2
+
+    # Même mtime, taille différente
+    edited["3"]["inputs"]["seed"] = 123456
+    _write(path, edited, 2000)
+    assert client.load_workflow("wf")["3"]["inputs"]["seed"] == 123456
+    assert client.workflow_cache.misses == 3
+
+
+def test_each_call_gets_a_private_copy(tmp_path):
+    _write(tmp_path / "wf.json", API_WORKFLOW, 1000)
+    client = make_client(tmp_path)
+    first = client.load_workflow("wf")
+    first["3"]["inputs"]["seed"] = 99
+    first["3"]["class_type"] = "Modifié"
+    first["5"] = {"class_type": "Ajouté", "inputs": {}}
+    second = client.load_workflow("wf")
+    assert second == API_WORKFLOW
+    assert client.workflow_cache.hits == 1
+
+
+def test_lru_evicts_the_oldest_entry():
+    cache = WorkflowCache(max_entries=2)
+    cache.put("a", 1, 1, {}, {})
+    cache.put("b", 1, 1, {}, {})
+    assert cache.get("a", 1, 1) is not None
+    cache.put("c", 1, 1, {}, {})
+    assert cache.get("b", 1, 1) is None
+    assert cache.get("a", 1, 1) is not None
+    assert cache.stats()["evictions"] == 1